@@ -4,10 +4,10 @@ CLI tool to run AWS Access Review locally.
 This module provides a convenient way to test the Lambda function without deploying to AWS.
 """
 
+import argparse
+import json
 import os
 import sys
-import json
-import argparse
 
 # Add the Lambda directory to the path so we can import the functions
 sys.path.insert(
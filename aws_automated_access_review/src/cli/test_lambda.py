@@ -4,13 +4,14 @@ Test script to invoke the AWS Access Review Lambda function locally.
 This script simulates the Lambda environment and invokes the handler function.
 """
 
+import argparse
+import json
 import os
 import sys
-import json
-import argparse
-import boto3
 from datetime import datetime
 
+import boto3
+
 
 def main():
     """
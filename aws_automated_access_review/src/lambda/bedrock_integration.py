@@ -6,26 +6,177 @@ security narratives based on technical findings. It transforms raw security data
 actionable insights and recommendations for both technical and business stakeholders.
 
 Key Features:
-- Connects to Amazon Bedrock's Claude model for natural language generation
+- Connects to Amazon Bedrock's Claude models for natural language generation, through
+  the Converse (Messages) API or the legacy text completions API
+- Picks a fast model for routine runs and a larger one for runs with critical findings,
+  and records the latency and token counts of every call
 - Formats security findings into structured prompts for optimal AI analysis
 - Generates executive summaries, critical findings analysis, and recommendations
 - Provides fallback capabilities for resilience when AI service is unavailable
+- Streams the final report and stops cleanly before the Lambda deadline
+- Reuses the stored narrative from an earlier run when the findings are unchanged
+- Scales to large finding sets with a map-reduce pipeline: findings are split into
+  token-budgeted chunks summarized by concurrent model calls, and a final call
+  combines the partial summaries into one report
 
 The module follows a modular design pattern for maximum flexibility:
 1. prepare_prompt(): Structures data for optimal AI processing
 2. invoke_claude_model(): Handles API communication with Bedrock
 3. extract_narrative_claude(): Processes the AI response
 4. generate_fallback_narrative(): Ensures reliability when AI fails
+5. generate_map_reduce_narrative(): Covers every finding when they do not fit one prompt
 
 Author: Security Engineering Team
 Last Updated: 2025-04-01
 """
 
+import datetime  # For timestamping cached narratives
+import hashlib  # For the narrative cache key
 import json  # For parsing and formatting API requests/responses
+import os  # For reading tuning settings from environment variables
+import threading  # For sharing the token budget between worker threads
+import time  # For the token budget and the overall deadline
+from collections import namedtuple  # For model descriptions
+from concurrent.futures import ThreadPoolExecutor, wait  # For concurrent map calls
+
 import boto3  # AWS SDK for Python to interact with Amazon Bedrock
+from botocore.exceptions import ClientError  # For telling cache misses from errors
+
+from modules.findings_aggregation import (  # Shared single-pass finding statistics
+    aggregate_findings,
+    format_finding,
+)
+from utils.logging_setup import configure_logger  # Queued JSON logging
+
+logger = configure_logger(__name__)
+
+# ----- Model settings -----
+# A model and the Bedrock API used to call it ("converse" or "text-completion")
+ModelSpec = namedtuple("ModelSpec", ["model_id", "api"])
+
+# Legacy text completions model, used when invoke_claude_model is called without a model
+MODEL_ID = "anthropic.claude-v2"  # Amazon Bedrock model identifier
+LEGACY_MODEL = ModelSpec(MODEL_ID, "text-completion")
+# Per-run models, called through the Converse API: a fast, small model for routine
+# runs and partial summaries, and a larger model when the run has severe findings
+FAST_MODEL = ModelSpec(
+    os.environ.get("NARRATIVE_FAST_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0"),
+    "converse",
+)
+LARGE_MODEL = ModelSpec(
+    os.environ.get(
+        "NARRATIVE_LARGE_MODEL_ID", "anthropic.claude-3-5-sonnet-20240620-v1:0"
+    ),
+    "converse",
+)
+# Severities that send a run to the large model
+LARGE_MODEL_SEVERITIES = {
+    s.strip()
+    for s in os.environ.get("NARRATIVE_LARGE_MODEL_SEVERITIES", "Critical").split(",")
+    if s.strip()
+}
+TEMPERATURE = 0.7  # Balances creativity and consistency
+TOP_P = 0.9  # Controls diversity of word selection
+# Bump when the prompt wording changes so cached narratives are not reused
+PROMPT_VERSION = 1
+
+# ----- Narrative cache settings -----
+# "exact" reuses a narrative for identical findings, "near" also for identical
+# severity counts, "off" disables the cache
+CACHE_MODE = os.environ.get("NARRATIVE_CACHE", "exact").lower()
+CACHE_PREFIX = "narrative-cache/"
+
+# ----- Streaming settings -----
+# Stream the report with invoke_model_with_response_stream when a deadline is known
+STREAMING = os.environ.get("NARRATIVE_STREAMING", "true").lower() == "true"
+# Seconds of Lambda time kept back for uploading and emailing after the narrative
+DEADLINE_RESERVE_SECONDS = float(
+    os.environ.get("NARRATIVE_DEADLINE_RESERVE_SECONDS", "30")
+)
+# Appended to a narrative cut short by the deadline
+TRUNCATION_NOTE = (
+    "\n\n_[Narrative truncated: generation stopped at the Lambda time limit. "
+    "See the attached CSV report for every finding.]_"
+)
+
+# ----- Map-reduce narrative settings -----
+# Approximate size of each chunk of findings sent to one map call, in tokens
+CHUNK_TOKENS = int(os.environ.get("NARRATIVE_CHUNK_TOKENS", "6000"))
+# Maximum number of invoke_model calls in flight at once
+MAX_CONCURRENCY = int(os.environ.get("NARRATIVE_MAX_CONCURRENCY", "4"))
+# Input plus output tokens allowed per minute across all calls (0 disables the limit)
+TOKENS_PER_MINUTE = int(os.environ.get("NARRATIVE_TOKENS_PER_MINUTE", "0"))
+# Wall-clock budget for the whole narrative, well inside the 300s Lambda timeout
+TIME_BUDGET_SECONDS = float(os.environ.get("NARRATIVE_TIME_BUDGET_SECONDS", "180"))
+# Part of the budget held back for the final reduce call
+REDUCE_RESERVE_SECONDS = float(os.environ.get("NARRATIVE_REDUCE_RESERVE_SECONDS", "60"))
+# Output tokens requested for each partial summary
+MAP_MAX_TOKENS = 1024
+# Output tokens requested for the final report (matches invoke_claude_model)
+REDUCE_MAX_TOKENS = 4096
+
+
+def deadline_from_context(context, reserve_seconds=None):
+    """
+    Turn a Lambda context into a time.monotonic() deadline for narrative generation.
+
+    The deadline leaves ``reserve_seconds`` (NARRATIVE_DEADLINE_RESERVE_SECONDS by
+    default) for the work that follows the narrative. Returns None without a context.
+    """
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return None
+    if reserve_seconds is None:
+        reserve_seconds = DEADLINE_RESERVE_SECONDS
+    remaining = context.get_remaining_time_in_millis() / 1000.0
+    return time.monotonic() + remaining - reserve_seconds
+
 
+def select_model(findings, severity_counts=None):
+    """
+    Pick the model for this run: the large model if any finding has a severity in
+    NARRATIVE_LARGE_MODEL_SEVERITIES (Critical by default), otherwise the fast model.
 
-def get_ai_analysis(bedrock_client, findings):
+    With ``severity_counts`` (from aggregate_findings) the findings are not read.
+    """
+    if severity_counts is not None:
+        severe = any(severity_counts.get(s) for s in LARGE_MODEL_SEVERITIES)
+    else:
+        severe = any(f.get("severity") in LARGE_MODEL_SEVERITIES for f in findings)
+    return LARGE_MODEL if severe else FAST_MODEL
+
+
+# Latency and token counts of every model call since the last reset
+_call_metrics = []
+_call_metrics_lock = threading.Lock()
+
+
+def _record_call(model, operation, started, input_tokens, output_tokens):
+    """Record and log the latency and token counts of one model call."""
+    entry = {
+        "model": model.model_id,
+        "operation": operation,
+        "latency_ms": int((time.monotonic() - started) * 1000),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+    }
+    with _call_metrics_lock:
+        _call_metrics.append(entry)
+    logger.info("Bedrock call metrics: %s", json.dumps(entry))
+
+
+def get_call_metrics():
+    """Return the metrics recorded for each model call since the last reset."""
+    with _call_metrics_lock:
+        return list(_call_metrics)
+
+
+def reset_call_metrics():
+    """Forget recorded call metrics (called at the start of each analysis)."""
+    with _call_metrics_lock:
+        del _call_metrics[:]
+
+
+def get_ai_analysis(bedrock_client, findings, cache=None, deadline=None, summary=None):
     """
     Main entry point for getting AI analysis of security findings.
     This function is called by the Lambda handler to generate a narrative summary.
@@ -41,41 +192,95 @@ def get_ai_analysis(bedrock_client, findings):
         findings (list): List of security findings in standardized format
                         Each finding should be a dictionary with fields like
                         severity, category, description, resource_type, etc.
+        cache (NarrativeCache): Optional cache of narratives from earlier runs
+        deadline (float): Optional time.monotonic() value by which the narrative
+                          must be finished (see deadline_from_context)
+        summary (FindingsSummary): aggregate_findings(findings, keep_lines=True)
+                                   if the caller already has it; the findings
+                                   are then not read again
 
     Returns:
         str: AI-generated narrative summary ready for inclusion in email reports
              If AI generation fails, returns a basic fallback narrative
     """
+    reset_call_metrics()
     try:
+        # One pass over the findings (a generator is fine) collects the counts
+        # and prompt lines everything below works from
+        if summary is None or summary.lines is None:
+            summary = aggregate_findings(findings, top_k=0, keep_lines=True)
+
+        # Unchanged findings since an earlier run: reuse its narrative
+        if cache:
+            cached = cache.get(summary)
+            if cached:
+                return cached
+
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError("no time left before the Lambda deadline")
+
+        # Routine runs use the fast model; severe findings get the large one
+        model = select_model(findings, summary.severity_counts)
+        logger.info("Selected model %s for %s findings", model.model_id, summary.total)
+
+        # Large finding sets do not fit one prompt: summarize them in chunks instead.
+        # Lines are only sorted into chunks when map-reduce is needed
+        if prompt_tokens(summary.lines) > CHUNK_TOKENS:
+            chunks = chunk_lines(summary.lines)
+            logger.info(
+                "%s findings span %s chunks - using map-reduce",
+                summary.total,
+                len(chunks),
+            )
+            narrative, complete = generate_map_reduce_narrative(
+                bedrock_client,
+                findings,
+                chunks,
+                deadline=deadline,
+                model=model,
+                summary=summary,
+            )
+            # Chunks described locally after a throttle or error are only
+            # good for this run; a later run may get them analyzed
+            if cache and complete and TRUNCATION_NOTE not in narrative:
+                cache.put(summary, narrative)
+            return narrative
+
         # Step 1: Prepare the prompt for Claude model
         # This formats our findings into a structure that helps the AI understand the data
-        print("Preparing AI prompt from security findings...")
-        prompt = prepare_prompt(findings)
+        # Everything fits in one prompt, so no findings need to be left out
+        logger.info("Preparing AI prompt from security findings...")
+        prompt = _findings_prompt(summary, _lines_by_category(summary))
 
         # Step 2: Call Bedrock with the Claude model
         # This sends our formatted data to Amazon Bedrock and gets a response
-        print("Invoking Amazon Bedrock Claude model...")
-        response = invoke_claude_model(bedrock_client, prompt)
+        logger.info("Invoking Amazon Bedrock Claude model...")
+        response = invoke_claude_model(
+            bedrock_client, prompt, deadline=deadline, model=model
+        )
 
         # Step 3: Extract and return the generated narrative
         # This processes the raw API response and extracts the useful content
-        print("Processing AI response...")
+        logger.info("Processing AI response...")
         narrative = extract_narrative_claude(response)
-        print("AI narrative generation successful")
+        logger.info("AI narrative generation successful")
+        # A truncated narrative is only good for this run
+        if cache and TRUNCATION_NOTE not in narrative:
+            cache.put(summary, narrative)
         return narrative
 
     except Exception as e:
         # Error handling - if anything goes wrong, log it and use fallback content
-        print(f"Error generating narrative with Bedrock: {str(e)}")
+        logger.error("Error generating narrative with Bedrock: %s", e)
 
         # Include a stack trace for better debugging
         import traceback
 
-        print(f"Error stack trace: {traceback.format_exc()}")
+        logger.error("Error stack trace: %s", traceback.format_exc())
 
         # Return a fallback narrative if Bedrock fails
         # This ensures the user still gets a useful report even if AI fails
-        print("Using fallback narrative due to error")
+        logger.info("Using fallback narrative due to error")
         return generate_fallback_narrative()
 
 
@@ -110,7 +315,7 @@ def generate_narrative(findings):
     return get_ai_analysis(bedrock, findings)
 
 
-def prepare_prompt(findings):
+def prepare_prompt(findings, max_per_category=5, summary=None):
     """
     Prepare a prompt for the Claude model based on the security findings.
 
@@ -125,102 +330,180 @@ def prepare_prompt(findings):
         findings (list): List of security findings from various AWS services
                         Each finding should be a dictionary with fields like
                         severity, category, description, resource_type, etc.
+        max_per_category (int): Findings listed per category; None lists them all
+        summary (FindingsSummary): Result of aggregate_findings(findings,
+                                   top_k=max_per_category), if already computed
 
     Returns:
         str: Formatted prompt for the Claude model, optimized for security analysis
     """
-    # Step 1: Count findings by severity for statistical summary
-    # Initialize counters for each severity level
-    severity_counts = {
-        "Critical": 0,  # Immediate action required
-        "High": 0,  # High priority issues
-        "Medium": 0,  # Important but less urgent
-        "Low": 0,  # Minor issues
-        "Informational": 0,  # Awareness only
+    # Step 1: Count findings and pick the most severe ones per category
+    # A single pass with bounded heaps: O(n log k), and works on a generator
+    if summary is None:
+        summary = aggregate_findings(findings, top_k=max_per_category)
+
+    # Step 2: List the most severe findings of each category
+    listed = {
+        category: [format_finding(f) for f in summary.top_findings(category)]
+        for category in summary.category_counts
     }
 
-    # Count findings for each severity level
-    for finding in findings:
-        if finding.get("severity") in severity_counts:
-            severity_counts[finding.get("severity")] += 1
+    return _findings_prompt(summary, listed)
 
-    # Step 2: Group findings by category for better organization
-    # e.g., IAM findings, S3 findings, etc.
-    findings_by_category = {}
-    for finding in findings:
-        # Use "Other" as default category if not specified
-        category = finding.get("category", "Other")
 
-        # Initialize category list if this is first finding of this type
-        if category not in findings_by_category:
-            findings_by_category[category] = []
+def _findings_prompt(summary, listed):
+    """
+    Build the single-call prompt from the counts and the findings to list.
 
-        # Add this finding to its category group
-        findings_by_category[category].append(finding)
+    Args:
+        summary (FindingsSummary): Counts for the statistical header
+        listed (dict): Formatted finding lines to show per category, most
+                       severe first
 
-    # Step 3: Create a formatted summary of findings for the prompt
-    # We'll organize them by category, with the most severe findings first
+    Returns:
+        str: Formatted prompt for the Claude model
+    """
+    # Create a formatted summary of findings for the prompt
+    # Organized by category, with the most severe findings first
     findings_summary = []
-
-    # Process each category of findings
-    for category, category_findings in findings_by_category.items():
+    for category, count in summary.category_counts.items():
         # Add category header
         findings_summary.append(f"\nCategory: {category}")
 
-        # Define severity order for sorting (Critical first)
-        severity_order = {
-            "Critical": 0,
-            "High": 1,
-            "Medium": 2,
-            "Low": 3,
-            "Informational": 4,
-        }
-
-        # Sort findings within this category by severity
-        sorted_findings = sorted(
-            category_findings,
-            key=lambda x: severity_order.get(x.get("severity", "Low"), 999),
-        )
-
-        # Add the 5 most important findings for this category
-        # Limiting to 5 per category keeps the prompt manageable in size
-        for finding in sorted_findings[:5]:
-            summary = (
-                f"  - {finding.get('severity')}: {finding.get('description')} "
-                f"({finding.get('resource_type')}: {finding.get('resource_id')})"
-            )
-            findings_summary.append(summary)
+        # Add the most important findings for this category
+        # Limiting to 5 per category by default keeps the prompt manageable in size
+        shown = listed.get(category, [])
+        for line in shown:
+            findings_summary.append(f"  {line}")
 
         # If there are more findings than we showed, add a count of remaining ones
-        if len(category_findings) > 5:
+        if count > len(shown):
             findings_summary.append(
-                f"  - ... and {len(category_findings) - 5} more {category} findings"
+                f"  - ... and {count - len(shown)} more {category} findings"
             )
 
-    # Step 4: Construct the complete prompt for Claude
+    # Construct the complete prompt for Claude
     # We use XML tags to help Claude identify the findings section clearly
     # Format is designed to be clear and structured for optimal AI processing
     prompt = f"""<findings>
-# AWS Security Findings Summary
+{_summary_header(summary)}
+## Findings by Category:
+{chr(10).join(findings_summary)}
+</findings>
+"""
+
+    return prompt
+
+
+def _lines_by_category(summary):
+    """
+    Group every kept prompt line by category, most severe first.
 
-Total findings: {len(findings)}
+    Only used when all findings fit one prompt, so the sort stays small.
+    """
+    listed = {category: [] for category in summary.category_counts}
+    for category, _, line in sorted(summary.lines, key=lambda entry: entry[1]):
+        listed[category].append(line)
+    return listed
+
+
+def _summary_header(summary):
+    """Return the statistical header shared by the single and map-reduce prompts."""
+    severity_counts = summary.severity_counts
+    return f"""# AWS Security Findings Summary
+
+Total findings: {summary.total}
 - Critical: {severity_counts['Critical']}
 - High: {severity_counts['High']}
 - Medium: {severity_counts['Medium']}
 - Low: {severity_counts['Low']}
 - Informational: {severity_counts['Informational']}
-
-## Findings by Category:
-{chr(10).join(findings_summary)}
-</findings>
 """
 
-    return prompt
 
+def estimate_tokens(text):
+    """
+    Estimate the token count of a piece of text.
 
-def invoke_claude_model(bedrock, prompt):
+    Claude averages roughly four characters per token for English text; the
+    estimate only needs to be good enough to keep chunks under the budget.
     """
-    Invoke the Amazon Claude model via Bedrock API.
+    return len(text) // 4 + 1
+
+
+def _line_tokens(line, max_tokens):
+    """Estimated tokens of a chunk line; longer lines are truncated to the budget."""
+    return min(estimate_tokens(line), max_tokens)
+
+
+def prompt_tokens(lines, max_tokens=None):
+    """
+    Estimate the size of every line of FindingsSummary.lines as chunk text.
+
+    One pass without sorting: when the total fits ``max_tokens``
+    (NARRATIVE_CHUNK_TOKENS by default) the findings fit one prompt.
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    return sum(
+        _line_tokens(f"[{category}] {line}", max_tokens) for category, _, line in lines
+    )
+
+
+def chunk_lines(lines, max_tokens=None):
+    """
+    Split FindingsSummary.lines into chunks that each fit the token budget.
+
+    Lines are ordered by category and then severity so each chunk covers a
+    coherent slice of the account. Every finding appears in exactly one chunk;
+    a single finding larger than the budget is truncated rather than dropped.
+
+    Args:
+        lines (list): (category, severity rank, line) entries from aggregate_findings
+        max_tokens (int): Token budget per chunk (defaults to NARRATIVE_CHUNK_TOKENS)
+
+    Returns:
+        list: List of chunks, each a list of "[category] line" strings
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    ordered = sorted(lines, key=lambda entry: (str(entry[0]), entry[1]))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for category, _, line in ordered:
+        line = f"[{category}] {line}"
+        tokens = estimate_tokens(line)
+        if tokens > max_tokens:
+            line = line[: max_tokens * 4 - 4]
+            tokens = max_tokens
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_findings(findings, max_tokens=None):
+    """
+    Split findings into chunks of prompt lines that each fit the token budget.
+
+    Args:
+        findings (list): List of security findings
+        max_tokens (int): Token budget per chunk (defaults to NARRATIVE_CHUNK_TOKENS)
+
+    Returns:
+        list: List of chunks, each a list of formatted finding lines
+    """
+    summary = aggregate_findings(findings, top_k=0, keep_lines=True)
+    return chunk_lines(summary.lines, max_tokens)
+
+
+def invoke_claude_model(bedrock, prompt, deadline=None, model=None):
+    """
+    Invoke a Claude model via the Bedrock API.
 
     This function handles the API communication with Amazon Bedrock,
     configuring the request parameters and processing the response.
@@ -228,9 +511,16 @@ def invoke_claude_model(bedrock, prompt):
     Args:
         bedrock: Initialized Bedrock client with appropriate permissions
         prompt: The structured prompt containing security findings
+        deadline (float): Optional time.monotonic() deadline; when given (and
+                          NARRATIVE_STREAMING is on) the response is streamed and
+                          cut off cleanly at the deadline
+        model (ModelSpec): Model to call, usually from select_model(); defaults to
+                           the legacy Claude v2 text completions model
 
     Returns:
-        dict: The raw model's response as a Python dictionary
+        dict: The model's response as a Python dictionary. For the legacy model
+              this is the raw response body; for Converse models it is shaped
+              the same way ({"completion": ..., "stop_reason": ...})
 
     Note:
         This function configures specific parameters for the Claude model:
@@ -238,40 +528,188 @@ def invoke_claude_model(bedrock, prompt):
         - Max tokens: Limits response length (4096 provides detailed but concise analysis)
         - Top-p: Controls diversity of responses (0.9 is a balanced setting)
     """
-    # Step 1: Select model and set parameters
-    # Using Claude v2 for comprehensive text generation capabilities
-    model_id = "anthropic.claude-v2"  # Amazon Bedrock model identifier
+    # Construct the complete prompt with instructions
+    # Specific instructions for security report generation
+    instructions = (
+        "You are a cybersecurity expert analyzing AWS security findings. "
+        "Generate a concise, professional security report based on the following "
+        f"findings:\n\n{prompt}\n\n"
+        # Specific instructions for report structure
+        "Your report should include:\n"
+        "1. An executive summary of the security posture\n"
+        "2. Analysis of the most critical findings\n"
+        "3. Clear, actionable recommendations\n"
+        "4. Compliance implications\n\n"
+        # Style guidance for the report
+        "Format the report with clear headings and concise language suitable for both "
+        "technical and non-technical stakeholders."
+    )
+    return call_model(
+        bedrock,
+        model or LEGACY_MODEL,
+        instructions,
+        REDUCE_MAX_TOKENS,
+        deadline=deadline if STREAMING else None,
+        assistant_prefix="I'll analyze the findings and provide a comprehensive "
+        "security report.",
+    )
+
+
+def call_model(
+    bedrock, model, instructions, max_tokens, deadline=None, assistant_prefix=""
+):
+    """
+    Send one prompt to ``model`` through the API it uses and record the call.
+
+    With a deadline the response is streamed and cut off cleanly when the deadline
+    passes; otherwise the call blocks until the full response has arrived.
+
+    Args:
+        bedrock: Initialized Bedrock client
+        model (ModelSpec): Model and API to use
+        instructions (str): The user prompt
+        max_tokens (int): Maximum response length in tokens
+        deadline (float): Optional time.monotonic() deadline (enables streaming)
+        assistant_prefix (str): Opening of the answer (text completions API only)
+
+    Returns:
+        dict: Response shaped like a text completions body, with a "completion" key
+    """
+    if model.api == "converse":
+        if deadline is not None:
+            return _converse_stream(bedrock, model, instructions, max_tokens, deadline)
+        return _converse(bedrock, model, instructions, max_tokens)
+    if deadline is not None:
+        return _stream_completion(
+            bedrock, model, instructions, assistant_prefix, max_tokens, deadline
+        )
+    return _invoke_completion(
+        bedrock, model, instructions, assistant_prefix, max_tokens
+    )
 
-    # Step 2: Construct the complete prompt with instructions
+
+def _converse_request(model, instructions, max_tokens):
+    """Build the keyword arguments for a Converse request."""
+    return {
+        "modelId": model.model_id,
+        "messages": [{"role": "user", "content": [{"text": instructions}]}],
+        "inferenceConfig": {
+            "maxTokens": max_tokens,
+            "temperature": TEMPERATURE,
+            "topP": TOP_P,
+        },
+    }
+
+
+def _converse(bedrock, model, instructions, max_tokens):
+    """Call a model through the Converse API and wait for the full response."""
+    logger.info("Calling Bedrock Converse API with model: %s", model.model_id)
+    started = time.monotonic()
+    response = bedrock.converse(**_converse_request(model, instructions, max_tokens))
+    usage = response.get("usage", {})
+    _record_call(
+        model, "converse", started, usage.get("inputTokens"), usage.get("outputTokens")
+    )
+    content = response["output"]["message"]["content"]
+    text = "".join(block.get("text", "") for block in content)
+    return {"completion": text, "stop_reason": response.get("stopReason")}
+
+
+def _converse_stream(bedrock, model, instructions, max_tokens, deadline):
+    """
+    Stream a Converse response, stopping at ``deadline`` with whatever text has arrived.
+
+    When the deadline cuts the stream short, ``stop_reason`` is "deadline" and
+    the text is trimmed to the last complete paragraph with TRUNCATION_NOTE appended.
+    """
+    logger.info("Streaming Bedrock Converse response from model: %s", model.model_id)
+    started = time.monotonic()
+    response = bedrock.converse_stream(
+        **_converse_request(model, instructions, max_tokens)
+    )
+    stream = response.get("stream")
+    parts = []
+    stop_reason = None
+    usage = {}
+    try:
+        for event in stream:
+            if "contentBlockDelta" in event:
+                parts.append(event["contentBlockDelta"]["delta"].get("text", ""))
+            elif "messageStop" in event:
+                stop_reason = event["messageStop"].get("stopReason")
+            elif "metadata" in event:
+                usage = event["metadata"].get("usage", {})
+            elif not (
+                {"messageStart", "contentBlockStart", "contentBlockStop"} & set(event)
+            ):
+                # Errors arrive in-band as events such as {"throttlingException": ...}
+                raise RuntimeError(f"Bedrock stream error: {event}")
+            if stop_reason is None and time.monotonic() >= deadline:
+                stop_reason = "deadline"
+                break
+    finally:
+        # Closing the stream stops the rest of the response from being read
+        if hasattr(stream, "close"):
+            stream.close()
+    _record_call(
+        model,
+        "converse_stream",
+        started,
+        usage.get("inputTokens"),
+        usage.get("outputTokens"),
+    )
+
+    text = "".join(parts)
+    if stop_reason == "deadline":
+        logger.info(
+            "Narrative deadline reached after %s characters - truncating", len(text)
+        )
+        text = truncate_narrative(text)
+    return {"completion": text, "stop_reason": stop_reason}
+
+
+def _request_body(instructions, assistant_prefix, max_tokens):
+    """Build a Claude text completion request body."""
     # The prompt follows Claude's required Human/Assistant format
-    # and includes specific instructions for security report generation
-    request_body = {
-        "prompt": (
-            # Begin with Claude's expected format
-            "\n\nHuman: You are a cybersecurity expert analyzing AWS security findings. "
-            "Generate a concise, professional security report based on the following "
-            f"findings:\n\n{prompt}\n\n"
-            # Specific instructions for report structure
-            "Your report should include:\n"
-            "1. An executive summary of the security posture\n"
-            "2. Analysis of the most critical findings\n"
-            "3. Clear, actionable recommendations\n"
-            "4. Compliance implications\n\n"
-            # Style guidance for the report
-            "Format the report with clear headings and concise language suitable for both "
-            "technical and non-technical stakeholders.\n\n"
-            # Claude's expected assistant prefix
-            "Assistant: I'll analyze the findings and provide a comprehensive security "
-            "report.\n\n"
-        ),
+    return {
+        "prompt": f"\n\nHuman: {instructions}\n\nAssistant: {assistant_prefix}\n\n",
         # Model configuration parameters
-        "max_tokens_to_sample": 4096,  # Maximum response length (roughly 3000 words)
-        "temperature": 0.7,  # Balances creativity and consistency
-        "top_p": 0.9,  # Controls diversity of word selection
+        "max_tokens_to_sample": max_tokens,  # Maximum response length
+        "temperature": TEMPERATURE,
+        "top_p": TOP_P,
     }
 
+
+def _header_token_count(response, name):
+    """Read a Bedrock token count header from an invoke_model response, if present."""
+    headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    value = headers.get(name)
+    return int(value) if value is not None else None
+
+
+def _invoke_completion(bedrock, model, instructions, assistant_prefix, max_tokens):
+    """
+    Send one Human/Assistant completion request to Claude and return the parsed body.
+
+    Args:
+        bedrock: Initialized Bedrock client
+        model (ModelSpec): Text completions model to call
+        instructions (str): Text of the Human turn
+        assistant_prefix (str): Opening of the Assistant turn
+        max_tokens (int): Maximum response length in tokens
+
+    Returns:
+        dict: The raw model's response as a Python dictionary
+    """
+    # Step 1: Select model and set parameters
+    model_id = model.model_id
+
+    # Step 2: Construct the request
+    request_body = _request_body(instructions, assistant_prefix, max_tokens)
+
     # Step 3: Call the Bedrock API
-    print(f"Calling Bedrock API with model: {model_id}")
+    logger.info("Calling Bedrock API with model: %s", model_id)
+    started = time.monotonic()
     response = bedrock.invoke_model(
         modelId=model_id,  # Which model to use
         contentType="application/json",  # Format of our request
@@ -282,11 +720,418 @@ def invoke_claude_model(bedrock, prompt):
     # Step 4: Process the response
     # The response body is a stream that needs to be read and parsed
     response_body = json.loads(response.get("body").read())
-    print("Successfully received response from Bedrock")
+    logger.info("Successfully received response from Bedrock")
+    _record_call(
+        model,
+        "invoke_model",
+        started,
+        _header_token_count(response, "x-amzn-bedrock-input-token-count"),
+        _header_token_count(response, "x-amzn-bedrock-output-token-count"),
+    )
 
     return response_body
 
 
+def _stream_completion(
+    bedrock, model, instructions, assistant_prefix, max_tokens, deadline
+):
+    """
+    Stream a completion, stopping at ``deadline`` with whatever text has arrived.
+
+    Returns a response dictionary shaped like the invoke_model body, so it can be
+    passed to extract_narrative_claude(). When the deadline cuts the stream
+    short, ``stop_reason`` is "deadline" and the text is trimmed to the last
+    complete paragraph with TRUNCATION_NOTE appended.
+    """
+    logger.info("Streaming Bedrock response from model: %s", model.model_id)
+    started = time.monotonic()
+    response = bedrock.invoke_model_with_response_stream(
+        modelId=model.model_id,
+        contentType="application/json",
+        accept="application/json",
+        body=json.dumps(_request_body(instructions, assistant_prefix, max_tokens)),
+    )
+    stream = response.get("body")
+    parts = []
+    stop_reason = None
+    usage = {}
+    try:
+        for event in stream:
+            if "chunk" not in event:
+                # Errors arrive in-band as events such as {"throttlingException": ...}
+                raise RuntimeError(f"Bedrock stream error: {event}")
+            payload = json.loads(event["chunk"]["bytes"])
+            parts.append(payload.get("completion", ""))
+            stop_reason = payload.get("stop_reason") or stop_reason
+            # The last chunk carries the token counts for the whole call
+            usage = payload.get("amazon-bedrock-invocationMetrics", usage)
+            if stop_reason is None and time.monotonic() >= deadline:
+                stop_reason = "deadline"
+                break
+    finally:
+        # Closing the stream stops the rest of the response from being read
+        if hasattr(stream, "close"):
+            stream.close()
+    _record_call(
+        model,
+        "invoke_model_with_response_stream",
+        started,
+        usage.get("inputTokenCount"),
+        usage.get("outputTokenCount"),
+    )
+
+    text = "".join(parts)
+    if stop_reason == "deadline":
+        logger.info(
+            "Narrative deadline reached after %s characters - truncating", len(text)
+        )
+        text = truncate_narrative(text)
+    return {"completion": text, "stop_reason": stop_reason}
+
+
+def truncate_narrative(text):
+    """Cut a partial narrative back to its last complete paragraph and mark it."""
+    cut = text.rfind("\n\n")
+    if cut < len(text) // 2:
+        # No paragraph break in the second half: fall back to the last sentence
+        cut = text.rfind(". ") + 1
+    if cut > 0:
+        text = text[:cut].rstrip()
+        # Do not end on a heading whose section was cut off
+        while "\n" in text and text.rsplit("\n", 1)[1].lstrip().startswith("#"):
+            text = text.rsplit("\n", 1)[0].rstrip()
+    return text.rstrip() + TRUNCATION_NOTE
+
+
+class NarrativeCache:
+    """
+    Narratives from earlier runs, stored as JSON objects in the report bucket.
+
+    The exact key hashes the normalized findings text that goes into the prompts
+    (as a sum of per-line hashes, so collection order does not matter and no
+    sort is needed) together with the model parameters and prompt version.
+    In "near" mode a second key, built from the severity counts instead of the
+    findings text, lets runs reuse a narrative until a count changes. Cache
+    errors never stop the report: a failed read is a miss and a failed write
+    is only logged.
+    """
+
+    def __init__(self, s3_client, bucket, mode=None):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.mode = (mode or CACHE_MODE).lower()
+
+    @staticmethod
+    def _digest(payload):
+        data = json.dumps(
+            {
+                "models": [FAST_MODEL.model_id, LARGE_MODEL.model_id],
+                "large_model_severities": sorted(LARGE_MODEL_SEVERITIES),
+                "temperature": TEMPERATURE,
+                "top_p": TOP_P,
+                "max_tokens": REDUCE_MAX_TOKENS,
+                "chunk_tokens": CHUNK_TOKENS,
+                "prompt_version": PROMPT_VERSION,
+                "payload": payload,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _fingerprint(lines):
+        """Order-independent hash of FindingsSummary.lines."""
+        total = 0
+        for category, _, line in lines:
+            digest = hashlib.sha256(f"[{category}] {line}".encode("utf-8")).digest()
+            total += int.from_bytes(digest, "big")
+        return format(total % (1 << 256), "064x")
+
+    def keys(self, summary):
+        """
+        Return the cache keys to look up for a FindingsSummary, exact match first.
+
+        The summary must come from aggregate_findings(..., keep_lines=True).
+        """
+        fingerprint = self._fingerprint(summary.lines)
+        keys = [f"{CACHE_PREFIX}exact/{self._digest(fingerprint)}.json"]
+        if self.mode == "near":
+            counts = summary.severity_counts
+            keys.append(f"{CACHE_PREFIX}near/{self._digest(counts)}.json")
+        return keys
+
+    def get(self, summary):
+        """Return a cached narrative for the summarized findings, or None."""
+        if self.mode == "off":
+            return None
+        for key in self.keys(summary):
+            try:
+                body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+                narrative = json.loads(body)["narrative"]
+            except ClientError as e:
+                # NoSuchKey is the normal miss; anything else is logged
+                if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                    logger.error("Narrative cache read failed for %s: %s", key, e)
+                continue
+            except Exception as e:
+                logger.error("Narrative cache read failed for %s: %s", key, e)
+                continue
+            logger.info("Reusing cached narrative from s3://%s/%s", self.bucket, key)
+            return narrative
+        return None
+
+    def put(self, summary, narrative):
+        """Store a narrative under every key for the summarized findings."""
+        if self.mode == "off":
+            return
+        body = json.dumps(
+            {
+                "narrative": narrative,
+                "findings_count": summary.total,
+                "severity_counts": summary.severity_counts,
+                "created_at": datetime.datetime.now().isoformat(),
+            }
+        )
+        for key in self.keys(summary):
+            try:
+                self.s3.put_object(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=body,
+                    ContentType="application/json",
+                )
+            except Exception as e:
+                logger.error("Narrative cache write failed for %s: %s", key, e)
+
+
+class TokenRateLimiter:
+    """
+    Token bucket shared by all map calls to stay under a tokens-per-minute quota.
+
+    The bucket holds up to one minute of tokens and refills continuously.
+    A request larger than the whole bucket waits for a full bucket instead
+    of waiting forever.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = float(tokens_per_minute)
+        self.available = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens, deadline):
+        """
+        Wait until ``tokens`` can be spent; return False if that would pass ``deadline``.
+        """
+        if self.capacity <= 0:
+            return True
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.available = min(
+                    self.capacity, self.available + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return True
+                wait_seconds = (tokens - self.available) / self.rate
+            if now + wait_seconds > deadline:
+                return False
+            time.sleep(wait_seconds)
+
+
+def _local_summary(lines):
+    """
+    Summarize a chunk without the model, used when its map call fails or runs late.
+
+    Lines are already sorted most severe first within each category, so the
+    first few are the ones worth naming.
+    """
+    counts = {}
+    for line in lines:
+        severity = line.split("] - ", 1)[-1].split(":", 1)[0]
+        counts[severity] = counts.get(severity, 0) + 1
+    breakdown = ", ".join(f"{severity}: {count}" for severity, count in counts.items())
+    sample = "\n".join(lines[:5])
+    return (
+        f"{len(lines)} findings not analyzed by AI ({breakdown}). First few:\n{sample}"
+    )
+
+
+def _complete_within_budget(bedrock, instructions, limiter, deadline):
+    """Run one map call once the token budget allows; raise TimeoutError if it never does."""
+    needed = estimate_tokens(instructions) + MAP_MAX_TOKENS
+    if not limiter.acquire(needed, deadline):
+        raise TimeoutError("token budget not available before the narrative deadline")
+    # Partial summaries are routine work: always use the fast model
+    response = call_model(
+        bedrock,
+        FAST_MODEL,
+        instructions,
+        MAP_MAX_TOKENS,
+        assistant_prefix="Summary of these findings:",
+    )
+    return extract_narrative_claude(response)
+
+
+def _run_map(bedrock, jobs, limiter, deadline):
+    """
+    Run (instructions, fallback) jobs concurrently and return outputs in job order.
+
+    At most NARRATIVE_MAX_CONCURRENCY calls are in flight. Any job that fails or
+    has not finished by ``deadline`` contributes its fallback text instead, so
+    the result always has one entry per job.
+
+    Returns:
+        tuple: (outputs, number of jobs that used their fallback)
+    """
+    results = [fallback for _, fallback in jobs]
+    fell_back = len(jobs)
+    pool = ThreadPoolExecutor(max_workers=max(1, MAX_CONCURRENCY))
+    futures = {
+        pool.submit(
+            _complete_within_budget, bedrock, instructions, limiter, deadline
+        ): i
+        for i, (instructions, _) in enumerate(jobs)
+    }
+    done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+    for future in not_done:
+        future.cancel()
+    # Do not block on calls still in flight; their results are no longer needed
+    pool.shutdown(wait=False)
+
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+            fell_back -= 1
+        except Exception as e:
+            logger.warning(
+                "Partial summary %s failed, using local summary: %s",
+                futures[future] + 1,
+                e,
+            )
+    if not_done:
+        logger.warning(
+            "%s partial summaries missed the deadline, using local summaries",
+            len(not_done),
+        )
+    return results, fell_back
+
+
+def _map_instructions(lines, index, total):
+    return (
+        "You are a cybersecurity expert analyzing AWS security findings. Below is part "
+        f"{index} of {total} of the findings for one AWS account.\n\n"
+        f"<findings>\n{chr(10).join(lines)}\n</findings>\n\n"
+        "Summarize this part in under 300 words: the main risk themes, the most severe "
+        "findings with their resources, and how many findings fall under each theme. "
+        "Do not write recommendations or an introduction."
+    )
+
+
+def _condense_instructions(partials):
+    return (
+        "You are a cybersecurity expert. Merge these partial analyses of AWS security "
+        "findings into one analysis of under 400 words, keeping every risk theme, the "
+        "most severe findings and their counts.\n\n"
+        f"<partial_analyses>\n{chr(10).join(partials)}\n</partial_analyses>"
+    )
+
+
+def _group_by_tokens(texts, max_tokens):
+    """Group texts into lists whose combined estimated size fits ``max_tokens``."""
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def generate_map_reduce_narrative(
+    bedrock, findings, chunks=None, deadline=None, model=None, summary=None
+):
+    """
+    Generate a narrative covering every finding, however many there are.
+
+    Map: each token-budgeted chunk of findings is summarized by its own model
+    call, run concurrently up to NARRATIVE_MAX_CONCURRENCY and paced by
+    NARRATIVE_TOKENS_PER_MINUTE. If the partial summaries are themselves too
+    large for one prompt they are merged in further rounds.
+
+    Reduce: one final call turns the overall statistics and the partial
+    summaries into the report, with the same instructions as the single-call path.
+
+    The map rounds stop at NARRATIVE_TIME_BUDGET_SECONDS minus
+    NARRATIVE_REDUCE_RESERVE_SECONDS, or earlier if ``deadline`` is sooner;
+    chunks that are not summarized by then are described locally, so the
+    report stays complete and finishes in time. With a deadline the reduce
+    call is streamed and truncated cleanly if it runs out of time.
+
+    Args:
+        bedrock: Initialized Bedrock client
+        findings (list): List of security findings
+        chunks (list): Pre-computed output of chunk_findings(), if available
+        deadline (float): Optional time.monotonic() deadline for the whole narrative
+        model (ModelSpec): Model for the final call (partial summaries always use
+                           the fast model); defaults to select_model(findings)
+        summary (FindingsSummary): aggregate_findings(findings), if already computed
+
+    Returns:
+        tuple: (narrative, complete), where complete is False if any chunk was
+               described locally instead of by the model
+    """
+    start = time.monotonic()
+    final_deadline = start + TIME_BUDGET_SECONDS
+    if deadline is not None:
+        final_deadline = min(final_deadline, deadline)
+    map_deadline = max(start, final_deadline - REDUCE_RESERVE_SECONDS)
+    limiter = TokenRateLimiter(TOKENS_PER_MINUTE)
+    chunks = chunks or chunk_findings(findings)
+
+    # Map: one partial summary per chunk
+    jobs = [
+        (_map_instructions(lines, i + 1, len(chunks)), _local_summary(lines))
+        for i, lines in enumerate(chunks)
+    ]
+    partials, fell_back = _run_map(bedrock, jobs, limiter, map_deadline)
+    logger.info("Map phase produced %s partial summaries", len(partials))
+
+    # Merge rounds until the partial summaries fit a single prompt
+    while estimate_tokens("\n".join(partials)) > CHUNK_TOKENS:
+        groups = _group_by_tokens(partials, CHUNK_TOKENS)
+        if len(groups) == len(partials) or time.monotonic() >= map_deadline:
+            # No progress possible, or out of time: send what we have as is
+            break
+        jobs = [(_condense_instructions(group), "\n".join(group)) for group in groups]
+        # A merge that fails keeps its model summaries as they are
+        partials, _ = _run_map(bedrock, jobs, limiter, map_deadline)
+        logger.info("Merged partial summaries into %s", len(partials))
+
+    # Reduce: the final report
+    prompt = f"""<findings>
+{_summary_header(summary or aggregate_findings(findings, top_k=0))}
+## Partial analyses (together they cover every finding):
+{chr(10).join(partials)}
+</findings>
+"""
+    limiter.acquire(estimate_tokens(prompt) + REDUCE_MAX_TOKENS, final_deadline)
+    response = invoke_claude_model(
+        bedrock, prompt, deadline=final_deadline, model=model or select_model(findings)
+    )
+    narrative = extract_narrative_claude(response)
+    logger.info("Map-reduce narrative finished in %.1fs", time.monotonic() - start)
+    return narrative, fell_back == 0
+
+
 def extract_narrative_claude(response):
     """
     Extract the generated narrative from the Bedrock response.
@@ -317,15 +1162,15 @@ def extract_narrative_claude(response):
 
     except Exception as e:
         # Handle any errors during extraction
-        print(f"Error extracting narrative from Bedrock response: {str(e)}")
+        logger.error("Error extracting narrative from Bedrock response: %s", e)
 
         # Log the actual response for debugging
-        print(f"Problematic response: {response}")
+        logger.error("Problematic response: %s", response)
 
         # Include a stack trace for better debugging
         import traceback
 
-        print(f"Error stack trace: {traceback.format_exc()}")
+        logger.error("Error stack trace: %s", traceback.format_exc())
 
         # Fall back to a pre-written narrative
         return generate_fallback_narrative()
@@ -342,7 +1187,7 @@ def generate_fallback_narrative():
     Returns:
         str: A basic narrative summary with general security guidance
     """
-    print("Generating fallback narrative due to AI processing failure")
+    logger.info("Generating fallback narrative due to AI processing failure")
 
     # Return a professionally formatted basic report
     # This includes general guidance that applies to most AWS environments
@@ -17,40 +17,66 @@ Author: Security Engineering Team
 Last Updated: 2025-04-01
 """
 
+import datetime  # For timestamps and date formatting
 import json  # For JSON serialization/deserialization
-import boto3  # AWS SDK for Python
 import os  # For environment variable access
-import datetime  # For timestamps and date formatting
+import time  # For timing each stage of the run
 
-from utils.logging_setup import configure_logger
-logger = configure_logger(__name__)
+import boto3  # AWS SDK for Python
 
 # Import modules for specific functionality
 # Each module handles a different aspect of security findings collection
-from modules.iam_findings import (
-    collect_iam_findings,
-)  # IAM user and role security checks
-from modules.scp_findings import collect_scp_findings  # Service Control Policy analysis
-from modules.securityhub_findings import (
-    collect_securityhub_findings,
-)  # AWS Security Hub integration
-from modules.access_analyzer_findings import (
+from modules.access_analyzer_findings import (  # External access findings
     collect_access_analyzer_findings,
-)  # External access findings
-from modules.cloudtrail_findings import (
+)
+from modules.checkpoint import (  # Resuming long runs across invocations
+    CHECKPOINT_MAX_INVOCATIONS,
+    CheckpointStore,
+    collected_findings,
+    collection_deadline,
+    continue_run,
+    run_collectors,
+)
+from modules.cloudtrail_findings import (  # Audit log analysis
     collect_cloudtrail_findings,
-)  # Audit log analysis
-from modules.narrative import (
+)
+from modules.distribution import (  # Per-team report slices
+    distribute_team_reports,
+    load_ownership,
+)
+from modules.email_utils import (  # Email delivery
+    send_email_with_attachment,
+    verify_email_for_ses,
+)
+from modules.iam_findings import (  # IAM user and role security checks
+    collect_iam_findings,
+)
+from modules.narrative import (  # AI summary generation with Bedrock
     generate_ai_narrative,
-)  # AI summary generation with Bedrock
-from modules.reporting import (
+)
+from modules.reporting import (  # Report generation and storage
     generate_csv_report,
     upload_to_s3,
-)  # Report generation and storage
-from modules.email_utils import (
-    send_email_with_attachment,
-    verify_email_for_ses,
-)  # Email delivery
+)
+from modules.scp_findings import collect_scp_findings  # Service Control Policy analysis
+from modules.securityhub_findings import (  # AWS Security Hub integration
+    collect_securityhub_findings,
+)
+from utils.instrumentation import (
+    emit_emf,
+    instrument_client,
+    metrics_snapshot,
+    record_timing,
+    start_run,
+)
+from utils.logging_setup import (
+    configure_logger,
+    flush_logs,
+    reset_log_sampling,
+    set_log_context,
+)
+
+logger = configure_logger(__name__)
 
 
 def handler(event, context):
@@ -66,11 +92,25 @@ def handler(event, context):
         event (dict): The event data that triggered this Lambda function
             - Can contain 'force_real_execution' flag for testing
             - Can override recipient_email for testing
+            - Contains 'resume_run_id' when continuing a checkpointed run
         context (LambdaContext): Runtime information provided by AWS Lambda
 
     Returns:
-        dict: Response with status code and execution result message
+        dict: Response with status code and execution result message; status
+              202 means the run was checkpointed and continues in a new invocation
     """
+    # Every log record of this run carries the account, region and request ID
+    # The account ID is the fifth field of the function ARN
+    function_arn = getattr(context, "invoked_function_arn", None)
+    account_id = function_arn.split(":")[4] if isinstance(function_arn, str) else None
+    request_id = getattr(context, "aws_request_id", None)
+    set_log_context(
+        account=account_id,
+        region=os.environ.get("AWS_REGION"),
+        request_id=request_id if isinstance(request_id, str) else None,
+    )
+    reset_log_sampling()
+    start_run()
     logger.info("Starting AWS Access Review")
 
     # Check if this is a forced real execution (useful for testing)
@@ -86,128 +126,234 @@ def handler(event, context):
     # The email address can be overridden in the event (for testing)
     # Otherwise, use the one set during deployment
     recipient_email = event.get("recipient_email", os.environ["RECIPIENT_EMAIL"])
-    logger.info(f"Will send report to: {recipient_email}")
+    logger.info("Will send report to: %s", recipient_email)
 
     # Initialize all AWS service clients we'll need
     # Using boto3 clients is the recommended AWS SDK approach for Lambda functions
 
     # IAM client for checking users, roles, and policies
-    iam = boto3.client("iam")
+    iam = instrument_client(boto3.client("iam"))
 
     # Organizations client for checking SCPs - wrapped in try/except because
     # Organizations service might not be enabled in all accounts
     try:
-        org = boto3.client("organizations")
+        org = instrument_client(boto3.client("organizations"))
     except Exception as e:
         error_msg = str(e)
-        logger.warning(f"Unable to initialize Organizations client: {error_msg}")
+        logger.warning("Unable to initialize Organizations client: %s", error_msg)
         org = None  # Set to None so we can check later if it's available
 
     # Security Hub client - wrapped in try/except because
     # Security Hub might not be enabled in the account
     try:
-        securityhub = boto3.client("securityhub")
+        securityhub = instrument_client(boto3.client("securityhub"))
     except Exception as e:
         error_msg = str(e)
-        logger.warning(f"Unable to initialize Security Hub client: {error_msg}")
+        logger.warning("Unable to initialize Security Hub client: %s", error_msg)
         securityhub = None  # Set to None so we can check later if it's available
 
     # IAM Access Analyzer client - wrapped in try/except because
     # Access Analyzer might not be enabled in the account
     try:
-        access_analyzer = boto3.client("accessanalyzer")
+        access_analyzer = instrument_client(boto3.client("accessanalyzer"))
     except Exception as e:
         error_msg = str(e)
-        logger.warning(f"Unable to initialize Access Analyzer client: {error_msg}")
+        logger.warning("Unable to initialize Access Analyzer client: %s", error_msg)
         access_analyzer = None  # Set to None so we can check later if it's available
 
     # These services should always be available in all accounts
-    cloudtrail = boto3.client("cloudtrail")  # For audit trail analysis
-    bedrock = boto3.client("bedrock-runtime")  # For AI narrative generation
-    s3 = boto3.client("s3")  # For storing report files
-    ses = boto3.client("ses")  # For sending email reports
+    # Every client reports its API calls to utils.instrumentation
+    cloudtrail = instrument_client(boto3.client("cloudtrail"))  # Audit trail analysis
+    bedrock = instrument_client(boto3.client("bedrock-runtime"))  # AI narrative
+    s3 = instrument_client(boto3.client("s3"))  # For storing report files
+    ses = instrument_client(boto3.client("ses"))  # For sending email reports
 
     # Verify the recipient email in SES if needed
     # Amazon SES requires email verification before sending
     try:
-        verify_email_for_ses(ses, recipient_email)
+        verify_email_for_ses(ses, recipient_email, s3_client=s3, bucket=report_bucket)
     except Exception as e:
         error_msg = str(e)
-        logger.warning(f"Could not verify email in SES: {error_msg}")
+        logger.warning("Could not verify email in SES: %s", error_msg)
 
-    # This list will hold all findings from different security services
-    findings = []
+    # A run that ran short of time continues from its checkpoint in the bucket
+    checkpoints = CheckpointStore(s3, report_bucket)
+    resume_run_id = event.get("resume_run_id")
 
     try:
+        state = checkpoints.load(resume_run_id) if resume_run_id else checkpoints.new()
+        set_log_context(run_id=state["run_id"])
+
         # ===== STEP 1: Collect findings from multiple AWS security services =====
 
+        # Each collector takes (cursor, deadline) and can pause partway through
         # Collect IAM findings (users, roles, policies)
         # This should always work since IAM is a core service
-        logger.info("Collecting IAM findings...")
-        iam_findings = collect_iam_findings(iam)
-        findings.extend(iam_findings)
-
+        collectors = [
+            (
+                "iam",
+                lambda cursor, deadline: collect_iam_findings(
+                    iam, cursor=cursor, deadline=deadline
+                ),
+            )
+        ]
 
         # Collect Service Control Policy findings if Organizations is available
         # Some accounts may not be part of an organization
         if org:
-            logger.info("Collecting SCP findings...")
-            scp_findings = collect_scp_findings(org)
-            findings.extend(scp_findings)
-            logger.info(f"Found {len(scp_findings)} SCP findings")
+            collectors.append(
+                (
+                    "scp",
+                    lambda cursor, deadline: collect_scp_findings(
+                        org, cursor=cursor, deadline=deadline
+                    ),
+                )
+            )
         else:
             logger.info("Organizations service not available - skipping SCP analysis")
 
         # Collect Security Hub findings if available
         # Security Hub is an optional service that may not be enabled
         if securityhub:
-            logger.info("Collecting Security Hub findings...")
-            securityhub_findings = collect_securityhub_findings(securityhub)
-            findings.extend(securityhub_findings)
-            logger.info(f"Found {len(securityhub_findings)} Security Hub findings")
+            collectors.append(
+                (
+                    "securityhub",
+                    lambda cursor, deadline: collect_securityhub_findings(
+                        securityhub, cursor=cursor, deadline=deadline
+                    ),
+                )
+            )
         else:
             logger.info("Security Hub not available - skipping Security Hub analysis")
 
         # Collect IAM Access Analyzer findings if available
         # Access Analyzer is an optional service that may not be enabled
         if access_analyzer:
-            logger.info("Collecting IAM Access Analyzer findings...")
-            access_analyzer_findings = collect_access_analyzer_findings(access_analyzer)
-            findings.extend(access_analyzer_findings)
-            logger.info(f"Found {len(access_analyzer_findings)} Access Analyzer findings")
+            collectors.append(
+                (
+                    "access_analyzer",
+                    lambda cursor, deadline: collect_access_analyzer_findings(
+                        access_analyzer, cursor=cursor, deadline=deadline
+                    ),
+                )
+            )
         else:
-            logger.info("Access Analyzer not available - skipping external access analysis")
+            logger.info(
+                "Access Analyzer not available - skipping external access analysis"
+            )
 
         # Collect CloudTrail findings
         # CloudTrail should always be available as it's a core service
-        logger.info("Collecting CloudTrail findings...")
-        cloudtrail_findings = collect_cloudtrail_findings(cloudtrail, s3)
-        findings.extend(cloudtrail_findings)
-        logger.info(f"Found {len(cloudtrail_findings)} CloudTrail findings")
+        collectors.append(
+            (
+                "cloudtrail",
+                lambda cursor, deadline: collect_cloudtrail_findings(
+                    cloudtrail, s3, cursor=cursor, deadline=deadline
+                ),
+            )
+        )
 
-        logger.info(f"Total findings collected: {len(findings)}")
+        # Run the collectors. A first run only writes a checkpoint if it pauses;
+        # a resumed run also saves after each collector so its progress survives
+        # a failed continuation. Past the invocation limit the run finishes.
+        deadline = collection_deadline(context)
+        if state["invocation"] >= CHECKPOINT_MAX_INVOCATIONS:
+            logger.warning(
+                "Run %s reached %s invocations; finishing without a deadline",
+                state["run_id"],
+                state["invocation"],
+            )
+            deadline = None
+        resuming = resume_run_id is not None
+        finished = run_collectors(
+            collectors,
+            state,
+            deadline=deadline,
+            save=checkpoints.save if resuming else None,
+        )
+        if not finished:
+            # Near the deadline: hand the rest of the run to a new invocation
+            checkpoints.save(state)
+            continue_run(
+                instrument_client(boto3.client("lambda")),
+                context,
+                event,
+                state["run_id"],
+            )
+            return {
+                "statusCode": 202,
+                "body": json.dumps("AWS Access Review continuing in a new invocation"),
+                "checkpoint": {
+                    "runId": state["run_id"],
+                    "invocation": state["invocation"],
+                    "completed": sorted(state["completed"]),
+                },
+                "metrics": metrics_snapshot(),
+            }
+
+        findings = collected_findings(state, collectors)
+        logger.info("Total findings collected: %s", len(findings))
 
         # ===== STEP 2: Generate CSV report with all findings =====
         logger.info("Generating CSV report...")
+        started = time.perf_counter()
         csv_content, csv_filename = generate_csv_report(findings)
 
         # ===== STEP 3: Upload CSV to S3 for persistence =====
         # Create a timestamp for unique filename
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
         csv_key = f"reports/aws-access-review-{timestamp}.csv"
-        logger.info(f"Uploading report to S3 bucket: {report_bucket}, key: {csv_key}")
+        logger.info(
+            "Uploading report to S3 bucket: %s, key: %s", report_bucket, csv_key
+        )
         upload_to_s3(s3, report_bucket, csv_content, csv_key)
+        started = record_timing("stage.report", started)
 
         # ===== STEP 4: Generate AI narrative using Amazon Bedrock =====
         # This creates a human-readable summary of the findings
         logger.info("Generating AI narrative summary...")
-        narrative = generate_ai_narrative(bedrock, findings)
+        narrative = generate_ai_narrative(
+            bedrock, findings, s3=s3, bucket=report_bucket, context=context
+        )
+        started = record_timing("stage.narrative", started)
 
         # ===== STEP 5: Send email with narrative and CSV attachment =====
-        logger.info(f"Sending email report to {recipient_email}...")
+        logger.info("Sending email report to %s...", recipient_email)
+        # Large reports are linked from S3 instead of attached
         send_email_with_attachment(
-            ses, recipient_email, narrative, csv_content, csv_filename
+            ses,
+            recipient_email,
+            narrative,
+            csv_content,
+            csv_filename,
+            s3_client=s3,
+            bucket=report_bucket,
+            key=csv_key,
         )
+        started = record_timing("stage.email", started)
+
+        # ===== STEP 6: Send each owning team its own slice of the findings =====
+        team_reports = None
+        try:
+            ownership = load_ownership(s3, report_bucket)
+            if ownership:
+                logger.info("Sending per-team reports...")
+                team_reports = distribute_team_reports(
+                    ses,
+                    s3,
+                    report_bucket,
+                    findings,
+                    ownership,
+                    recipient_email,
+                    account_id=account_id,
+                )
+        except Exception as e:
+            # The full report has already gone out; team reports are best effort
+            logger.error("Error sending per-team reports: %s", e)
+        record_timing("stage.team_reports", started)
+
+        if resuming:
+            checkpoints.delete(state["run_id"])
 
         logger.info("AWS Access Review completed successfully")
         return {
@@ -218,21 +364,33 @@ def handler(event, context):
                 "bucket": report_bucket,
                 "key": csv_key,
                 "findingsCount": len(findings),
+                "teamReports": team_reports,
             },
+            # Timings and API call counts, to find slow collectors and checks
+            "metrics": metrics_snapshot(),
         }
 
     except Exception as e:
         # Comprehensive error handling
         error_msg = str(e)
-        logger.error(f"Error in AWS Access Review: {error_msg}")
+        logger.error("Error in AWS Access Review: %s", error_msg)
 
         # Log the error stack trace for debugging
         import traceback
 
-        logger.error(f"Error stack trace: {traceback.format_exc()}")
+        logger.error("Error stack trace: %s", traceback.format_exc())
 
         return {
             "statusCode": 500,
             "body": json.dumps(f"Error: {error_msg}"),
             "errorDetails": {"message": error_msg, "type": type(e).__name__},
+            "metrics": metrics_snapshot(),
         }
+
+    finally:
+        # Publish the run's metrics as CloudWatch Embedded Metric Format
+        emit_emf()
+
+        # Records are written by a background thread; write them out before
+        # the Lambda environment is frozen
+        flush_logs()
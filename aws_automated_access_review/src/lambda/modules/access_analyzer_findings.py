@@ -4,14 +4,34 @@ Module for collecting AWS IAM Access Analyzer findings.
 
 import datetime
 
+from modules.checkpoint import CollectorPaused, pause_if_due, resumable_pages
+from utils.logging_setup import configure_logger
 
-def collect_access_analyzer_findings(access_analyzer):
+logger = configure_logger(__name__)
+
+
+def collect_access_analyzer_findings(access_analyzer, cursor=None, deadline=None):
     """
     Collect findings from IAM Access Analyzer.
     Identifies external access to resources that should be private.
+
+    Args:
+        access_analyzer (boto3.client): A boto3 Access Analyzer client
+        cursor (dict): Where a paused run stopped, {"analyzer": ARN of the
+                       analyzer being read, "starting_token": paginator token
+                       of its next page or None, "count": its findings so far};
+                       None starts from the first analyzer
+        deadline (float): time.monotonic() value at which to pause, or None
+
+    Raises:
+        CollectorPaused: The deadline passed between two pages or analyzers
     """
     findings = []
-    print("Collecting IAM Access Analyzer findings...")
+    logger.info("Collecting IAM Access Analyzer findings...")
+
+    # Analyzers are read in ARN order; a resumed run skips those before the
+    # cursor's analyzer and continues that one from its saved page
+    resume_arn = (cursor or {}).get("analyzer")
 
     try:
         # Get all analyzers in the account
@@ -38,19 +58,35 @@ def collect_access_analyzer_findings(access_analyzer):
             return findings
 
         # For each analyzer, get active findings
-        for analyzer in analyzers:
+        for analyzer in sorted(analyzers, key=lambda analyzer: analyzer["arn"]):
             analyzer_arn = analyzer["arn"]
             analyzer_name = analyzer["name"]
+            if resume_arn is not None and analyzer_arn < resume_arn:
+                continue
+
+            starting_token = None
+            aa_findings_count = 0
+            if analyzer_arn == resume_arn:
+                starting_token = cursor.get("starting_token")
+                aa_findings_count = cursor.get("count", 0)
+            else:
+                pause_if_due(
+                    deadline,
+                    {"analyzer": analyzer_arn, "starting_token": None, "count": 0},
+                    findings,
+                )
 
             # List active findings for this analyzer
             list_findings_paginator = access_analyzer.get_paginator("list_findings")
-            findings_pages = list_findings_paginator.paginate(
-                analyzerArn=analyzer_arn, filter={"status": {"eq": ["ACTIVE"]}}
+            findings_pages = resumable_pages(
+                list_findings_paginator,
+                starting_token,
+                token_key="nextToken",
+                analyzerArn=analyzer_arn,
+                filter={"status": {"eq": ["ACTIVE"]}},
             )
 
-            aa_findings_count = 0
-
-            for page in findings_pages:
+            for page, resume_token in findings_pages:
                 for finding_id in page.get("findings", []):
                     # Get detailed finding information
                     finding_detail = access_analyzer.get_finding(
@@ -96,9 +132,21 @@ def collect_access_analyzer_findings(access_analyzer):
 
                     aa_findings_count += 1
 
-            print(
-                f"Found {aa_findings_count} Access Analyzer findings for analyzer "
-                f"{analyzer_name}"
+                if resume_token:
+                    pause_if_due(
+                        deadline,
+                        {
+                            "analyzer": analyzer_arn,
+                            "starting_token": resume_token,
+                            "count": aa_findings_count,
+                        },
+                        findings,
+                    )
+
+            logger.info(
+                "Found %s Access Analyzer findings for analyzer %s",
+                aa_findings_count,
+                analyzer_name,
             )
 
             # If there were no findings, add a positive finding
@@ -119,9 +167,12 @@ def collect_access_analyzer_findings(access_analyzer):
                     }
                 )
 
+    except CollectorPaused:
+        # Not an error: the handler saves the cursor and resumes later
+        raise
     except Exception as e:
         error_msg = str(e)
-        print(f"Error collecting Access Analyzer findings: {error_msg}")
+        logger.error("Error collecting Access Analyzer findings: %s", error_msg)
         findings.append(
             {
                 "id": "AA-ERROR",
@@ -136,5 +187,5 @@ def collect_access_analyzer_findings(access_analyzer):
             }
         )
 
-    print(f"Collected {len(findings)} Access Analyzer findings")
+    logger.info("Collected %s Access Analyzer findings", len(findings))
     return findings
@@ -0,0 +1,214 @@
+"""
+Module for running the finding collectors across several Lambda invocations.
+
+Collectors run one after another. When the invocation nears its deadline,
+the findings collected so far are saved to a checkpoint object in the report
+bucket. Each collector can also stop partway through, between pages or
+resources, and save its position as a cursor. The handler then re-invokes the
+function asynchronously with the run ID. The next invocation loads the
+checkpoint, skips whatever is already done, and saves after each collector.
+
+Checkpoint object (checkpoints/<run_id>.json):
+
+    {
+      "run_id": "2025-04-01-06-00-00-1a2b3c4d",
+      "invocation": 2,
+      "completed": {"iam": [...findings...]},
+      "partial": {"securityhub": {"cursor": {...}, "findings": [...]}}
+    }
+"""
+
+import datetime
+import json
+import os
+import time
+import uuid
+
+from botocore.paginate import TokenEncoder
+
+from utils.instrumentation import collector_timer
+from utils.logging_setup import configure_logger, log_context
+
+logger = configure_logger(__name__)
+
+CHECKPOINT_PREFIX = "checkpoints/"
+# Time kept back for the report, narrative and email after collection
+CHECKPOINT_RESERVE_SECONDS = float(os.environ.get("CHECKPOINT_RESERVE_SECONDS", "120"))
+# Stop handing on after this many invocations, in case a collector never finishes
+CHECKPOINT_MAX_INVOCATIONS = int(os.environ.get("CHECKPOINT_MAX_INVOCATIONS", "10"))
+
+
+class CollectorPaused(Exception):
+    """
+    Raised by a collector that stopped at the deadline.
+
+    ``cursor`` is passed back to the collector to resume; ``findings`` are the
+    findings it produced before stopping.
+    """
+
+    def __init__(self, cursor, findings):
+        super().__init__(f"collector paused at {cursor}")
+        self.cursor = cursor
+        self.findings = findings
+
+
+def pause_if_due(deadline, cursor, findings):
+    """Raise CollectorPaused with ``cursor`` if ``deadline`` has passed."""
+    if deadline is not None and time.monotonic() >= deadline:
+        raise CollectorPaused(cursor, findings)
+
+
+def sorted_after(items, key, after):
+    """Return ``items`` in ``key`` order, skipping those up to ``after``."""
+    ordered = sorted(items, key=lambda item: item[key])
+    if after is None:
+        return ordered
+    return [item for item in ordered if item[key] > after]
+
+
+def resumable_pages(paginator, starting_token=None, token_key="NextToken", **kwargs):
+    """
+    Yield (page, resume_token) for each page of a boto3 paginator.
+
+    ``resume_token`` is the paginator StartingToken of the page after this one,
+    or None after the last page. Passing it back as ``starting_token`` continues
+    from that page, in this invocation or a later one.
+    """
+    if starting_token:
+        kwargs["PaginationConfig"] = {"StartingToken": starting_token}
+    for page in paginator.paginate(**kwargs):
+        token = page.get(token_key)
+        yield page, TokenEncoder().encode({token_key: token}) if token else None
+
+
+def collection_deadline(context, reserve_seconds=None):
+    """
+    Return the time.monotonic() value by which collection must stop, or None.
+
+    The deadline leaves ``reserve_seconds`` (CHECKPOINT_RESERVE_SECONDS by
+    default) of the invocation for the rest of the run.
+    """
+    remaining = getattr(context, "get_remaining_time_in_millis", None)
+    remaining = remaining() if callable(remaining) else None
+    if not isinstance(remaining, (int, float)):
+        return None
+    if reserve_seconds is None:
+        reserve_seconds = CHECKPOINT_RESERVE_SECONDS
+    return time.monotonic() + remaining / 1000.0 - reserve_seconds
+
+
+class CheckpointStore:
+    """Checkpoints for collection runs, stored as JSON objects in S3."""
+
+    def __init__(self, s3, bucket):
+        self.s3 = s3
+        self.bucket = bucket
+
+    def _key(self, run_id):
+        return f"{CHECKPOINT_PREFIX}{run_id}.json"
+
+    def new(self):
+        """Return the state of a fresh run."""
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        return {
+            "run_id": f"{timestamp}-{uuid.uuid4().hex[:8]}",
+            "invocation": 1,
+            "completed": {},
+            "partial": {},
+        }
+
+    def load(self, run_id):
+        """Return the saved state of a run, with its invocation count advanced."""
+        body = self.s3.get_object(Bucket=self.bucket, Key=self._key(run_id))["Body"]
+        state = json.loads(body.read())
+        state["invocation"] += 1
+        logger.info(
+            "Resuming run %s (invocation %s), completed collectors: %s",
+            run_id,
+            state["invocation"],
+            sorted(state["completed"]),
+        )
+        return state
+
+    def save(self, state):
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=self._key(state["run_id"]),
+            Body=json.dumps(state, default=str),
+            ContentType="application/json",
+        )
+
+    def delete(self, run_id):
+        try:
+            self.s3.delete_object(Bucket=self.bucket, Key=self._key(run_id))
+        except Exception as e:
+            # A leftover checkpoint is harmless; it is never resumed on its own
+            logger.warning("Could not delete checkpoint for run %s: %s", run_id, e)
+
+
+def run_collectors(collectors, state, deadline=None, save=None):
+    """
+    Run the collectors that the checkpoint does not mark as completed.
+
+    Args:
+        collectors: List of (name, collect) pairs, where collect(cursor, deadline)
+                    returns a list of findings or raises CollectorPaused
+        state: Checkpoint state from CheckpointStore.new() or load()
+        deadline: time.monotonic() value at which to stop, or None for no limit
+        save: Called with the state after every collector that finishes or pauses
+
+    Returns:
+        bool: True if every collector has finished, False if the run must continue
+    """
+    for name, collect in collectors:
+        if name in state["completed"]:
+            continue
+        if deadline is not None and time.monotonic() >= deadline:
+            logger.info("Deadline reached before the %s collector", name)
+            return False
+
+        partial = state["partial"].get(name, {})
+        earlier = partial.get("findings", [])
+        with log_context(collector=name), collector_timer(name):
+            try:
+                findings = collect(partial.get("cursor"), deadline)
+            except CollectorPaused as paused:
+                logger.info("%s collector paused at %s", name, paused.cursor)
+                state["partial"][name] = {
+                    "cursor": paused.cursor,
+                    "findings": earlier + paused.findings,
+                }
+                if save:
+                    save(state)
+                return False
+
+        state["completed"][name] = earlier + findings
+        state["partial"].pop(name, None)
+        logger.info("Found %s %s findings", len(state["completed"][name]), name)
+        if save:
+            save(state)
+    return True
+
+
+def collected_findings(state, collectors):
+    """Return every completed collector's findings, in collector order."""
+    findings = []
+    for name, _ in collectors:
+        findings.extend(state["completed"].get(name, []))
+    return findings
+
+
+def continue_run(lambda_client, context, event, run_id):
+    """
+    Hand the run on to the next invocation.
+
+    The function invokes itself asynchronously with ``resume_run_id`` added to
+    the original event.
+    """
+    payload = dict(event, resume_run_id=run_id)
+    lambda_client.invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps(payload).encode("utf-8"),
+    )
+    logger.info("Re-invoked the function to continue run %s", run_id)
@@ -4,14 +4,33 @@ Module for collecting AWS CloudTrail-related security findings.
 
 import datetime
 
+from modules.checkpoint import CollectorPaused, pause_if_due, sorted_after
+from utils.logging_setup import configure_logger
 
-def collect_cloudtrail_findings(cloudtrail, s3):
+logger = configure_logger(__name__)
+
+
+def collect_cloudtrail_findings(cloudtrail, s3, cursor=None, deadline=None):
     """
     Collect CloudTrail-related security findings.
     Checks if CloudTrail is enabled and properly configured.
+
+    Args:
+        cloudtrail (boto3.client): A boto3 CloudTrail client
+        s3 (boto3.client): A boto3 S3 client, for the trail buckets
+        cursor (dict): Where a paused run stopped, {"after": last trail name
+                       checked, "found": findings collected so far}; None
+                       starts from the first trail
+        deadline (float): time.monotonic() value at which to pause, or None
+
+    Raises:
+        CollectorPaused: The deadline passed between two trails
     """
     findings = []
-    print("Collecting AWS CloudTrail findings...")
+    logger.info("Collecting AWS CloudTrail findings...")
+    # Findings from before a pause were saved with the checkpoint
+    found = (cursor or {}).get("found", 0)
+    previous = (cursor or {}).get("after")
 
     try:
         # Get list of trails
@@ -35,8 +54,12 @@ def collect_cloudtrail_findings(cloudtrail, s3):
             )
             return findings
 
-        # Check each trail's configuration
-        for trail in trails:
+        # Check each trail's configuration, in name order
+        for trail in sorted_after(trails, "Name", previous):
+            pause_if_due(
+                deadline, {"after": previous, "found": found + len(findings)}, findings
+            )
+            previous = trail["Name"]
             trail_name = trail.get("Name", "")
             trail_arn = trail.get("TrailARN", "")
             s3_bucket = trail.get("S3BucketName", "")
@@ -147,7 +170,7 @@ def collect_cloudtrail_findings(cloudtrail, s3):
                     )
 
         # If no findings detected, add a positive note
-        if not findings:
+        if not found and not findings:
             findings.append(
                 {
                     "id": "CT-POSITIVE-001",
@@ -162,9 +185,12 @@ def collect_cloudtrail_findings(cloudtrail, s3):
                 }
             )
 
+    except CollectorPaused:
+        # Not an error: the handler saves the cursor and resumes later
+        raise
     except Exception as e:
         error_msg = str(e)
-        print(f"Error collecting CloudTrail findings: {error_msg}")
+        logger.error("Error collecting CloudTrail findings: %s", error_msg)
         findings.append(
             {
                 "id": "CT-ERROR",
@@ -179,5 +205,5 @@ def collect_cloudtrail_findings(cloudtrail, s3):
             }
         )
 
-    print(f"Collected {len(findings)} CloudTrail findings")
+    logger.info("Collected %s CloudTrail findings", len(findings))
     return findings
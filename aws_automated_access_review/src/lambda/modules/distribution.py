@@ -0,0 +1,292 @@
+"""
+Module for distributing per-team slices of the AWS access review report.
+
+An ownership map assigns findings to teams. Each team gets a short email with
+its own severity summary and a link to a CSV holding only its findings.
+Findings are partitioned in one pass, each slice is rendered and uploaded
+once, and the emails go out through the SES bulk templated API, up to 50
+recipients per call, with several calls in flight at once.
+
+Ownership map (TEAM_OWNERSHIP as JSON, or a JSON object in the report bucket
+at TEAM_OWNERSHIP_KEY):
+
+    {
+      "teams": {
+        "payments": {
+          "emails": ["payments-security@example.com"],
+          "accounts": ["111122223333"],
+          "resources": ["payments-*", "arn:aws:iam::*:role/payments-*"]
+        }
+      },
+      "default_team": "platform"
+    }
+
+A finding belongs to the first team whose resource pattern (fnmatch syntax)
+matches its resource_id, otherwise to the team owning its account (taken from
+an ARN resource_id, or the account the review ran in), otherwise to
+default_team. Findings without an owner only appear in the full report.
+"""
+
+import datetime
+import fnmatch
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.email_utils import (
+    check_verified_emails,
+    describe_lifetime,
+    report_download_link,
+)
+from modules.findings_aggregation import aggregate_findings
+from modules.reporting import generate_csv_report, upload_to_s3
+from utils.logging_setup import configure_logger
+
+logger = configure_logger(__name__)
+
+TEAM_OWNERSHIP = os.environ.get("TEAM_OWNERSHIP", "")
+TEAM_OWNERSHIP_KEY = os.environ.get("TEAM_OWNERSHIP_KEY", "")
+TEAM_REPORT_TEMPLATE = os.environ.get(
+    "TEAM_REPORT_TEMPLATE", "AccessReviewTeamReport-v2"
+)
+# Concurrent S3 uploads and SES bulk calls
+TEAM_SEND_CONCURRENCY = int(os.environ.get("TEAM_SEND_CONCURRENCY", "4"))
+
+# SendBulkTemplatedEmail accepts at most 50 destinations per call
+BULK_DESTINATIONS = 50
+
+TEMPLATE_SUBJECT = "AWS Access Review Report - {{team}}"
+TEMPLATE_TEXT = (
+    "AWS Access Review Report for {{team}}\n\n"
+    "{{summary}}\n\n"
+    "Download your team's {{count}} findings ({{link_note}}): {{link}}\n"
+)
+TEMPLATE_HTML = (
+    "<html>\n<body>\n"
+    "<h1>AWS Access Review Report for {{team}}</h1>\n"
+    "<pre>{{summary}}</pre>\n"
+    '<p><a href="{{link}}">Download your team\'s {{count}} findings</a>'
+    " ({{link_note}})</p>\n"
+    "</body>\n</html>"
+)
+
+# Template names already checked or created by this Lambda container
+_templates_ready = set()
+
+
+def load_ownership(s3_client=None, bucket=None):
+    """
+    Return the ownership map, or None if per-team reports are not configured.
+    """
+    if TEAM_OWNERSHIP:
+        return json.loads(TEAM_OWNERSHIP)
+    if TEAM_OWNERSHIP_KEY and s3_client and bucket:
+        body = s3_client.get_object(Bucket=bucket, Key=TEAM_OWNERSHIP_KEY)["Body"]
+        return json.loads(body.read())
+    return None
+
+
+class OwnerResolver:
+    """
+    Maps a finding to its owning team.
+
+    Account lookups are a dictionary hit; resource patterns are tried in the
+    order the teams are listed.
+    """
+
+    def __init__(self, ownership, account_id=None):
+        teams = ownership.get("teams", {})
+        self.account_id = account_id
+        self.default_team = ownership.get("default_team")
+        self.accounts = {}
+        self.patterns = []
+        for team, spec in teams.items():
+            for account in spec.get("accounts", []):
+                self.accounts.setdefault(str(account), team)
+            for pattern in spec.get("resources", []):
+                self.patterns.append((pattern, team))
+
+    def owner_of(self, finding):
+        resource_id = str(finding.get("resource_id", ""))
+        for pattern, team in self.patterns:
+            if fnmatch.fnmatchcase(resource_id, pattern):
+                return team
+
+        account = self.account_id
+        parts = resource_id.split(":")
+        if resource_id.startswith("arn:") and len(parts) > 4 and parts[4]:
+            account = parts[4]
+        return self.accounts.get(account, self.default_team)
+
+
+def partition_findings(findings, resolver):
+    """Split findings into {team: [findings]} in one pass, dropping unowned ones."""
+    slices = {}
+    for finding in findings:
+        team = resolver.owner_of(finding)
+        if team is not None:
+            slices.setdefault(team, []).append(finding)
+    return slices
+
+
+def render_team_summary(team, findings):
+    """Return the severity summary shown in a team's email."""
+    summary = aggregate_findings(findings, top_k=0, key_issue_limit=3)
+    counts = ", ".join(
+        f"{severity}: {count}"
+        for severity, count in summary.severity_counts.items()
+        if count
+    )
+    lines = [f"{summary.total} findings for {team} ({counts or 'none'})"]
+    if summary.key_issues:
+        lines.append("Most severe:")
+        lines.extend(
+            f"- {f.get('severity')}: {f.get('description')} ({f.get('resource_id')})"
+            for f in summary.key_issues
+        )
+    return "\n".join(lines)
+
+
+def ensure_team_template(ses_client, name=None):
+    """Create the SES email template for team reports if it does not exist yet."""
+    name = name or TEAM_REPORT_TEMPLATE
+    if name in _templates_ready:
+        return name
+    try:
+        ses_client.get_template(TemplateName=name)
+    except ses_client.exceptions.TemplateDoesNotExistException:
+        logger.info("Creating SES template %s", name)
+        ses_client.create_template(
+            Template={
+                "TemplateName": name,
+                "SubjectPart": TEMPLATE_SUBJECT,
+                "TextPart": TEMPLATE_TEXT,
+                "HtmlPart": TEMPLATE_HTML,
+            }
+        )
+    _templates_ready.add(name)
+    return name
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def distribute_team_reports(
+    ses_client, s3_client, bucket, findings, ownership, source_email, account_id=None
+):
+    """
+    Send each team the findings it owns.
+
+    Args:
+        ses_client: Boto3 SES client
+        s3_client: Boto3 S3 client
+        bucket: Report bucket; team CSVs are stored under reports/teams/
+        findings: List of finding dictionaries
+        ownership: Ownership map (see load_ownership)
+        source_email: Sender address; it must be verified in SES
+        account_id: Account the review ran in, for findings without an ARN
+
+    Recipients are not checked against SES: outside the SES sandbox they need
+    no verification, and SES reports any address it rejects in the per
+    destination status of the bulk call.
+
+    Returns:
+        dict: Counts of teams and of emails sent and failed, and the addresses
+              SES did not send to
+    """
+    slices = partition_findings(findings, OwnerResolver(ownership, account_id))
+    teams = ownership.get("teams", {})
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    logger.info("Partitioned findings into %s team reports", len(slices))
+
+    def _render(team):
+        csv_content, _ = generate_csv_report(slices[team])
+        key = f"reports/teams/{team}/aws-access-review-{timestamp}.csv"
+        upload_to_s3(s3_client, bucket, csv_content, key)
+        link, lifetime = report_download_link(s3_client, bucket, key)
+        return {
+            "team": team,
+            "count": str(len(slices[team])),
+            "summary": render_team_summary(team, slices[team]),
+            "link": link or f"s3://{bucket}/{key}",
+            "link_note": (
+                f"link valid for {describe_lifetime(lifetime)}"
+                if link
+                else "stored in the report bucket"
+            ),
+        }
+
+    workers = max(1, TEAM_SEND_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rendered = list(pool.map(_render, sorted(slices)))
+
+    destinations = [
+        {
+            "Destination": {"ToAddresses": [email]},
+            "ReplacementTemplateData": json.dumps(data),
+        }
+        for data in rendered
+        for email in teams.get(data["team"], {}).get("emails", [])
+    ]
+    result = {"teams": len(slices), "sent": 0, "failed": 0, "failed_addresses": []}
+    if not destinations:
+        return result
+
+    # Only the sender needs to be verified; its status is cached between runs
+    if source_email not in check_verified_emails(
+        ses_client, [source_email], s3_client, bucket
+    ):
+        logger.error("Sender %s is not verified in SES", source_email)
+        result["failed"] = len(destinations)
+        result["failed_addresses"] = [
+            d["Destination"]["ToAddresses"][0] for d in destinations
+        ]
+        return result
+
+    template = ensure_team_template(ses_client)
+
+    def _send(batch):
+        try:
+            response = ses_client.send_bulk_templated_email(
+                Source=source_email,
+                Template=template,
+                DefaultTemplateData=json.dumps(
+                    {
+                        "team": "",
+                        "count": "0",
+                        "summary": "",
+                        "link": "",
+                        "link_note": "",
+                    }
+                ),
+                Destinations=batch,
+            )
+        except Exception as e:
+            logger.error("Error sending team reports: %s", e)
+            return 0, [d["Destination"]["ToAddresses"][0] for d in batch]
+        # One status per destination, in the order they were given
+        statuses = response.get("Status", [])
+        failed = []
+        for i, destination in enumerate(batch):
+            address = destination["Destination"]["ToAddresses"][0]
+            status = statuses[i] if i < len(statuses) else {}
+            if status.get("Status") != "Success":
+                logger.warning(
+                    "Team report to %s not sent: %s %s",
+                    address,
+                    status.get("Status", "NoStatus"),
+                    status.get("Error", ""),
+                )
+                failed.append(address)
+        return len(batch) - len(failed), failed
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for sent, failed in pool.map(_send, _chunks(destinations, BULK_DESTINATIONS)):
+            result["sent"] += sent
+            result["failed"] += len(failed)
+            result["failed_addresses"].extend(failed)
+
+    logger.info("Sent %s team reports, %s failed", result["sent"], result["failed"])
+    return result
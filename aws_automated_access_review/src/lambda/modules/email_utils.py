@@ -1,19 +1,197 @@
 """
 Module for email related utilities to send AWS access review reports.
+
+SES rejects raw messages over 10 MB, so the CSV report is compressed before it
+is attached. If it is still too large, the email links to the copy of the
+report already stored in S3 instead of attaching it.
 """
 
+import datetime
+import email.mime.application
 import email.mime.multipart
 import email.mime.text
-import email.mime.application
+import gzip
+import io
+import json
+import os
+import time
+import zipfile
+
+from utils.logging_setup import configure_logger
+
+logger = configure_logger(__name__)
+
+# gzip, zip or none
+ATTACHMENT_COMPRESSION = os.environ.get("REPORT_ATTACHMENT_COMPRESSION", "gzip")
+# Base64 encoding grows the attachment by a third, so 7 MB stays under 10 MB
+MAX_ATTACHMENT_BYTES = int(
+    os.environ.get("REPORT_ATTACHMENT_MAX_BYTES", str(7 * 1024 * 1024))
+)
+# How long the report download link should stay valid. SigV4 allows at most
+# 7 days, and a link also stops working when the credentials that signed it
+# expire, so links signed with temporary credentials are capped (see
+# link_lifetime_seconds)
+REPORT_LINK_EXPIRY_SECONDS = int(
+    os.environ.get("REPORT_LINK_EXPIRY_SECONDS", str(7 * 24 * 3600))
+)
+# Lifetime assumed for temporary credentials whose expiry is not known, such
+# as the role session the Lambda runtime passes in environment variables
+REPORT_LINK_SESSION_SECONDS = int(os.environ.get("REPORT_LINK_SESSION_SECONDS", "3600"))
+
+# Verified SES addresses are remembered in the report bucket between runs
+VERIFICATION_CACHE_KEY = "ses-verification/verified.json"
+VERIFICATION_CACHE_TTL_SECONDS = int(
+    os.environ.get("SES_VERIFICATION_CACHE_TTL_SECONDS", "86400")
+)
+# GetIdentityVerificationAttributes accepts at most 100 identities per call
+VERIFICATION_BATCH = 100
+
+# {address: time it was last seen verified}, kept while the container is warm
+_verified_at = {}
+
+
+def compress_attachment(csv_content, filename, compression=None):
+    """
+    Compress the CSV report for attaching to an email.
+
+    Args:
+        csv_content: CSV report as a string or bytes
+        filename: Name of the CSV file
+        compression: "gzip", "zip" or "none"; defaults to REPORT_ATTACHMENT_COMPRESSION
+
+    Returns:
+        A tuple of (attachment_bytes, attachment_filename)
+    """
+    data = csv_content.encode("utf-8") if isinstance(csv_content, str) else csv_content
+    compression = (compression or ATTACHMENT_COMPRESSION).lower()
+
+    if compression == "gzip":
+        # mtime=0 keeps the output identical for identical reports
+        return gzip.compress(data, mtime=0), f"{filename}.gz"
+    if compression == "zip":
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(filename, data)
+        return buffer.getvalue(), f"{os.path.splitext(filename)[0]}.zip"
+    return data, filename
+
+
+def link_lifetime_seconds(s3_client, expires_in=None):
+    """
+    Return how long a presigned URL signed by ``s3_client`` will really work.
+
+    Long-lived access keys honor ``expires_in`` (REPORT_LINK_EXPIRY_SECONDS by
+    default). Temporary credentials invalidate the URL when they expire, so
+    the lifetime is capped at their remaining validity, or at
+    REPORT_LINK_SESSION_SECONDS when their expiry is not known.
+    """
+    expires_in = expires_in or REPORT_LINK_EXPIRY_SECONDS
+    signer = getattr(s3_client, "_request_signer", None)
+    credentials = getattr(signer, "_credentials", None)
+    token = getattr(credentials, "token", None)
+    if not isinstance(token, str) or not token:
+        return expires_in
+
+    expiry = getattr(credentials, "_expiry_time", None)
+    if isinstance(expiry, datetime.datetime):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        remaining = int((expiry - now).total_seconds())
+    else:
+        remaining = REPORT_LINK_SESSION_SECONDS
+    return max(0, min(expires_in, remaining))
+
+
+def describe_lifetime(seconds):
+    """Return a link lifetime in words, rounded down: "7 days", "1 hour", ..."""
+    for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= size:
+            count = seconds // size
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+    return f"{seconds} seconds"
+
+
+def report_download_link(s3_client, bucket, key, expires_in=None):
+    """
+    Return a presigned URL for a report stored in S3 and how long it works.
+
+    Returns:
+        tuple: (url, lifetime in seconds), or (None, 0) if no usable link can
+               be made
+    """
+    lifetime = link_lifetime_seconds(s3_client, expires_in)
+    if lifetime <= 0:
+        logger.error("Signing credentials have expired; no download link created")
+        return None, 0
+    try:
+        url = s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": bucket, "Key": key},
+            ExpiresIn=lifetime,
+        )
+    except Exception as e:
+        logger.error("Error creating download link for s3://%s/%s: %s", bucket, key, e)
+        return None, 0
+    return url, lifetime
 
 
 def send_email_with_attachment(
-    ses_client, recipient_email, narrative, csv_content, filename
+    ses_client,
+    recipient_email,
+    narrative,
+    csv_content,
+    filename,
+    s3_client=None,
+    bucket=None,
+    key=None,
 ):
     """
-    Send an email with a narrative and CSV attachment.
+    Send an email with a narrative and the CSV report.
+
+    The report is attached compressed (see REPORT_ATTACHMENT_COMPRESSION).
+    When the compressed report is larger than REPORT_ATTACHMENT_MAX_BYTES it
+    is not attached; if s3_client, bucket and key locate the stored report, the
+    email carries a presigned download link instead. The email is sent either way.
     """
-    print(f"Preparing to send email to {recipient_email} with report attachment")
+    logger.info("Preparing to send email to %s with report attachment", recipient_email)
+
+    attachment_data, attachment_name = compress_attachment(csv_content, filename)
+    download_link, link_lifetime = None, 0
+    if len(attachment_data) > MAX_ATTACHMENT_BYTES:
+        logger.warning(
+            "Compressed report is %s bytes, over the %s byte attachment limit"
+            " - sending a link instead",
+            len(attachment_data),
+            MAX_ATTACHMENT_BYTES,
+        )
+        attachment_data = None
+        if s3_client and bucket and key:
+            download_link, link_lifetime = report_download_link(s3_client, bucket, key)
+
+    if attachment_data is not None:
+        report_text = (
+            f"Please see the attached file {attachment_name} for detailed findings."
+        )
+        report_html = f"<p>{report_text}</p>\n"
+    elif download_link:
+        validity = describe_lifetime(link_lifetime)
+        report_text = (
+            "The detailed findings report is too large to attach. Download it "
+            f"here (link valid for {validity}):\n{download_link}"
+        )
+        report_html = (
+            "<p>The detailed findings report is too large to attach. "
+            f'<a href="{download_link}">Download the report</a> '
+            f"(link valid for {validity}).</p>\n"
+        )
+    else:
+        location = (
+            f" at s3://{bucket}/{key}" if bucket and key else " in the report bucket"
+        )
+        report_text = (
+            "The detailed findings report is too large to attach. It is stored"
+            f"{location}."
+        )
+        report_html = f"<p>{report_text}</p>\n"
 
     # Create a multipart/mixed parent container
     msg = email.mime.multipart.MIMEMultipart("mixed")
@@ -30,11 +208,7 @@ def send_email_with_attachment(
     formatted_narrative = narrative.replace("\n", "<br>")
 
     # Plain text version of the message
-    text_content = (
-        "AWS Access Review Report\n\n"
-        f"{narrative}\n\n"
-        "Please see the attached CSV file for detailed findings."
-    )
+    text_content = "AWS Access Review Report\n\n" f"{narrative}\n\n" f"{report_text}"
     text_part = email.mime.text.MIMEText(text_content, "plain")
 
     # HTML version of the message
@@ -44,7 +218,7 @@ def send_email_with_attachment(
         "<body>\n"
         "<h1>AWS Access Review Report</h1>\n"
         f"<p>{formatted_narrative}</p>\n"
-        "<p>Please see the attached CSV file for detailed findings.</p>\n"
+        f"{report_html}"
         "</body>\n"
         "</html>"
     )
@@ -57,67 +231,130 @@ def send_email_with_attachment(
     # Attach the multipart/alternative child container to the multipart/mixed parent
     msg.attach(msg_body)
 
-    # Create the attachment
-    attachment = email.mime.application.MIMEApplication(csv_content)
-    attachment.add_header("Content-Disposition", "attachment", filename=filename)
+    # Create the attachment, unless the report is only linked
+    if attachment_data is not None:
+        attachment = email.mime.application.MIMEApplication(attachment_data)
+        attachment.add_header(
+            "Content-Disposition", "attachment", filename=attachment_name
+        )
 
-    # Add the attachment to the message
-    msg.attach(attachment)
+        # Add the attachment to the message
+        msg.attach(attachment)
 
     try:
         # Convert the message to a string and send it
-        print("Attempting to send email via SES...")
+        logger.info("Attempting to send email via SES...")
         response = ses_client.send_raw_email(
             Source=recipient_email,
             Destinations=[recipient_email],
             RawMessage={"Data": msg.as_string()},
         )
-        print(f"Email sent successfully! Message ID: {response['MessageId']}")
+        logger.info("Email sent successfully! Message ID: %s", response["MessageId"])
         return True
     except Exception as e:
         error_msg = str(e)
-        print(f"Error sending email: {error_msg}")
+        logger.error("Error sending email: %s", error_msg)
         # Print SES verification status for debugging
         try:
             verification = ses_client.get_identity_verification_attributes(
                 Identities=[recipient_email]
             )
-            print(f"SES verification status: {verification}")
+            logger.info("SES verification status: %s", verification)
         except Exception as ve:
             error_msg = str(ve)
-            print(f"Error checking SES verification: {error_msg}")
+            logger.error("Error checking SES verification: %s", error_msg)
         return False
 
 
-def verify_email_for_ses(ses_client, email_address):
+def _load_verification_cache(s3_client, bucket):
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=VERIFICATION_CACHE_KEY)["Body"]
+        for address, verified_at in json.loads(body.read()).items():
+            _verified_at[address] = max(verified_at, _verified_at.get(address, 0))
+    except Exception as e:
+        # NoSuchKey is the normal first run; anything else is logged
+        if "NoSuchKey" not in str(e):
+            logger.error("Error reading SES verification cache: %s", e)
+
+
+def _save_verification_cache(s3_client, bucket):
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=VERIFICATION_CACHE_KEY,
+            Body=json.dumps(_verified_at),
+            ContentType="application/json",
+        )
+    except Exception as e:
+        logger.error("Error writing SES verification cache: %s", e)
+
+
+def check_verified_emails(ses_client, addresses, s3_client=None, bucket=None):
     """
-    Verify an email address with SES if it's not already verified.
+    Return the subset of addresses that are verified in SES.
+
+    Addresses seen verified within SES_VERIFICATION_CACHE_TTL_SECONDS are not
+    checked again. With an S3 client and bucket the cache is shared between
+    runs; the rest are checked in batches of 100 per SES call.
     """
-    print(f"Checking SES verification status for {email_address}")
+    now = time.time()
 
-    try:
-        # Get verification status
+    def _fresh():
+        return {
+            a
+            for a in addresses
+            if now - _verified_at.get(a, 0) < VERIFICATION_CACHE_TTL_SECONDS
+        }
+
+    verified = _fresh()
+    if len(verified) < len(addresses) and s3_client and bucket:
+        _load_verification_cache(s3_client, bucket)
+        verified = _fresh()
+
+    unknown = [a for a in addresses if a not in verified]
+    for start in range(0, len(unknown), VERIFICATION_BATCH):
         response = ses_client.get_identity_verification_attributes(
-            Identities=[email_address]
+            Identities=unknown[start : start + VERIFICATION_BATCH]
         )
-
-        # Check if the email is already verified
-        attributes = response.get("VerificationAttributes", {})
-        if email_address in attributes:
-            status = attributes[email_address].get("VerificationStatus")
+        for address, attributes in response.get("VerificationAttributes", {}).items():
+            status = attributes.get("VerificationStatus")
             if status == "Success":
-                print(f"Email {email_address} is already verified in SES")
-                return True
+                _verified_at[address] = now
+                verified.add(address)
             else:
-                print(f"Email {email_address} verification status: {status}")
+                logger.info("Email %s verification status: %s", address, status)
+
+    if unknown and verified.intersection(unknown) and s3_client and bucket:
+        _save_verification_cache(s3_client, bucket)
+    return verified
+
+
+def verify_email_for_ses(ses_client, email_address, s3_client=None, bucket=None):
+    """
+    Verify an email address with SES if it's not already verified.
+
+    With an S3 client and bucket, a verified status found by an earlier run is
+    reused instead of asking SES again.
+    """
+    logger.info("Checking SES verification status for %s", email_address)
+
+    try:
+        # Get verification status, from the cache when possible
+        if email_address in check_verified_emails(
+            ses_client, [email_address], s3_client, bucket
+        ):
+            logger.info("Email %s is already verified in SES", email_address)
+            return True
 
         # If not verified, send verification email
-        print(f"Sending verification email to {email_address}")
+        logger.info("Sending verification email to %s", email_address)
         ses_client.verify_email_identity(EmailAddress=email_address)
-        print(f"Verification email sent to {email_address}. Check inbox to verify.")
+        logger.info(
+            "Verification email sent to %s. Check inbox to verify.", email_address
+        )
 
         return False
     except Exception as e:
         error_msg = str(e)
-        print(f"Error verifying email with SES: {error_msg}")
+        logger.error("Error verifying email with SES: %s", error_msg)
         raise
@@ -0,0 +1,156 @@
+"""
+Module for aggregating AWS access review findings in a single pass.
+
+The Bedrock prompt and the local fallback narrative both need severity and
+category counts plus the most important findings. aggregate_findings() walks
+the findings once and keeps only bounded buffers for the "top" lists, so it
+works directly on a generator and costs O(n log k) for top-k lists. It can
+also keep one prompt line per finding, so the Bedrock path never has to walk
+the findings again.
+"""
+
+import heapq
+import itertools
+from operator import itemgetter
+
+# Severity levels, most severe first
+SEVERITY_LEVELS = ["Critical", "High", "Medium", "Low", "Informational"]
+SEVERITY_ORDER = {severity: rank for rank, severity in enumerate(SEVERITY_LEVELS)}
+
+
+def severity_rank(finding):
+    """Return the sort rank of a finding's severity (Critical first, unknown last)."""
+    return SEVERITY_ORDER.get(finding.get("severity", "Low"), 999)
+
+
+def format_finding(finding):
+    """Format one finding as a single prompt line."""
+    return (
+        f"- {finding.get('severity')}: {finding.get('description')} "
+        f"({finding.get('resource_type')}: {finding.get('resource_id')})"
+    )
+
+
+def is_positive_finding(finding):
+    """Return True for findings that record a security best practice being met."""
+    return (
+        finding.get("severity") == "Informational"
+        and "no " in finding.get("description", "").lower()
+    ) or "positive" in finding.get("id", "").lower()
+
+
+# Orders (rank, seq, finding) entries: most severe first, then earliest
+_entry_key = itemgetter(0, 1)
+
+
+class _TopK:
+    """
+    The k most severe findings seen so far, earliest first among equals.
+
+    Entries are buffered and cut back to the best k with heapq.nsmallest each
+    time the buffer reaches 2k, so many top-k lists can be built in the same
+    pass in O(k) memory each. With k=None every finding is kept.
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.entries = []
+
+    def add(self, rank, seq, finding):
+        if self.k == 0:
+            return
+        self.entries.append((rank, seq, finding))
+        if self.k is not None and len(self.entries) >= 2 * self.k:
+            self.entries = heapq.nsmallest(self.k, self.entries, key=_entry_key)
+
+    def items(self):
+        if self.k is None:
+            entries = sorted(self.entries, key=_entry_key)
+        else:
+            entries = heapq.nsmallest(self.k, self.entries, key=_entry_key)
+        return [finding for _, _, finding in entries]
+
+
+class FindingsSummary:
+    """Counts and top-k lists for a set of findings, built by aggregate_findings()."""
+
+    def __init__(self, top_k, key_issue_limit, positive_limit, keep_lines=False):
+        self.total = 0
+        self.severity_counts = {severity: 0 for severity in SEVERITY_LEVELS}
+        # Findings with no "severity" field; the fallback narrative counts them
+        # as Medium
+        self.missing_severity = 0
+        # Categories in the order they were first seen
+        self.category_counts = {}
+        self.key_issue_count = 0
+        self.positive_count = 0
+        self.positive_limit = positive_limit
+        self._top_k = top_k
+        self._top_by_category = {}
+        self._key_issues = _TopK(key_issue_limit)
+        self._positives = []
+        # (category, severity rank, prompt line) per finding, in input order
+        self.lines = [] if keep_lines else None
+
+    def add(self, seq, finding):
+        self.total += 1
+        severity = finding.get("severity")
+        if severity in self.severity_counts:
+            self.severity_counts[severity] += 1
+        elif "severity" not in finding:
+            self.missing_severity += 1
+
+        category = finding.get("category", "Other")
+        self.category_counts[category] = self.category_counts.get(category, 0) + 1
+
+        rank = severity_rank(finding)
+        if self.lines is not None:
+            self.lines.append((category, rank, format_finding(finding)))
+        if category not in self._top_by_category:
+            self._top_by_category[category] = _TopK(self._top_k)
+        self._top_by_category[category].add(rank, seq, finding)
+
+        if severity in ("Critical", "High"):
+            self.key_issue_count += 1
+            self._key_issues.add(rank, seq, finding)
+
+        if is_positive_finding(finding):
+            self.positive_count += 1
+            if len(self._positives) < self.positive_limit:
+                self._positives.append(finding)
+
+    def top_findings(self, category):
+        """Return the most severe findings of a category, most severe first."""
+        return self._top_by_category[category].items()
+
+    @property
+    def key_issues(self):
+        """The most severe Critical and High findings, most severe first."""
+        return self._key_issues.items()
+
+    @property
+    def positives(self):
+        """The first positive findings seen."""
+        return list(self._positives)
+
+
+def aggregate_findings(
+    findings, top_k=5, key_issue_limit=5, positive_limit=3, keep_lines=False
+):
+    """
+    Summarize findings in one pass.
+
+    Args:
+        findings: Iterable of finding dictionaries (a generator is fine)
+        top_k (int): Findings kept per category; None keeps them all
+        key_issue_limit (int): Critical and High findings kept for listing
+        positive_limit (int): Positive findings kept for listing
+        keep_lines (bool): Also keep every finding's prompt line in ``lines``
+
+    Returns:
+        FindingsSummary: Counts by severity and category, plus the top lists
+    """
+    summary = FindingsSummary(top_k, key_issue_limit, positive_limit, keep_lines)
+    for seq, finding in zip(itertools.count(), findings):
+        summary.add(seq, finding)
+    return summary
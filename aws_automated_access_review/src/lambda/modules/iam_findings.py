@@ -24,9 +24,20 @@ Last Updated: 2025-04-01
 """
 
 import datetime  # For calculating dates and creating timestamps
+import time  # For timing each check
 
+from modules.checkpoint import (  # Resumable runs
+    CollectorPaused,
+    pause_if_due,
+    sorted_after,
+)
+from utils.instrumentation import record_timing  # Per-check timing
+from utils.logging_setup import configure_logger, log_sampled  # Queued JSON logging
 
-def collect_iam_findings(iam):
+logger = configure_logger(__name__)
+
+
+def collect_iam_findings(iam, cursor=None, deadline=None):
     """
     Collect IAM-related security findings from an AWS account.
 
@@ -35,11 +46,19 @@ def collect_iam_findings(iam):
 
     Args:
         iam (boto3.client): A boto3 IAM client with appropriate permissions
+        cursor (dict): Where a paused run stopped, {"phase": "users" or "roles",
+                       "after": last name checked in that phase, or None};
+                       None starts from the top
+        deadline (float): time.monotonic() value at which to pause, or None
 
     Returns:
         list: A list of dictionaries, each representing a security finding with
               standardized fields for severity, description, remediation, etc.
 
+    Raises:
+        CollectorPaused: The deadline passed; carries the cursor to resume from
+                         and the findings collected so far
+
     Security Checks Performed:
         - Users with console access but no MFA (high severity)
         - Users with access keys older than 90 days (medium severity)
@@ -52,30 +71,42 @@ def collect_iam_findings(iam):
         - AWS Well-Architected Framework Security Pillar
     """
     findings = []
-    print("Collecting IAM findings...")
+    logger.info("Collecting IAM findings...")
 
-    try:
-        # Get all IAM users in the account
-        # IAM API returns paginated results, so we need to handle that
-        # by continuing to make calls until we get all users
-        print("  Retrieving all IAM users...")
-        response = iam.list_users()
-        users = response["Users"]  # Start with the first page of results
-
-        # If the results are truncated (more pages available), keep fetching
-        while response.get("IsTruncated", False):
-            response = iam.list_users(
-                Marker=response["Marker"]
-            )  # Get next page using marker
-            users.extend(response["Users"])  # Add these users to our list
+    # A resumed run skips the users (and roles) already checked. Principals are
+    # checked in name order and the cursor holds the last name checked, so users
+    # or roles created or deleted between invocations do not shift the position.
+    phase = (cursor or {}).get("phase", "users")
+    resume_after = (cursor or {}).get("after")
 
-        print(f"  Found {len(users)} IAM users")
+    try:
+        users = []
+        if phase == "users":
+            # Get all IAM users in the account
+            # IAM API returns paginated results, so we need to handle that
+            # by continuing to make calls until we get all users
+            logger.info("  Retrieving all IAM users...")
+            response = iam.list_users()
+            users = response["Users"]  # Start with the first page of results
+
+            # If the results are truncated (more pages available), keep fetching
+            while response.get("IsTruncated", False):
+                response = iam.list_users(
+                    Marker=response["Marker"]
+                )  # Get next page using marker
+                users.extend(response["Users"])  # Add these users to our list
+
+            logger.info("  Found %s IAM users", len(users))
 
         # Check each user for security issues
         # We perform multiple security checks on each user
-        print("  Starting security checks on each user...")
-        for user in users:
+        logger.info("  Starting security checks on each user...")
+        previous = resume_after if phase == "users" else None
+        for user in sorted_after(users, "UserName", previous):
             username = user["UserName"]
+            pause_if_due(deadline, {"phase": "users", "after": previous}, findings)
+            previous = username
+            started = time.perf_counter()
 
             # ==== CHECK 1: User has console access but no MFA ====
             # This is a critical security risk - console access should always require MFA
@@ -108,10 +139,15 @@ def collect_iam_findings(iam):
                             "detection_date": datetime.datetime.now().isoformat(),  # Detection time
                         }
                     )
-                    print(
-                        f"    FINDING: User {username} has console access without MFA"
+                    log_sampled(
+                        logger,
+                        "iam.console_without_mfa",
+                        "    FINDING: User %s has console access without MFA",
+                        username,
                     )
 
+            started = record_timing("iam.console_mfa", started)
+
             # ==== CHECK 2: Access keys older than 90 days ====
             # Access keys should be rotated regularly to limit the impact of compromised credentials
             keys_response = iam.list_access_keys(UserName=username)
@@ -147,10 +183,17 @@ def collect_iam_findings(iam):
                             "detection_date": datetime.datetime.now().isoformat(),
                         }
                     )
-                    print(
-                        f"    FINDING: Access key {key_id} for {username} is {key_age_days} days"
+                    log_sampled(
+                        logger,
+                        "iam.old_access_key",
+                        "    FINDING: Access key %s for %s is %s days",
+                        key_id,
+                        username,
+                        key_age_days,
                     )
 
+            started = record_timing("iam.access_key_age", started)
+
             # ==== CHECK 3: Users with wide administrative permissions ====
             # Following the principle of least privilege, users should only have permissions
             # necessary for their job function. Administrator access should be limited.
@@ -182,14 +225,21 @@ def collect_iam_findings(iam):
                             "detection_date": datetime.datetime.now().isoformat(),
                         }
                     )
-                    print(
-                        f"    FINDING: User {username} has admin policy: {policy['PolicyName']}"
+                    log_sampled(
+                        logger,
+                        "iam.admin_policy",
+                        "    FINDING: User %s has admin policy: %s",
+                        username,
+                        policy["PolicyName"],
                     )
 
+            record_timing("iam.admin_policies", started)
+
         # ==== CHECK 4: Unused IAM roles ====
         # Unused roles should be removed to reduce the attack surface
         # First, retrieve all roles in the account (handling pagination)
-        print("  Retrieving all IAM roles...")
+        started = time.perf_counter()
+        logger.info("  Retrieving all IAM roles...")
         response = iam.list_roles()
         roles = response["Roles"]  # Start with the first page of results
 
@@ -198,12 +248,15 @@ def collect_iam_findings(iam):
             response = iam.list_roles(Marker=response["Marker"])
             roles.extend(response["Roles"])
 
-        print(f"  Found {len(roles)} IAM roles")
-        print("  Checking for unused roles...")
+        logger.info("  Found %s IAM roles", len(roles))
+        logger.info("  Checking for unused roles...")
 
         # Examine each role to see if it's been used
-        for role in roles:
+        previous = resume_after if phase == "roles" else None
+        for role in sorted_after(roles, "RoleName", previous):
             role_name = role["RoleName"]
+            pause_if_due(deadline, {"phase": "roles", "after": previous}, findings)
+            previous = role_name
 
             # Skip AWS service-linked roles
             # These are managed by AWS services and shouldn't be removed manually
@@ -235,12 +288,20 @@ def collect_iam_findings(iam):
                             "detection_date": datetime.datetime.now().isoformat(),
                         }
                     )
-                    print(f"    FINDING: Role {role_name} appears to be unused")
+                    log_sampled(
+                        logger,
+                        "iam.unused_role",
+                        "    FINDING: Role %s appears to be unused",
+                        role_name,
+                    )
+
+        record_timing("iam.unused_roles", started)
 
         # ==== CHECK 5: Account password policy ====
         # The account should have a strong password policy that meets industry standards
         # This applies to all IAM users who can log in to the AWS Management Console
-        print("  Checking account password policy...")
+        logger.info("  Checking account password policy...")
+        started = time.perf_counter()
         try:
             # Retrieve the current password policy for the account
             password_policy = iam.get_account_password_policy()["PasswordPolicy"]
@@ -276,7 +337,7 @@ def collect_iam_findings(iam):
                         "detection_date": datetime.datetime.now().isoformat(),
                     }
                 )
-                print(
+                logger.info(
                     "    FINDING: Password policy does not meet security best practices"
                 )
 
@@ -296,8 +357,12 @@ def collect_iam_findings(iam):
                     "detection_date": datetime.datetime.now().isoformat(),
                 }
             )
-            print("    FINDING: No password policy is set for the account")
+            logger.info("    FINDING: No password policy is set for the account")
+        record_timing("iam.password_policy", started)
 
+    except CollectorPaused:
+        # Not an error: the handler saves the cursor and resumes later
+        raise
     except Exception as e:
         # Global error handling for the entire module
         # If something goes wrong with IAM checks, we still want to:
@@ -305,12 +370,12 @@ def collect_iam_findings(iam):
         # 2. Create a finding so it's visible in the report
         # 3. Continue with the rest of the security checks
         error_msg = str(e)
-        print(f"Error collecting IAM findings: {error_msg}")
+        logger.error("Error collecting IAM findings: %s", error_msg)
 
         # Include a stack trace for better debugging
         import traceback
 
-        print(f"Error stack trace: {traceback.format_exc()}")
+        logger.error("Error stack trace: %s", traceback.format_exc())
 
         # Add an error finding so it appears in the report
         findings.append(
@@ -330,5 +395,5 @@ def collect_iam_findings(iam):
         )
 
     # Module complete - report findings count for logging
-    print(f"Collected {len(findings)} IAM findings")
+    logger.info("Collected %s IAM findings", len(findings))
     return findings  # Return all collected findings to the main handler
@@ -4,92 +4,90 @@ Module for generating narrative summaries of AWS access review findings.
 
 import datetime
 
+from modules.findings_aggregation import aggregate_findings
+from utils.logging_setup import configure_logger
 
-def generate_ai_narrative(bedrock, findings):
+logger = configure_logger(__name__)
+
+
+def generate_ai_narrative(bedrock, findings, s3=None, bucket=None, context=None):
     """
     Generate a narrative summary of findings using Amazon Bedrock.
     Uses AI to create a comprehensive analysis of security findings.
+
+    When an S3 client and bucket are given, narratives are cached there and
+    reused by later runs with unchanged findings. With the Lambda context the
+    narrative is streamed and cut short in time to leave room for the email.
+
+    The findings are aggregated once; the counts and prompt lines are shared
+    by the Bedrock path and the local fallback.
     """
-    print("Generating AI narrative summary using Amazon Bedrock...")
+    logger.info("Generating AI narrative summary using Amazon Bedrock...")
+    summary = aggregate_findings(findings, keep_lines=True)
 
     try:
         # Import from bedrock_integration.py
-        from bedrock_integration import get_ai_analysis
+        from bedrock_integration import (
+            NarrativeCache,
+            deadline_from_context,
+            get_ai_analysis,
+        )
+
+        cache = NarrativeCache(s3, bucket) if s3 and bucket else None
 
         # If the import succeeded, use the real function
-        return get_ai_analysis(bedrock, findings)
+        return get_ai_analysis(
+            bedrock,
+            findings,
+            cache=cache,
+            deadline=deadline_from_context(context),
+            summary=summary,
+        )
     except Exception as e:
         error_msg = str(e)
-        print(f"Error using Bedrock integration: {error_msg}")
-        print("Falling back to local narrative generation")
+        logger.error("Error using Bedrock integration: %s", error_msg)
+        logger.info("Falling back to local narrative generation")
 
         # Fall back to a locally generated narrative if Bedrock fails
-        return generate_fallback_narrative(findings)
+        return generate_fallback_narrative(findings, summary)
 
 
-def generate_fallback_narrative(findings):
+def generate_fallback_narrative(findings, summary=None):
     """
     Generate a basic narrative summary without using AI services.
     Used as a fallback when Bedrock is unavailable.
+
+    Pass ``summary`` (from aggregate_findings) to avoid walking the findings again.
     """
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Count findings by severity
-    severity_counts = {
-        "Critical": 0,
-        "High": 0,
-        "Medium": 0,
-        "Low": 0,
-        "Informational": 0,
-    }
-
-    # Count findings by category
-    category_counts = {}
-
-    # Track key issues
-    key_issues = []
-    positives = []
-
-    for finding in findings:
-        # Count by severity
-        severity = finding.get("severity", "Medium")
-        if severity in severity_counts:
-            severity_counts[severity] += 1
-
-        # Count by category
-        category = finding.get("category", "Other")
-        if category not in category_counts:
-            category_counts[category] = 0
-        category_counts[category] += 1
-
-        # Track critical and high findings as key issues
-        if severity in ["Critical", "High"]:
-            key_issues.append(
-                f"- {finding.get('description')} "
-                f"({finding.get('resource_type')}: {finding.get('resource_id')})"
-            )
-
-        # Track positive findings
-        if (
-            severity == "Informational"
-            and "no " in finding.get("description", "").lower()
-            or "positive" in finding.get("id", "").lower()
-        ):
-            positives.append(f"- {finding.get('description')}")
+    if summary is None:
+        summary = aggregate_findings(findings)
+    # Findings without a severity are reported as Medium
+    severity_counts = dict(summary.severity_counts)
+    severity_counts["Medium"] += summary.missing_severity
 
     # Sort categories by count
     sorted_categories = sorted(
-        category_counts.items(), key=lambda x: x[1], reverse=True
+        summary.category_counts.items(), key=lambda x: x[1], reverse=True
     )
 
+    # Most severe Critical and High findings first
+    key_issues = [
+        f"- {finding.get('description')} "
+        f"({finding.get('resource_type')}: {finding.get('resource_id')})"
+        for finding in summary.key_issues
+    ]
+    positives = [f"- {finding.get('description')}" for finding in summary.positives]
+
     # Build the narrative
     narrative = (
         f"\nAWS Access Review Report - {timestamp}\n\n"
         "EXECUTIVE SUMMARY\n"
         "This automated security review has analyzed your AWS environment across "
-        f"multiple security dimensions and identified {len(findings)} findings.\n\n"
+        f"multiple security dimensions and identified {summary.total} findings.\n\n"
         "FINDINGS SUMMARY\n"
-        f"Total findings: {len(findings)}\n"
+        f"Total findings: {summary.total}\n"
         f"Critical: {severity_counts['Critical']} - Requires immediate attention\n"
         f"High: {severity_counts['High']} - Should be addressed soon\n"
         f"Medium: {severity_counts['Medium']} - Should be planned for remediation\n"
@@ -105,22 +103,25 @@ def generate_fallback_narrative(findings):
         narrative += (
             "\nKEY ISSUES REQUIRING ATTENTION\n"
             "The following critical or high severity issues were identified:\n"
-            f"{chr(10).join(key_issues[:5])}\n"
+            f"{chr(10).join(key_issues)}\n"
         )
-        if len(key_issues) > 5:
+        if summary.key_issue_count > len(key_issues):
             narrative += (
-                f"...and {len(key_issues) - 5} more critical or high severity "
-                "issues.\n"
+                f"...and {summary.key_issue_count - len(key_issues)} more critical "
+                "or high severity issues.\n"
             )
 
     if positives:
         narrative += (
             "\nPOSITIVE SECURITY FINDINGS\n"
             "The following security best practices were detected:\n"
-            f"{chr(10).join(positives[:3])}\n"
+            f"{chr(10).join(positives)}\n"
         )
-        if len(positives) > 3:
-            narrative += f"...and {len(positives) - 3} more positive findings.\n"
+        if summary.positive_count > len(positives):
+            narrative += (
+                f"...and {summary.positive_count - len(positives)} more positive "
+                "findings.\n"
+            )
 
     narrative += (
         "\nRECOMMENDATIONS\n"
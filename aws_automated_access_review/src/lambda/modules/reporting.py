@@ -3,8 +3,12 @@ Module for generating AWS access review reports in various formats.
 """
 
 import csv
-import io
 import datetime
+import io
+
+from utils.logging_setup import configure_logger
+
+logger = configure_logger(__name__)
 
 
 def generate_csv_report(findings):
@@ -17,7 +21,7 @@ def generate_csv_report(findings):
     Returns:
         A tuple of (csv_content_string, filename)
     """
-    print("Generating CSV report...")
+    logger.info("Generating CSV report...")
 
     # Create an in-memory CSV file
     csv_buffer = io.StringIO()
@@ -62,7 +66,7 @@ def upload_to_s3(s3_client, bucket, content, key, content_type="text/csv"):
     Returns:
         S3 URL of the uploaded content
     """
-    print(f"Uploading report to S3 bucket {bucket} with key {key}")
+    logger.info("Uploading report to S3 bucket %s with key %s", bucket, key)
 
     try:
         s3_client.put_object(
@@ -74,10 +78,10 @@ def upload_to_s3(s3_client, bucket, content, key, content_type="text/csv"):
 
         # Generate S3 URL
         s3_url = f"s3://{bucket}/{key}"
-        print(f"Successfully uploaded to {s3_url}")
+        logger.info("Successfully uploaded to %s", s3_url)
 
         return s3_url
     except Exception as e:
         error_msg = str(e)
-        print(f"Error uploading to S3: {error_msg}")
+        logger.error("Error uploading to S3: %s", error_msg)
         raise
@@ -2,17 +2,35 @@
 Module for collecting AWS Organizations Service Control Policy (SCP) findings.
 """
 
-import json
 import datetime
+import json
+
+from modules.checkpoint import CollectorPaused, pause_if_due, sorted_after
+from utils.logging_setup import configure_logger
+
+logger = configure_logger(__name__)
 
 
-def collect_scp_findings(org):
+def collect_scp_findings(org, cursor=None, deadline=None):
     """
     Collect SCP-related security findings.
     Analyzes Service Control Policies for potential security gaps.
+
+    Args:
+        org (boto3.client): A boto3 Organizations client
+        cursor (dict): Where a paused run stopped, {"after": last policy ID
+                       analyzed, "found": findings collected so far}; None
+                       starts from the first policy
+        deadline (float): time.monotonic() value at which to pause, or None
+
+    Raises:
+        CollectorPaused: The deadline passed between two policies
     """
     findings = []
-    print("Collecting AWS Organizations SCP findings...")
+    logger.info("Collecting AWS Organizations SCP findings...")
+    # Findings from before a pause were saved with the checkpoint
+    found = (cursor or {}).get("found", 0)
+    previous = (cursor or {}).get("after")
 
     try:
         # Check if Organizations is in use
@@ -53,8 +71,9 @@ def collect_scp_findings(org):
         for page in policy_pages:
             policies.extend(page.get("Policies", []))
 
-        # If there are no SCPs (beyond the default FullAWSAccess), flag it
-        if len(policies) <= 1:
+        # If there are no SCPs (beyond the default FullAWSAccess), flag it;
+        # a resumed run flagged it before pausing
+        if len(policies) <= 1 and cursor is None:
             findings.append(
                 {
                     "id": "SCP-001",
@@ -72,8 +91,12 @@ def collect_scp_findings(org):
                 }
             )
 
-        # Analyze each policy
-        for policy in policies:
+        # Analyze each policy, in ID order
+        for policy in sorted_after(policies, "Id", previous):
+            pause_if_due(
+                deadline, {"after": previous, "found": found + len(findings)}, findings
+            )
+            previous = policy["Id"]
             policy_id = policy["Id"]
             policy_name = policy["Name"]
 
@@ -178,7 +201,7 @@ def collect_scp_findings(org):
                 )
 
         # If we've analyzed SCPs but found no issues, add a positive note
-        if policies and len(findings) == 0:
+        if policies and found + len(findings) == 0:
             findings.append(
                 {
                     "id": "SCP-POSITIVE-001",
@@ -195,9 +218,12 @@ def collect_scp_findings(org):
                 }
             )
 
+    except CollectorPaused:
+        # Not an error: the handler saves the cursor and resumes later
+        raise
     except Exception as e:
         error_msg = str(e)
-        print(f"Error collecting SCP findings: {error_msg}")
+        logger.error("Error collecting SCP findings: %s", error_msg)
         findings.append(
             {
                 "id": "SCP-ERROR",
@@ -215,5 +241,5 @@ def collect_scp_findings(org):
             }
         )
 
-    print(f"Collected {len(findings)} SCP findings")
+    logger.info("Collected %s SCP findings", len(findings))
     return findings
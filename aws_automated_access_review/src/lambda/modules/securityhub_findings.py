@@ -4,14 +4,31 @@ Module for collecting AWS Security Hub findings.
 
 import datetime
 
+from modules.checkpoint import CollectorPaused, pause_if_due, resumable_pages
+from utils.logging_setup import configure_logger
 
-def collect_securityhub_findings(securityhub):
+logger = configure_logger(__name__)
+
+
+def collect_securityhub_findings(securityhub, cursor=None, deadline=None):
     """
     Collect IAM-related findings from Security Hub.
     Focuses on high and critical findings related to identity and access management.
+
+    Args:
+        securityhub (boto3.client): A boto3 Security Hub client
+        cursor (dict): Where a paused run stopped, {"starting_token": paginator
+                       token of the next page, "found": findings collected
+                       before it}; None starts from the first page
+        deadline (float): time.monotonic() value at which to pause, or None
+
+    Raises:
+        CollectorPaused: The deadline passed between two pages
     """
     findings = []
-    print("Collecting AWS Security Hub findings...")
+    logger.info("Collecting AWS Security Hub findings...")
+    # Findings from before a pause were saved with the checkpoint
+    found = (cursor or {}).get("found", 0)
 
     try:
         # Check if Security Hub is enabled by retrieving enabled standards
@@ -52,11 +69,13 @@ def collect_securityhub_findings(securityhub):
             "ResourceType": [{"Value": "AwsIam", "Comparison": "PREFIX"}],
         }
 
-        # Get findings pages
-        findings_pages = paginator.paginate(Filters=filters)
+        # Get findings pages, from where a paused run stopped
+        findings_pages = resumable_pages(
+            paginator, (cursor or {}).get("starting_token"), Filters=filters
+        )
 
         # Process findings
-        for page in findings_pages:
+        for page, resume_token in findings_pages:
             for finding in page.get("Findings", [])[:50]:  # Limit to first 50
                 findings.append(
                     {
@@ -75,9 +94,15 @@ def collect_securityhub_findings(securityhub):
                         "detection_date": finding.get("FirstObservedAt", ""),
                     }
                 )
+            if resume_token:
+                pause_if_due(
+                    deadline,
+                    {"starting_token": resume_token, "found": found + len(findings)},
+                    findings,
+                )
 
         # If no findings detected, add a positive note
-        if not findings:
+        if not found and not findings:
             findings.append(
                 {
                     "id": "SECHUB-POSITIVE-001",
@@ -92,9 +117,12 @@ def collect_securityhub_findings(securityhub):
                 }
             )
 
+    except CollectorPaused:
+        # Not an error: the handler saves the cursor and resumes later
+        raise
     except Exception as e:
         error_msg = str(e)
-        print(f"Error collecting Security Hub findings: {error_msg}")
+        logger.error("Error collecting Security Hub findings: %s", error_msg)
         findings.append(
             {
                 "id": "SECHUB-ERROR",
@@ -109,5 +137,5 @@ def collect_securityhub_findings(securityhub):
             }
         )
 
-    print(f"Collected {len(findings)} Security Hub findings")
+    logger.info("Collected %s Security Hub findings", len(findings))
     return findings
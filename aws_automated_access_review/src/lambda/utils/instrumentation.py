@@ -0,0 +1,261 @@
+"""Per-run timing and AWS API call statistics.
+
+Boto3 clients passed to ``instrument_client`` report every API call through
+botocore's event system: calls, errors, retries, throttled attempts and
+latency are counted per service and operation, and per collector while a
+``collector_timer`` block is active. Collectors record the time spent in
+each check with ``record_timing``.
+
+``metrics_snapshot`` returns the numbers as a JSON-ready dictionary for the
+handler response; ``emit_emf`` writes them as CloudWatch Embedded Metric
+Format documents, which CloudWatch turns into metrics without any API calls.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "AWSAccessReview")
+METRICS_EMF = os.getenv("METRICS_EMF", "true").lower() == "true"
+
+THROTTLE_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "ProvisionedThroughputExceededException",
+    "SlowDown",
+}
+
+_START_KEY = "instrumentation_started"
+
+_lock = threading.Lock()
+_api: Dict[str, Dict[str, float]] = {}
+_collectors: Dict[str, Dict[str, float]] = {}
+_checks: Dict[str, Dict[str, float]] = {}
+_current_collector: Optional[str] = None
+_run_started = time.perf_counter()
+
+
+def start_run() -> None:
+    """Forget the previous invocation's numbers."""
+    global _current_collector, _run_started
+    with _lock:
+        _api.clear()
+        _collectors.clear()
+        _checks.clear()
+        _current_collector = None
+        _run_started = time.perf_counter()
+
+
+def _api_entry(key: str) -> Dict[str, float]:
+    entry = _api.get(key)
+    if entry is None:
+        entry = _api[key] = {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "throttles": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+        }
+    return entry
+
+
+def _operation_key(event_name: str) -> str:
+    # "after-call.iam.ListUsers" -> "iam.ListUsers"
+    return event_name.split(".", 1)[1]
+
+
+def _before_call(context=None, **kwargs) -> None:
+    if context is not None:
+        context[_START_KEY] = time.perf_counter()
+
+
+def _finish_call(event_name: str, context, error: bool) -> None:
+    started = (context or {}).get(_START_KEY)
+    elapsed_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+    with _lock:
+        entry = _api_entry(_operation_key(event_name))
+        entry["calls"] += 1
+        entry["errors"] += int(error)
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        if _current_collector is not None:
+            collector = _collectors.setdefault(
+                _current_collector, {"duration_ms": 0.0, "api_calls": 0, "errors": 0}
+            )
+            collector["api_calls"] += 1
+            collector["errors"] += int(error)
+
+
+def _after_call(http_response=None, parsed=None, context=None, **kwargs) -> None:
+    parsed = parsed or {}
+    error = "Error" in parsed or (
+        http_response is not None and http_response.status_code >= 400
+    )
+    retries = parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+    _finish_call(kwargs["event_name"], context, error)
+    if retries:
+        with _lock:
+            _api_entry(_operation_key(kwargs["event_name"]))["retries"] += retries
+
+
+def _after_call_error(context=None, **kwargs) -> None:
+    # Raised before a response was parsed, e.g. a connection error
+    _finish_call(kwargs["event_name"], context, True)
+
+
+def _needs_retry(response=None, **kwargs) -> None:
+    # Fires once per attempt, so throttled attempts that later succeed count too
+    if not response:
+        return None
+    code = (response[1] or {}).get("Error", {}).get("Code")
+    if code in THROTTLE_CODES:
+        with _lock:
+            _api_entry(_operation_key(kwargs["event_name"]))["throttles"] += 1
+    return None
+
+
+def instrument_client(client: Any) -> Any:
+    """Register the call statistics handlers on a boto3 client and return it."""
+    events = client.meta.events
+    events.register("before-call", _before_call)
+    events.register("after-call", _after_call)
+    events.register("after-call-error", _after_call_error)
+    events.register("needs-retry", _needs_retry)
+    return client
+
+
+@contextmanager
+def collector_timer(name: str):
+    """Time a collector and attribute the API calls made meanwhile to it."""
+    global _current_collector
+    previous = _current_collector
+    started = time.perf_counter()
+    with _lock:
+        _current_collector = name
+        _collectors.setdefault(name, {"duration_ms": 0.0, "api_calls": 0, "errors": 0})
+    try:
+        yield
+    finally:
+        with _lock:
+            _collectors[name]["duration_ms"] += (time.perf_counter() - started) * 1000
+            _current_collector = previous
+
+
+def record_timing(name: str, started: float) -> float:
+    """Add the time since ``started`` (a perf_counter value) to check ``name``.
+
+    Returns the current perf_counter value, so consecutive checks can be
+    timed with ``started = record_timing("check", started)``.
+    """
+    now = time.perf_counter()
+    with _lock:
+        entry = _checks.setdefault(name, {"count": 0, "total_ms": 0.0})
+        entry["count"] += 1
+        entry["total_ms"] += (now - started) * 1000
+    return now
+
+
+def _rounded(table: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    return {
+        key: {
+            field: round(value, 1) if isinstance(value, float) else value
+            for field, value in values.items()
+        }
+        for key, values in sorted(table.items())
+    }
+
+
+def metrics_snapshot() -> Dict[str, Any]:
+    """Return this run's numbers so far as a JSON-ready dictionary."""
+    with _lock:
+        api = _rounded(_api)
+        return {
+            "duration_ms": round((time.perf_counter() - _run_started) * 1000, 1),
+            "api_calls": sum(entry["calls"] for entry in api.values()),
+            "collectors": _rounded(_collectors),
+            "checks": _rounded(_checks),
+            "api": api,
+        }
+
+
+def _emf_document(dimensions: Dict[str, str], metrics: Dict[str, tuple]) -> str:
+    document = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [
+                        {"Name": name, "Unit": unit}
+                        for name, (_, unit) in metrics.items()
+                    ],
+                }
+            ],
+        }
+    }
+    document.update(dimensions)
+    document.update({name: value for name, (value, _) in metrics.items()})
+    return json.dumps(document)
+
+
+def emit_emf(snapshot: Optional[Dict[str, Any]] = None, stream=None) -> None:
+    """Write the run's metrics to stdout as CloudWatch EMF documents.
+
+    EMF needs one document per set of dimension values, so there is one per
+    collector, one per API operation and one for the whole run.
+    """
+    if not METRICS_EMF:
+        return
+    snapshot = snapshot or metrics_snapshot()
+    lines = [
+        _emf_document(
+            {"Run": "AccessReview"},
+            {
+                "Duration": (snapshot["duration_ms"], "Milliseconds"),
+                "ApiCalls": (snapshot["api_calls"], "Count"),
+            },
+        )
+    ]
+    for name, values in snapshot["collectors"].items():
+        lines.append(
+            _emf_document(
+                {"Collector": name},
+                {
+                    "Duration": (values["duration_ms"], "Milliseconds"),
+                    "ApiCalls": (values["api_calls"], "Count"),
+                    "ApiErrors": (values["errors"], "Count"),
+                },
+            )
+        )
+    for key, values in snapshot["api"].items():
+        service, operation = key.split(".", 1)
+        lines.append(
+            _emf_document(
+                {"Service": service, "Operation": operation},
+                {
+                    "Calls": (values["calls"], "Count"),
+                    "Errors": (values["errors"], "Count"),
+                    "Retries": (values["retries"], "Count"),
+                    "Throttles": (values["throttles"], "Count"),
+                    "Latency": (
+                        round(values["total_ms"] / max(values["calls"], 1), 1),
+                        "Milliseconds",
+                    ),
+                    "MaxLatency": (values["max_ms"], "Milliseconds"),
+                },
+            )
+        )
+    stream = stream or sys.stdout
+    stream.write("\n".join(lines) + "\n")
+    stream.flush()
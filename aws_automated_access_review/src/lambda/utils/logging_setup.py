@@ -1,7 +1,28 @@
-import logging
+import atexit
 import json
+import logging
+import logging.handlers
 import os
-from typing import Optional
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Per-finding lines: the first LOG_SAMPLE_FIRST of each kind are logged, then
+# one in LOG_SAMPLE_EVERY. At DEBUG level every line is logged.
+LOG_SAMPLE_FIRST = int(os.getenv("LOG_SAMPLE_FIRST", "5"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+# Formatted records written to stdout in one call
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "50"))
+
+# Fields added to every record (account, region, collector, ...). Replaced,
+# never mutated, so records can share it without copying.
+_context: Dict[str, str] = {}
+
+_listener: Optional["_BatchingQueueListener"] = None
+_sample_counts: Dict[str, int] = {}
+_sample_lock = threading.Lock()
 
 
 class _JsonFormatter(logging.Formatter):
@@ -14,25 +35,181 @@ class _JsonFormatter(logging.Formatter):
             "module": record.name,
             "message": record.getMessage(),
         }
-        return json.dumps(log_record)
+        log_record.update(getattr(record, "context", {}))
+        if record.exc_info:
+            log_record["exception"] = self.formatException(record.exc_info)
+        return json.dumps(log_record, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    """Attach the current structured context to each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.context = _context
+        return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records as they are; the listener thread formats them.
+
+    The stock QueueHandler formats the message on the calling thread. Here
+    only the record is queued, so %-style arguments are rendered on the
+    listener thread. Pass arguments that will not change after the call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _BatchingStreamHandler(logging.StreamHandler):
+    """Buffer formatted records and write them to the stream together.
+
+    Without a stream, each batch goes to whatever ``sys.stdout`` is when it
+    is written, so a replaced or closed stdout is never kept around.
+    """
+
+    def __init__(self, stream=None, batch_size: int = LOG_BATCH_SIZE):
+        super().__init__(stream)
+        self.follow_stdout = stream is None
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if self.follow_stdout:
+                self.stream = sys.stdout
+            if self.buffer:
+                self.stream.write("\n".join(self.buffer) + self.terminator)
+                self.buffer = []
+            super().flush()
+        finally:
+            self.release()
+
+
+class _BatchingQueueListener(logging.handlers.QueueListener):
+    """Flush the batching handlers whenever the queue runs dry."""
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        if block and self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+        return self.queue.get(block)
 
 
 def configure_logger(name: Optional[str] = None) -> logging.Logger:
     """Return a logger configured for JSON output.
 
     The root logger is configured the first time this is called; subsequent
-    calls simply return ``logging.getLogger(name)``.
+    calls simply return ``logging.getLogger(name)``. Records are put on a
+    queue and formatted and written by a background listener thread, so
+    logging does not slow down the code that logs.
+
+    Handlers already on the root logger are replaced: the Lambda Python
+    runtime installs one before the function code is imported, and records
+    it wrote directly would bypass the context fields and the batching.
     """
 
     logger = logging.getLogger(name)
 
     # Configure root logger only once
+    global _listener
     root_logger = logging.getLogger()
-    if not root_logger.handlers:
+    if _listener is None:
         level = os.getenv("LOG_LEVEL", "INFO").upper()
-        handler = logging.StreamHandler()
-        handler.setFormatter(_JsonFormatter())
+        output = _BatchingStreamHandler()
+        output.setFormatter(_JsonFormatter())
+
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        handler = _DeferredQueueHandler(log_queue)
+        handler.addFilter(_ContextFilter())
+        for existing in list(root_logger.handlers):
+            root_logger.removeHandler(existing)
         root_logger.addHandler(handler)
         root_logger.setLevel(level)
 
+        _listener = _BatchingQueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(flush_logs)
+
     return logger
+
+
+def flush_logs() -> None:
+    """Write out every queued record.
+
+    Call this before the Lambda handler returns: the execution environment
+    is frozen afterwards and queued records would otherwise be delayed or lost.
+    """
+    if _listener is None or _listener._thread is None:
+        return
+    # stop() drains the queue and joins the thread; the listener is restarted
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.flush()
+    _listener.start()
+
+
+def set_log_context(**fields: Optional[str]) -> None:
+    """Add fields (account, region, ...) to every following record.
+
+    A field set to None is removed.
+    """
+    global _context
+    context = dict(_context)
+    for key, value in fields.items():
+        if value is None:
+            context.pop(key, None)
+        else:
+            context[key] = value
+    _context = context
+
+
+@contextmanager
+def log_context(**fields: str):
+    """Add fields to every record logged inside the ``with`` block."""
+    global _context
+    previous = _context
+    set_log_context(**fields)
+    try:
+        yield
+    finally:
+        _context = previous
+
+
+def reset_log_sampling() -> None:
+    """Start sampling afresh, e.g. at the start of each invocation."""
+    with _sample_lock:
+        _sample_counts.clear()
+
+
+def log_sampled(logger: logging.Logger, key: str, msg: str, *args) -> None:
+    """Log a per-finding line at INFO, sampled per ``key``.
+
+    The first LOG_SAMPLE_FIRST lines of each key are logged, then one in
+    LOG_SAMPLE_EVERY, with a count of the lines skipped. When DEBUG is
+    enabled every line is logged. Nothing is formatted for skipped lines.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(msg, *args)
+        return
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    with _sample_lock:
+        seen = _sample_counts.get(key, 0) + 1
+        _sample_counts[key] = seen
+    if seen <= LOG_SAMPLE_FIRST:
+        logger.info(msg, *args)
+    elif LOG_SAMPLE_EVERY > 0 and (seen - LOG_SAMPLE_FIRST) % LOG_SAMPLE_EVERY == 0:
+        logger.info(
+            msg + " (%d similar lines sampled out)", *args, LOG_SAMPLE_EVERY - 1
+        )
@@ -4,6 +4,8 @@ import sys
 import unittest
 from unittest.mock import patch, MagicMock
 
+from botocore.exceptions import ClientError
+
 # Add the lambda directory to the path
 sys.path.insert(
     0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src/lambda"))
@@ -140,3 +142,397 @@ class TestGenerateNarrative(unittest.TestCase):
         self.assertEqual(narrative, "This is a test narrative.")
         mock_boto3_client.assert_called_once_with("bedrock-runtime")
         mock_get_ai_analysis.assert_called_once_with(mock_bedrock, findings)
+
+
+def _make_findings(count):
+    severities = ["Critical", "High", "Medium", "Low", "Informational"]
+    return [
+        {
+            "id": f"finding{i}",
+            "category": "IAM" if i % 2 else "S3",
+            "severity": severities[i % len(severities)],
+            "resource_type": "AWS::IAM::Role",
+            "resource_id": f"role{i}",
+            "description": "Role trusts an external account without an external ID",
+        }
+        for i in range(count)
+    ]
+
+
+def _completion_client(text="Partial summary."):
+    client = MagicMock()
+    client.invoke_model.side_effect = lambda **_kwargs: {
+        "body": MagicMock(read=MagicMock(return_value=json.dumps({"completion": text})))
+    }
+    client.invoke_model_with_response_stream.side_effect = lambda **_kwargs: {
+        "body": _stream_events([text], stop_reason="stop_sequence")
+    }
+    client.converse.side_effect = lambda **_kwargs: {
+        "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+        "stopReason": "end_turn",
+        "usage": {"inputTokens": 100, "outputTokens": 20},
+    }
+    client.converse_stream.side_effect = lambda **_kwargs: {
+        "stream": [
+            {"messageStart": {"role": "assistant"}},
+            {"contentBlockDelta": {"delta": {"text": text}}},
+            {"messageStop": {"stopReason": "end_turn"}},
+            {"metadata": {"usage": {"inputTokens": 100, "outputTokens": 20}}},
+        ]
+    }
+    return client
+
+
+def _stream_events(pieces, stop_reason=None):
+    """Return response stream events carrying ``pieces`` of a completion."""
+    events = [
+        {"chunk": {"bytes": json.dumps({"completion": piece, "stop_reason": None})}}
+        for piece in pieces
+    ]
+    if stop_reason:
+        events.append(
+            {
+                "chunk": {
+                    "bytes": json.dumps({"completion": "", "stop_reason": stop_reason})
+                }
+            }
+        )
+    return events
+
+
+class TestMapReduceNarrative(unittest.TestCase):
+    """Test the chunked map-reduce narrative pipeline."""
+
+    def test_chunk_findings_covers_every_finding_within_budget(self):
+        findings = _make_findings(500)
+        chunks = bedrock_integration.chunk_findings(findings, max_tokens=500)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 500)
+        for chunk in chunks:
+            tokens = sum(bedrock_integration.estimate_tokens(line) for line in chunk)
+            self.assertLessEqual(tokens, 500)
+
+    @patch.object(bedrock_integration, "CHUNK_TOKENS", 500)
+    def test_large_finding_set_uses_map_reduce(self):
+        findings = _make_findings(500)
+        chunks = bedrock_integration.chunk_findings(findings)
+        bedrock = _completion_client("Final report.")
+
+        narrative = bedrock_integration.get_ai_analysis(bedrock, findings)
+
+        self.assertEqual(narrative, "Final report.")
+        # One map call per chunk, possibly merge rounds, then one streamed reduce call
+        self.assertGreaterEqual(bedrock.converse.call_count, len(chunks))
+        reduce_call = bedrock.converse_stream.call_args
+        final_prompt = reduce_call.kwargs["messages"][0]["content"][0]["text"]
+        # The findings include Critical ones, so the report uses the large model
+        self.assertEqual(
+            reduce_call.kwargs["modelId"], bedrock_integration.LARGE_MODEL.model_id
+        )
+        for call in bedrock.converse.call_args_list:
+            self.assertEqual(
+                call.kwargs["modelId"], bedrock_integration.FAST_MODEL.model_id
+            )
+        self.assertIn("Total findings: 500", final_prompt)
+        self.assertIn("Critical: 100", final_prompt)
+
+    @patch.object(bedrock_integration, "CHUNK_TOKENS", 500)
+    def test_findings_are_read_once_and_sorted_only_for_map_reduce(self):
+        bedrock = _completion_client("Report.")
+
+        # A generator can only be read once
+        with patch.object(
+            bedrock_integration, "chunk_lines", wraps=bedrock_integration.chunk_lines
+        ) as chunk_lines:
+            small = bedrock_integration.get_ai_analysis(
+                bedrock, (f for f in _make_findings(3))
+            )
+            chunk_lines.assert_not_called()
+            large = bedrock_integration.get_ai_analysis(
+                bedrock, (f for f in _make_findings(500))
+            )
+            chunk_lines.assert_called_once()
+
+        self.assertEqual((small, large), ("Report.", "Report."))
+        first_prompt = bedrock.converse.call_args_list[0].kwargs["messages"][0]
+        self.assertIn("role2", first_prompt["content"][0]["text"])
+        final_prompt = bedrock.converse_stream.call_args.kwargs["messages"][0]
+        self.assertIn("Total findings: 500", final_prompt["content"][0]["text"])
+
+    def test_failed_map_calls_fall_back_to_local_summaries(self):
+        bedrock = MagicMock()
+        bedrock.converse.side_effect = RuntimeError("throttled")
+        jobs = [
+            ("instructions one", "fallback one"),
+            ("instructions two", "fallback two"),
+        ]
+        limiter = bedrock_integration.TokenRateLimiter(0)
+
+        results, fell_back = bedrock_integration._run_map(
+            bedrock, jobs, limiter, bedrock_integration.time.monotonic() + 10
+        )
+
+        self.assertEqual(results, ["fallback one", "fallback two"])
+        self.assertEqual(fell_back, 2)
+
+    def test_rate_limiter_refuses_waits_past_deadline(self):
+        limiter = bedrock_integration.TokenRateLimiter(600)
+        now = bedrock_integration.time.monotonic()
+
+        self.assertTrue(limiter.acquire(600, now + 1))
+        # The bucket is empty and refills at 10 tokens per second
+        self.assertFalse(limiter.acquire(100, now + 1))
+
+
+class _FakeS3:
+    """Minimal in-memory stand-in for the report bucket."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError(
+                {"Error": {"Code": "NoSuchKey", "Message": "Not Found"}}, "GetObject"
+            )
+        return {"Body": MagicMock(read=MagicMock(return_value=self.objects[Key]))}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body
+
+
+class TestNarrativeCache(unittest.TestCase):
+    """Test reuse of narratives across runs with unchanged findings."""
+
+    def test_unchanged_findings_reuse_cached_narrative(self):
+        s3 = _FakeS3()
+        cache = bedrock_integration.NarrativeCache(s3, "report-bucket", mode="exact")
+        findings = _make_findings(3)
+        bedrock = _completion_client("First report.")
+
+        first = bedrock_integration.get_ai_analysis(bedrock, findings, cache=cache)
+        # Same findings in a different order hit the cache
+        second = bedrock_integration.get_ai_analysis(
+            bedrock, list(reversed(findings)), cache=cache
+        )
+
+        self.assertEqual(first, "First report.")
+        self.assertEqual(second, "First report.")
+        bedrock.converse.assert_called_once()
+
+        changed = _make_findings(3)
+        changed[0]["description"] = "New problem"
+        bedrock_integration.get_ai_analysis(bedrock, changed, cache=cache)
+        self.assertEqual(bedrock.converse.call_count, 2)
+
+    def test_near_mode_matches_on_severity_counts(self):
+        s3 = _FakeS3()
+        cache = bedrock_integration.NarrativeCache(s3, "report-bucket", mode="near")
+        bedrock = _completion_client("Report.")
+        bedrock_integration.get_ai_analysis(bedrock, _make_findings(3), cache=cache)
+
+        renamed = _make_findings(3)
+        renamed[0]["resource_id"] = "another-role"
+        bedrock_integration.get_ai_analysis(bedrock, renamed, cache=cache)
+        bedrock.converse.assert_called_once()
+
+        bedrock_integration.get_ai_analysis(bedrock, _make_findings(4), cache=cache)
+        self.assertEqual(bedrock.converse.call_count, 2)
+
+    def test_fallback_narrative_is_not_cached(self):
+        s3 = _FakeS3()
+        cache = bedrock_integration.NarrativeCache(s3, "report-bucket")
+        bedrock = MagicMock()
+        bedrock.converse.side_effect = RuntimeError("Bedrock unavailable")
+
+        bedrock_integration.get_ai_analysis(bedrock, _make_findings(3), cache=cache)
+
+        self.assertEqual(s3.objects, {})
+
+    @patch.object(bedrock_integration, "CHUNK_TOKENS", 500)
+    def test_map_reduce_with_locally_summarized_chunks_is_not_cached(self):
+        s3 = _FakeS3()
+        cache = bedrock_integration.NarrativeCache(s3, "report-bucket")
+        bedrock = _completion_client("Final report.")
+        bedrock.converse.side_effect = RuntimeError("ThrottlingException")
+
+        narrative = bedrock_integration.get_ai_analysis(
+            bedrock, _make_findings(500), cache=cache
+        )
+
+        self.assertEqual(narrative, "Final report.")
+        self.assertEqual(s3.objects, {})
+
+    def test_only_missing_keys_are_silent_misses(self):
+        s3 = MagicMock()
+        s3.get_object.side_effect = ClientError(
+            {"Error": {"Code": "AccessDenied", "Message": "Denied"}}, "GetObject"
+        )
+        cache = bedrock_integration.NarrativeCache(s3, "report-bucket")
+
+        with self.assertLogs(bedrock_integration.logger, "ERROR"):
+            summary = bedrock_integration.aggregate_findings(
+                _make_findings(3), keep_lines=True
+            )
+            self.assertIsNone(cache.get(summary))
+
+
+class TestStreamingNarrative(unittest.TestCase):
+    """Test streamed report generation against the Lambda deadline."""
+
+    def test_deadline_from_context_keeps_reserve(self):
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 100_000
+        now = bedrock_integration.time.monotonic()
+
+        deadline = bedrock_integration.deadline_from_context(
+            context, reserve_seconds=30
+        )
+
+        self.assertAlmostEqual(deadline - now, 70, delta=1)
+        self.assertIsNone(bedrock_integration.deadline_from_context(None))
+
+    def test_stream_assembles_full_narrative(self):
+        bedrock = MagicMock()
+        bedrock.invoke_model_with_response_stream.return_value = {
+            "body": _stream_events(
+                ["Executive ", "summary."], stop_reason="stop_sequence"
+            )
+        }
+        deadline = bedrock_integration.time.monotonic() + 60
+
+        response = bedrock_integration.invoke_claude_model(bedrock, "prompt", deadline)
+
+        self.assertEqual(response["completion"], "Executive summary.")
+        bedrock.invoke_model.assert_not_called()
+
+    def test_stream_truncates_at_deadline(self):
+        pieces = [
+            "## Summary\n\nAll good so far.",
+            "\n\n## Findings\n\nHalf a sen",
+            "tence that never arrives.",
+        ]
+        bedrock = MagicMock()
+        bedrock.invoke_model_with_response_stream.return_value = {
+            "body": _stream_events(pieces)
+        }
+        clock = iter([5.0, 11.0, 12.0])
+
+        with patch.object(bedrock_integration.time, "monotonic", lambda: next(clock)):
+            response = bedrock_integration.invoke_claude_model(bedrock, "prompt", 10.0)
+
+        self.assertEqual(response["stop_reason"], "deadline")
+        # Cut back to the last complete paragraph, without the orphaned heading
+        self.assertEqual(
+            response["completion"],
+            "## Summary\n\nAll good so far." + bedrock_integration.TRUNCATION_NOTE,
+        )
+
+    def test_expired_deadline_uses_fallback_without_calling_bedrock(self):
+        bedrock = MagicMock()
+        deadline = bedrock_integration.time.monotonic() - 1
+
+        narrative = bedrock_integration.get_ai_analysis(
+            bedrock, _make_findings(3), deadline=deadline
+        )
+
+        self.assertIn("technical limitations", narrative)
+        bedrock.converse.assert_not_called()
+        bedrock.converse_stream.assert_not_called()
+
+
+class TestModelSelection(unittest.TestCase):
+    """Test per-run model selection and call metrics."""
+
+    def test_critical_findings_select_large_model(self):
+        findings = _make_findings(5)
+        self.assertEqual(
+            bedrock_integration.select_model(findings), bedrock_integration.LARGE_MODEL
+        )
+        routine = [f for f in findings if f["severity"] != "Critical"]
+        self.assertEqual(
+            bedrock_integration.select_model(routine), bedrock_integration.FAST_MODEL
+        )
+
+    def test_converse_call_records_latency_and_tokens(self):
+        bedrock = _completion_client("Routine report.")
+        routine = [f for f in _make_findings(5) if f["severity"] != "Critical"]
+
+        narrative = bedrock_integration.get_ai_analysis(bedrock, routine)
+
+        self.assertEqual(narrative, "Routine report.")
+        request = bedrock.converse.call_args.kwargs
+        self.assertEqual(request["modelId"], bedrock_integration.FAST_MODEL.model_id)
+        self.assertEqual(request["inferenceConfig"]["maxTokens"], 4096)
+        (metrics,) = bedrock_integration.get_call_metrics()
+        self.assertEqual(metrics["model"], bedrock_integration.FAST_MODEL.model_id)
+        self.assertEqual(metrics["operation"], "converse")
+        self.assertEqual((metrics["input_tokens"], metrics["output_tokens"]), (100, 20))
+        self.assertGreaterEqual(metrics["latency_ms"], 0)
+
+
+class TestFindingsAggregation(unittest.TestCase):
+    """Test the single-pass aggregation behind the prompt and fallback narrative."""
+
+    def test_top_findings_are_most_severe_first_in_one_pass(self):
+        from modules.findings_aggregation import aggregate_findings
+
+        findings = _make_findings(50)
+        # A generator can only be read once
+        summary = aggregate_findings((f for f in findings), top_k=3)
+
+        self.assertEqual(summary.total, 50)
+        self.assertEqual(summary.severity_counts["Critical"], 10)
+        self.assertEqual(summary.category_counts, {"S3": 25, "IAM": 25})
+        self.assertEqual(
+            [f["id"] for f in summary.top_findings("S3")],
+            ["finding0", "finding10", "finding20"],
+        )
+        self.assertEqual(summary.key_issue_count, 20)
+        self.assertEqual([f["severity"] for f in summary.key_issues], ["Critical"] * 5)
+
+    def test_prompt_lists_top_findings_and_remaining_count(self):
+        prompt = bedrock_integration.prepare_prompt(
+            (f for f in _make_findings(50)), max_per_category=2
+        )
+
+        self.assertIn("Total findings: 50", prompt)
+        self.assertIn(
+            "Category: S3\n  - Critical: Role trusts an external account", prompt
+        )
+        self.assertIn("  - ... and 23 more S3 findings", prompt)
+
+    def test_fallback_narrative_uses_shared_summary(self):
+        from modules.narrative import generate_fallback_narrative
+
+        narrative = generate_fallback_narrative(_make_findings(50))
+
+        self.assertIn("Total findings: 50", narrative)
+        self.assertIn("Critical: 10", narrative)
+        self.assertIn("...and 15 more critical or high severity issues.", narrative)
+
+    def test_ties_keep_the_earliest_findings_and_k_zero_keeps_none(self):
+        from modules.findings_aggregation import aggregate_findings
+
+        findings = [
+            {"id": f"f{i}", "category": "IAM", "severity": "High"} for i in range(9)
+        ]
+        findings.insert(6, {"id": "late", "category": "IAM", "severity": "Critical"})
+
+        top = aggregate_findings(iter(findings), top_k=3)
+        self.assertEqual(
+            [f["id"] for f in top.top_findings("IAM")], ["late", "f0", "f1"]
+        )
+        everything = aggregate_findings(iter(findings), top_k=None)
+        self.assertEqual(len(everything.top_findings("IAM")), 10)
+        self.assertEqual(
+            aggregate_findings(iter(findings), top_k=0).top_findings("IAM"), []
+        )
+
+    def test_fallback_counts_findings_without_severity_as_medium(self):
+        from modules.narrative import generate_fallback_narrative
+
+        findings = [{"id": "a", "category": "IAM"}, {"id": "b", "severity": "Medium"}]
+
+        self.assertIn("Medium: 2", generate_fallback_narrative(findings))
@@ -0,0 +1,335 @@
+import io
+import json
+import os
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from botocore.paginate import TokenDecoder
+
+# Add the lambda directory to the path
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src/lambda"))
+)
+import index  # noqa: E402
+from modules import checkpoint  # noqa: E402
+from modules.access_analyzer_findings import (  # noqa: E402
+    collect_access_analyzer_findings,
+)
+from modules.cloudtrail_findings import collect_cloudtrail_findings  # noqa: E402
+from modules.iam_findings import collect_iam_findings  # noqa: E402
+from modules.scp_findings import collect_scp_findings  # noqa: E402
+from modules.securityhub_findings import collect_securityhub_findings  # noqa: E402
+
+
+def _s3_client():
+    """S3 client storing objects in a dictionary."""
+    s3 = MagicMock()
+    s3.objects = {}
+
+    def _put_object(Bucket, Key, Body, **kwargs):
+        s3.objects[Key] = Body
+
+    def _get_object(Bucket, Key):
+        return {"Body": io.BytesIO(s3.objects[Key].encode("utf-8"))}
+
+    def _delete_object(Bucket, Key):
+        s3.objects.pop(Key, None)
+
+    s3.put_object.side_effect = _put_object
+    s3.get_object.side_effect = _get_object
+    s3.delete_object.side_effect = _delete_object
+    return s3
+
+
+def _iam_client():
+    iam = MagicMock()
+    iam.list_users.return_value = {
+        "Users": [{"UserName": "alice"}, {"UserName": "bob"}]
+    }
+    iam.list_roles.return_value = {
+        "Roles": [
+            {"RoleName": "old-role", "Path": "/"},
+            {"RoleName": "unused-role", "Path": "/"},
+        ]
+    }
+    iam.list_access_keys.return_value = {"AccessKeyMetadata": []}
+    iam.list_attached_user_policies.return_value = {"AttachedPolicies": []}
+    iam.get_role.return_value = {"Role": {}}
+    return iam
+
+
+def _paginator(pages, token_key="NextToken"):
+    """Paginator over ``pages``; each page's token is the index of the next."""
+    paginator = MagicMock()
+
+    def _paginate(PaginationConfig=None, **kwargs):
+        start = 0
+        if PaginationConfig:
+            token = TokenDecoder().decode(PaginationConfig["StartingToken"])
+            start = int(token[token_key])
+        return iter(pages[start:])
+
+    paginator.paginate.side_effect = _paginate
+    return paginator
+
+
+class TestIAMCursor(unittest.TestCase):
+    def test_collector_pauses_at_the_deadline(self):
+        iam = _iam_client()
+        with self.assertRaises(checkpoint.CollectorPaused) as paused:
+            collect_iam_findings(iam, deadline=time.monotonic() - 1)
+
+        self.assertEqual(paused.exception.cursor, {"phase": "users", "after": None})
+        self.assertEqual(paused.exception.findings, [])
+
+    def test_collector_resumes_from_the_cursor(self):
+        iam = _iam_client()
+        findings = collect_iam_findings(
+            iam, cursor={"phase": "roles", "after": "old-role"}
+        )
+
+        iam.list_users.assert_not_called()
+        iam.get_role.assert_called_once_with(RoleName="unused-role")
+        self.assertIn("IAM-004-unused-role", [f["id"] for f in findings])
+        self.assertNotIn("IAM-004-old-role", [f["id"] for f in findings])
+
+    def test_cursor_survives_principals_added_and_removed(self):
+        iam = _iam_client()
+        # "alice" was checked and then deleted; "aaron" was created before the
+        # resume, so neither shifts the position as a list index would
+        iam.list_users.return_value = {
+            "Users": [{"UserName": "bob"}, {"UserName": "aaron"}]
+        }
+        collect_iam_findings(iam, cursor={"phase": "users", "after": "alice"})
+
+        checked = [c.kwargs["UserName"] for c in iam.list_access_keys.call_args_list]
+        self.assertEqual(checked, ["bob"])
+
+
+class TestPagedCollectorCursors(unittest.TestCase):
+    def test_securityhub_pauses_between_pages_and_resumes(self):
+        securityhub = MagicMock()
+        securityhub.get_enabled_standards.return_value = {
+            "StandardsSubscriptions": [{"StandardsStatus": "READY"}]
+        }
+        securityhub.get_paginator.return_value = _paginator(
+            [
+                {"Findings": [{"Id": "finding-0001"}], "NextToken": "1"},
+                {"Findings": [{"Id": "finding-0002"}]},
+            ]
+        )
+
+        with self.assertRaises(checkpoint.CollectorPaused) as paused:
+            collect_securityhub_findings(securityhub, deadline=time.monotonic() - 1)
+        self.assertEqual([f["id"] for f in paused.exception.findings], ["finding-0001"])
+        self.assertEqual(paused.exception.cursor["found"], 1)
+
+        findings = collect_securityhub_findings(
+            securityhub, cursor=paused.exception.cursor
+        )
+        # No positive note: the first page's finding was saved with the checkpoint
+        self.assertEqual([f["id"] for f in findings], ["finding-0002"])
+
+    def test_access_analyzer_resumes_the_analyzer_it_paused_in(self):
+        analyzer = MagicMock()
+        analyzer.list_analyzers.return_value = {
+            "analyzers": [
+                {"arn": "arn:analyzer/b", "name": "b"},
+                {"arn": "arn:analyzer/a", "name": "a"},
+            ]
+        }
+        pages = {
+            "arn:analyzer/a": [{"findings": []}],
+            "arn:analyzer/b": [
+                {"findings": [{"id": "b-1"}], "nextToken": "1"},
+                {"findings": [{"id": "b-2"}]},
+            ],
+        }
+
+        def _get_paginator(name):
+            paginator = MagicMock()
+            paginator.paginate.side_effect = lambda analyzerArn, **kwargs: (
+                _paginator(pages[analyzerArn], "nextToken").paginate(**kwargs)
+            )
+            return paginator
+
+        analyzer.get_paginator.side_effect = _get_paginator
+        analyzer.get_finding.return_value = {"resourceType": "AWS::IAM::Role"}
+
+        # Paused before analyzer "b"; "a" sorts first and was already read
+        cursor = {"analyzer": "arn:analyzer/b", "starting_token": None, "count": 0}
+        with self.assertRaises(checkpoint.CollectorPaused) as paused:
+            collect_access_analyzer_findings(
+                analyzer, cursor=cursor, deadline=time.monotonic() - 1
+            )
+        self.assertEqual([f["id"] for f in paused.exception.findings], ["AA-b-1"])
+        self.assertEqual(paused.exception.cursor["count"], 1)
+
+        findings = collect_access_analyzer_findings(
+            analyzer, cursor=paused.exception.cursor
+        )
+        self.assertEqual([f["id"] for f in findings], ["AA-b-2"])
+
+    def test_cloudtrail_resumes_after_the_last_trail_checked(self):
+        cloudtrail = MagicMock()
+        cloudtrail.describe_trails.return_value = {
+            "trailList": [{"Name": "second"}, {"Name": "first"}]
+        }
+        cloudtrail.get_trail_status.return_value = {"IsLogging": True}
+
+        findings = collect_cloudtrail_findings(
+            cloudtrail, MagicMock(), cursor={"after": "first", "found": 0}
+        )
+
+        cloudtrail.get_trail_status.assert_called_once_with(Name="second")
+        self.assertIn("CT-REGION-second", [f["id"] for f in findings])
+
+    def test_scp_resume_does_not_repeat_organization_findings(self):
+        org = MagicMock()
+        org.describe_organization.return_value = {"Organization": {"Id": "o-1"}}
+        org.list_roots.return_value = {"Roots": [{"Id": "r-1"}]}
+        org.get_paginator.return_value = _paginator(
+            [{"Policies": [{"Id": "p-000001", "Name": "FullAWSAccess"}]}]
+        )
+
+        with self.assertRaises(checkpoint.CollectorPaused) as paused:
+            collect_scp_findings(org, deadline=time.monotonic() - 1)
+        self.assertEqual([f["id"] for f in paused.exception.findings], ["SCP-001"])
+
+        findings = collect_scp_findings(org, cursor=paused.exception.cursor)
+        self.assertEqual(findings, [])
+
+
+class TestRunCollectors(unittest.TestCase):
+    def setUp(self):
+        self.s3 = _s3_client()
+        self.store = checkpoint.CheckpointStore(self.s3, "reports")
+
+    def test_paused_run_continues_from_the_checkpoint(self):
+        def _slow(cursor, deadline):
+            if cursor is None:
+                raise checkpoint.CollectorPaused({"index": 1}, [{"id": "slow-1"}])
+            return [{"id": f"slow-{cursor['index'] + 1}"}]
+
+        collectors = [("fast", lambda cursor, deadline: [{"id": "fast-1"}])]
+        collectors.append(("slow", _slow))
+        state = self.store.new()
+
+        self.assertFalse(
+            checkpoint.run_collectors(collectors, state, save=self.store.save)
+        )
+        key = f"checkpoints/{state['run_id']}.json"
+        self.assertIn(key, self.s3.objects)
+
+        fast = MagicMock(return_value=[])
+        collectors[0] = ("fast", fast)
+        resumed = self.store.load(state["run_id"])
+        self.assertEqual(resumed["invocation"], 2)
+        self.assertTrue(
+            checkpoint.run_collectors(collectors, resumed, save=self.store.save)
+        )
+
+        fast.assert_not_called()
+        self.assertEqual(
+            [f["id"] for f in checkpoint.collected_findings(resumed, collectors)],
+            ["fast-1", "slow-1", "slow-2"],
+        )
+
+    def test_no_collector_starts_after_the_deadline(self):
+        collect = MagicMock(return_value=[])
+        state = self.store.new()
+
+        finished = checkpoint.run_collectors(
+            [("iam", collect)], state, deadline=time.monotonic() - 1
+        )
+
+        self.assertFalse(finished)
+        collect.assert_not_called()
+
+    def test_deadline_requires_remaining_time(self):
+        self.assertIsNone(checkpoint.collection_deadline({}))
+        self.assertIsNone(checkpoint.collection_deadline(MagicMock()))
+
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 300000
+        deadline = checkpoint.collection_deadline(context, reserve_seconds=120)
+        self.assertAlmostEqual(deadline - time.monotonic(), 180, delta=1)
+
+
+class TestHandlerContinuation(unittest.TestCase):
+    def test_handler_reinvokes_itself_and_resumes(self):
+        s3 = _s3_client()
+        lambda_client = MagicMock()
+
+        def _client(service_name, *args, **kwargs):
+            return {"s3": s3, "lambda": lambda_client}.get(service_name, MagicMock())
+
+        context = MagicMock()
+        context.invoked_function_arn = (
+            "arn:aws:lambda:us-east-1:111122223333:function:review-access-review"
+        )
+        context.aws_request_id = "request-1"
+        # Less time left than the reserve: nothing is collected
+        context.get_remaining_time_in_millis.return_value = 1000
+
+        environment = {"REPORT_BUCKET": "reports", "RECIPIENT_EMAIL": "a@example.com"}
+        with patch.dict(os.environ, environment), patch(
+            "boto3.client", side_effect=_client
+        ), patch("index.collect_iam_findings", return_value=[{"id": "iam-1"}]), patch(
+            "index.generate_ai_narrative", return_value="Narrative"
+        ), patch(
+            "index.send_email_with_attachment"
+        ) as send_email, patch(
+            "index.verify_email_for_ses"
+        ):
+            response = index.handler({"recipient_email": "b@example.com"}, context)
+
+            self.assertEqual(response["statusCode"], 202)
+            run_id = response["checkpoint"]["runId"]
+            payload = json.loads(lambda_client.invoke.call_args.kwargs["Payload"])
+            self.assertEqual(
+                payload, {"recipient_email": "b@example.com", "resume_run_id": run_id}
+            )
+            self.assertEqual(
+                lambda_client.invoke.call_args.kwargs["InvocationType"], "Event"
+            )
+            send_email.assert_not_called()
+            # A first run only writes a checkpoint because it paused
+            self.assertEqual(list(s3.objects), [f"checkpoints/{run_id}.json"])
+
+            context.get_remaining_time_in_millis.return_value = 300000
+            response = index.handler(payload, context)
+
+        self.assertEqual(response["statusCode"], 200)
+        send_email.assert_called_once()
+        self.assertNotIn(f"checkpoints/{run_id}.json", s3.objects)
+
+    def test_run_that_finishes_in_time_writes_no_checkpoint(self):
+        s3 = _s3_client()
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 300000
+
+        environment = {"REPORT_BUCKET": "reports", "RECIPIENT_EMAIL": "a@example.com"}
+        with patch.dict(os.environ, environment), patch(
+            "boto3.client",
+            side_effect=lambda name, *a, **k: s3 if name == "s3" else MagicMock(),
+        ), patch("index.collect_iam_findings", return_value=[{"id": "iam-1"}]), patch(
+            "index.generate_ai_narrative", return_value="Narrative"
+        ), patch(
+            "index.send_email_with_attachment"
+        ), patch(
+            "index.verify_email_for_ses"
+        ):
+            response = index.handler({}, context)
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(
+            [key for key in s3.objects if key.startswith("checkpoints/")], []
+        )
+        s3.delete_object.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
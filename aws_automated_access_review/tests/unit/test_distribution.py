@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add the lambda directory to the path
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src/lambda"))
+)
+from modules import distribution, email_utils  # noqa: E402
+
+OWNERSHIP = {
+    "teams": {
+        "payments": {
+            "emails": ["payments@example.com"],
+            "resources": ["payments-*"],
+        },
+        "data": {
+            "emails": ["data@example.com", "unverified@example.com"],
+            "accounts": ["222233334444"],
+        },
+        "platform": {"emails": ["platform@example.com"]},
+    },
+    "default_team": "platform",
+}
+
+
+def _finding(resource_id, severity="High"):
+    return {
+        "id": resource_id,
+        "category": "IAM",
+        "severity": severity,
+        "resource_type": "AWS::IAM::Role",
+        "resource_id": resource_id,
+        "description": "Role trusts an external account",
+    }
+
+
+def _ses_client():
+    ses = MagicMock()
+    ses.get_identity_verification_attributes.side_effect = lambda Identities: {
+        "VerificationAttributes": {
+            address: {
+                "VerificationStatus": (
+                    "Pending" if address.startswith("unverified") else "Success"
+                )
+            }
+            for address in Identities
+        }
+    }
+    # SES rejects the unverified address, as it does inside the sandbox
+    ses.send_bulk_templated_email.side_effect = lambda **kwargs: {
+        "Status": [
+            (
+                {"Status": "MessageRejected", "Error": "Email address is not verified."}
+                if d["Destination"]["ToAddresses"][0].startswith("unverified")
+                else {"Status": "Success", "MessageId": "1"}
+            )
+            for d in kwargs["Destinations"]
+        ]
+    }
+    return ses
+
+
+class TestTeamDistribution(unittest.TestCase):
+    """Test per-team report distribution."""
+
+    def setUp(self):
+        email_utils._verified_at.clear()
+        distribution._templates_ready.clear()
+
+    def test_findings_are_partitioned_by_owner(self):
+        resolver = distribution.OwnerResolver(OWNERSHIP, account_id="999999999999")
+        slices = distribution.partition_findings(
+            [
+                _finding("payments-api"),
+                _finding("arn:aws:iam::222233334444:role/etl"),
+                _finding("admin"),
+            ],
+            resolver,
+        )
+
+        self.assertEqual(
+            {team: [f["resource_id"] for f in items] for team, items in slices.items()},
+            {
+                "payments": ["payments-api"],
+                "data": ["arn:aws:iam::222233334444:role/etl"],
+                "platform": ["admin"],
+            },
+        )
+
+    @patch.object(distribution, "BULK_DESTINATIONS", 2)
+    def test_team_reports_are_sent_in_bulk_to_every_team_address(self):
+        ses = _ses_client()
+        s3 = MagicMock()
+        s3.get_object.side_effect = Exception("NoSuchKey")
+        s3.generate_presigned_url.return_value = "https://example.com/report"
+        findings = [
+            _finding("payments-api", "Critical"),
+            _finding("arn:aws:iam::222233334444:role/etl"),
+            _finding("admin", "Low"),
+        ]
+
+        result = distribution.distribute_team_reports(
+            ses, s3, "reports", findings, OWNERSHIP, "security@example.com"
+        )
+
+        self.assertEqual(result["teams"], 3)
+        self.assertEqual((result["sent"], result["failed"]), (3, 1))
+        self.assertEqual(result["failed_addresses"], ["unverified@example.com"])
+        # Only the sender is checked; four destinations need two bulk calls
+        ses.get_identity_verification_attributes.assert_called_once_with(
+            Identities=["security@example.com"]
+        )
+        self.assertEqual(ses.send_bulk_templated_email.call_count, 2)
+        sent = [
+            json.loads(d["ReplacementTemplateData"])
+            for call in ses.send_bulk_templated_email.call_args_list
+            for d in call.kwargs["Destinations"]
+        ]
+        payments = next(d for d in sent if d["team"] == "payments")
+        self.assertEqual(payments["count"], "1")
+        self.assertEqual(payments["link"], "https://example.com/report")
+        self.assertTrue(payments["link_note"].startswith("link valid for "))
+        self.assertIn("Critical: 1", payments["summary"])
+        # Each slice is uploaded once
+        self.assertEqual(s3.put_object.call_count, 4)
+
+    def test_nothing_is_sent_from_an_unverified_sender(self):
+        ses = _ses_client()
+        s3 = MagicMock()
+        s3.get_object.side_effect = Exception("NoSuchKey")
+        s3.generate_presigned_url.return_value = "https://example.com/report"
+
+        result = distribution.distribute_team_reports(
+            ses,
+            s3,
+            "reports",
+            [_finding("payments-api")],
+            OWNERSHIP,
+            "unverified-sender@example.com",
+        )
+
+        self.assertEqual((result["sent"], result["failed"]), (0, 1))
+        self.assertEqual(result["failed_addresses"], ["payments@example.com"])
+        ses.send_bulk_templated_email.assert_not_called()
+
+    def test_verification_status_is_reused_between_runs(self):
+        ses = _ses_client()
+        store = {}
+        s3 = MagicMock()
+        s3.put_object.side_effect = lambda **kwargs: store.update(
+            {kwargs["Key"]: kwargs["Body"]}
+        )
+
+        def _get_object(Bucket, Key):
+            if Key not in store:
+                raise Exception("NoSuchKey")
+            return {"Body": MagicMock(read=MagicMock(return_value=store[Key]))}
+
+        s3.get_object.side_effect = _get_object
+
+        self.assertTrue(
+            email_utils.verify_email_for_ses(
+                ses, "security@example.com", s3_client=s3, bucket="reports"
+            )
+        )
+        # A new container has an empty in-memory cache but finds the S3 copy
+        email_utils._verified_at.clear()
+        self.assertTrue(
+            email_utils.verify_email_for_ses(
+                ses, "security@example.com", s3_client=s3, bucket="reports"
+            )
+        )
+        ses.get_identity_verification_attributes.assert_called_once()
@@ -0,0 +1,116 @@
+import datetime
+import email
+import gzip
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Add the lambda directory to the path
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src/lambda"))
+)
+from modules import email_utils  # noqa: E402
+
+CSV = "id,severity\n" + "".join(f"finding{i},High\n" for i in range(1000))
+
+
+def _sent_message(ses):
+    raw = ses.send_raw_email.call_args.kwargs["RawMessage"]["Data"]
+    return email.message_from_string(raw)
+
+
+class TestEmailDelivery(unittest.TestCase):
+    """Test compressed and size-aware report delivery."""
+
+    def test_report_is_attached_gzipped(self):
+        ses = MagicMock()
+        ses.send_raw_email.return_value = {"MessageId": "1"}
+
+        sent = email_utils.send_email_with_attachment(
+            ses, "team@example.com", "Narrative", CSV, "report.csv"
+        )
+
+        self.assertTrue(sent)
+        message = _sent_message(ses)
+        (attachment,) = [p for p in message.walk() if p.get_filename()]
+        self.assertEqual(attachment.get_filename(), "report.csv.gz")
+        payload = attachment.get_payload(decode=True)
+        self.assertLess(len(payload), len(CSV))
+        self.assertEqual(gzip.decompress(payload).decode("utf-8"), CSV)
+
+    def test_zip_compression(self):
+        data, name = email_utils.compress_attachment(CSV, "report.csv", "zip")
+        self.assertEqual(name, "report.zip")
+        self.assertTrue(data.startswith(b"PK"))
+
+    @patch.object(email_utils, "MAX_ATTACHMENT_BYTES", 100)
+    def test_large_report_is_linked_instead_of_attached(self):
+        ses = MagicMock()
+        ses.send_raw_email.return_value = {"MessageId": "1"}
+        s3 = MagicMock()
+        s3.generate_presigned_url.return_value = "https://example.com/report"
+
+        sent = email_utils.send_email_with_attachment(
+            ses,
+            "team@example.com",
+            "Narrative",
+            CSV,
+            "report.csv",
+            s3_client=s3,
+            bucket="reports",
+            key="reports/report.csv",
+        )
+
+        self.assertTrue(sent)
+        s3.generate_presigned_url.assert_called_once_with(
+            "get_object",
+            Params={"Bucket": "reports", "Key": "reports/report.csv"},
+            ExpiresIn=email_utils.REPORT_LINK_EXPIRY_SECONDS,
+        )
+        message = _sent_message(ses)
+        self.assertFalse([p for p in message.walk() if p.get_filename()])
+        self.assertIn("https://example.com/report", message.as_string())
+
+    @patch.object(email_utils, "MAX_ATTACHMENT_BYTES", 100)
+    def test_link_from_temporary_credentials_states_real_validity(self):
+        ses = MagicMock()
+        ses.send_raw_email.return_value = {"MessageId": "1"}
+        s3 = MagicMock()
+        s3.generate_presigned_url.return_value = "https://example.com/report"
+        expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            hours=2, minutes=30
+        )
+        s3._request_signer._credentials = SimpleNamespace(
+            token="session-token", _expiry_time=expiry
+        )
+
+        email_utils.send_email_with_attachment(
+            ses,
+            "team@example.com",
+            "Narrative",
+            CSV,
+            "report.csv",
+            s3_client=s3,
+            bucket="reports",
+            key="reports/report.csv",
+        )
+
+        expires_in = s3.generate_presigned_url.call_args.kwargs["ExpiresIn"]
+        self.assertAlmostEqual(expires_in, 9000, delta=5)
+        self.assertIn("link valid for 2 hours", _sent_message(ses).as_string())
+
+    def test_session_without_known_expiry_is_capped(self):
+        s3 = MagicMock()
+        s3._request_signer._credentials = SimpleNamespace(token="session-token")
+
+        self.assertEqual(
+            email_utils.link_lifetime_seconds(s3),
+            email_utils.REPORT_LINK_SESSION_SECONDS,
+        )
+        s3._request_signer._credentials = SimpleNamespace(token=None)
+        self.assertEqual(
+            email_utils.link_lifetime_seconds(s3),
+            email_utils.REPORT_LINK_EXPIRY_SECONDS,
+        )
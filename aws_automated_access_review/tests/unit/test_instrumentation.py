@@ -0,0 +1,77 @@
+import io
+import json
+import os
+import sys
+import time
+import unittest
+
+import boto3
+from moto import mock_aws
+
+# Add the lambda directory to the path
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src/lambda"))
+)
+from utils import instrumentation  # noqa: E402
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Test API call statistics, collector timing and EMF output."""
+
+    def setUp(self):
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+        instrumentation.start_run()
+
+    @mock_aws
+    def test_calls_are_counted_per_operation_and_collector(self):
+        iam = instrumentation.instrument_client(
+            boto3.client("iam", region_name="us-east-1")
+        )
+        with instrumentation.collector_timer("iam"):
+            iam.list_users()
+            iam.list_users()
+            with self.assertRaises(iam.exceptions.NoSuchEntityException):
+                iam.get_login_profile(UserName="nobody")
+            started = time.perf_counter()
+            instrumentation.record_timing("iam.console_mfa", started)
+
+        snapshot = instrumentation.metrics_snapshot()
+        self.assertEqual(snapshot["api_calls"], 3)
+        self.assertEqual(snapshot["api"]["iam.ListUsers"]["calls"], 2)
+        self.assertEqual(snapshot["api"]["iam.GetLoginProfile"]["errors"], 1)
+        self.assertEqual(snapshot["collectors"]["iam"]["api_calls"], 3)
+        self.assertEqual(snapshot["collectors"]["iam"]["errors"], 1)
+        self.assertEqual(snapshot["checks"]["iam.console_mfa"]["count"], 1)
+        json.dumps(snapshot)
+
+    def test_throttled_attempts_are_counted(self):
+        throttled = (None, {"Error": {"Code": "Throttling"}})
+        instrumentation._needs_retry(
+            response=throttled, event_name="needs-retry.iam.ListRoles"
+        )
+        instrumentation._needs_retry(
+            response=None, event_name="needs-retry.iam.ListRoles"
+        )
+
+        self.assertEqual(
+            instrumentation.metrics_snapshot()["api"]["iam.ListRoles"]["throttles"], 1
+        )
+
+    def test_emf_has_one_document_per_dimension_set(self):
+        instrumentation._finish_call("after-call.iam.ListUsers", {}, False)
+        with instrumentation.collector_timer("iam"):
+            pass
+        stream = io.StringIO()
+
+        instrumentation.emit_emf(stream=stream)
+
+        documents = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(documents), 3)
+        operation = documents[-1]
+        self.assertEqual(
+            (operation["Service"], operation["Operation"]), ("iam", "ListUsers")
+        )
+        directive = operation["_aws"]["CloudWatchMetrics"][0]
+        self.assertEqual(directive["Dimensions"], [["Service", "Operation"]])
+        self.assertIn({"Name": "Calls", "Unit": "Count"}, directive["Metrics"])
@@ -0,0 +1,134 @@
+import io
+import json
+import logging
+import os
+import queue
+import sys
+import unittest
+from unittest.mock import patch
+
+# Add the lambda directory to the path
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src/lambda"))
+)
+from utils import logging_setup  # noqa: E402
+
+
+class _CountingArg:
+    """Log argument that records how often it is rendered."""
+
+    def __init__(self):
+        self.rendered = 0
+
+    def __str__(self):
+        self.rendered += 1
+        return "arg"
+
+
+class TestQueuedLogging(unittest.TestCase):
+    """Test the queued, batched JSON logging pipeline."""
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        output = logging_setup._BatchingStreamHandler(self.stream, batch_size=10)
+        output.setFormatter(logging_setup._JsonFormatter())
+        log_queue = queue.SimpleQueue()
+        handler = logging_setup._DeferredQueueHandler(log_queue)
+        handler.addFilter(logging_setup._ContextFilter())
+        self.listener = logging_setup._BatchingQueueListener(log_queue, output)
+        self.listener.start()
+
+        self.logger = logging.getLogger("test_logging_setup")
+        self.logger.propagate = False
+        self.logger.handlers = [handler]
+        self.logger.setLevel(logging.INFO)
+        logging_setup.reset_log_sampling()
+
+    def tearDown(self):
+        self.listener.stop()
+        logging_setup.set_log_context(account=None, collector=None)
+
+    def _records(self):
+        self.listener.stop()
+        self.listener.start()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_records_carry_structured_context(self):
+        logging_setup.set_log_context(account="123456789012")
+        with logging_setup.log_context(collector="iam"):
+            self.logger.info("Found %s users", 3)
+        self.logger.info("Done")
+
+        first, second = self._records()
+        self.assertEqual(first["message"], "Found 3 users")
+        self.assertEqual(first["collector"], "iam")
+        self.assertEqual(first["account"], "123456789012")
+        self.assertNotIn("collector", second)
+
+    def test_per_finding_lines_are_sampled_and_not_formatted(self):
+        arg = _CountingArg()
+        with patch.object(logging_setup, "LOG_SAMPLE_FIRST", 2), patch.object(
+            logging_setup, "LOG_SAMPLE_EVERY", 10
+        ):
+            for _ in range(22):
+                logging_setup.log_sampled(self.logger, "finding", "FINDING %s", arg)
+            self.logger.debug("Not enabled %s", arg)
+
+        records = self._records()
+        # Two leading lines, then one line for each further ten
+        self.assertEqual(len(records), 4)
+        self.assertIn("9 similar lines sampled out", records[-1]["message"])
+        self.assertEqual(arg.rendered, 4)
+
+
+class _CountingStream(io.StringIO):
+    """Stream that records how many times it is written to."""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+class TestConfigureLogger(unittest.TestCase):
+    """Test root logger setup when a handler is already installed."""
+
+    def setUp(self):
+        self.root = logging.getLogger()
+        self.saved = (self.root.handlers[:], self.root.level, logging_setup._listener)
+        # The Lambda runtime installs a root handler before importing the function
+        self.runtime_stream = io.StringIO()
+        self.root.handlers = [logging.StreamHandler(self.runtime_stream)]
+        logging_setup._listener = None
+
+    def tearDown(self):
+        if logging_setup._listener is not None:
+            logging_setup._listener.stop()
+        self.root.handlers, level, logging_setup._listener = self.saved
+        self.root.setLevel(level)
+        logging_setup.set_log_context(account=None)
+
+    def test_pre_installed_root_handler_is_replaced(self):
+        stream = _CountingStream()
+        logger = logging_setup.configure_logger("test_configure_logger")
+        logging_setup.set_log_context(account="123456789012")
+
+        with patch.object(logging_setup.sys, "stdout", stream):
+            for i in range(5):
+                logger.info("Record %s", i)
+            logging_setup.flush_logs()
+
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(
+            [r["message"] for r in records][-5:], [f"Record {i}" for i in range(5)]
+        )
+        self.assertTrue(all(r["account"] == "123456789012" for r in records[-5:]))
+        # Records logged together are written together, not one write each
+        self.assertLess(stream.writes, 5)
+        self.assertEqual(self.runtime_stream.getvalue(), "")
+        self.assertIsInstance(
+            self.root.handlers[0], logging_setup._DeferredQueueHandler
+        )
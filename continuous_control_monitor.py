@@ -1,29 +1,58 @@
 """Lambda: continuous_control_monitor
 
-Creates/updates a custom AWS Security Hub Insight scoped by resource tag and
-publishes a CloudWatch metric that reports the number of matching ACTIVE
-findings. Intended to run on a schedule (e.g. EventBridge cron) for continuous
-control monitoring (ISO 27001 A.18.2.3).
+Creates/updates custom AWS Security Hub Insights scoped by resource tag and
+publishes CloudWatch metrics that report the number of matching ACTIVE
+findings, broken down by severity. Intended to run on a schedule (e.g.
+EventBridge cron) for continuous control monitoring (ISO 27001 A.18.2.3).
+
+With STATE_TABLE set, the function can also be subscribed to "Security Hub
+Findings - Imported" EventBridge events: each event adjusts per-scope counts
+kept in DynamoDB and republishes the metrics within seconds, while the
+scheduled run becomes a periodic full reconcile of those counts. Counts can
+drift from the insights until the next reconcile for findings the reconcile
+missed but has no per-finding state for (e.g. re-opened after their state
+expired); counters moved by an event during a reconcile keep their deltas.
 
 Environment variables
 --------------------
 SH_TAG_KEY      Tag key used to scope resources (e.g. "Environment")
 SH_TAG_VALUE    Tag value used to scope resources (e.g. "Prod")
 INSIGHT_NAME    Friendly name for the insight (e.g. "Prod-OpenFindings")
+MONITOR_SCOPES  Optional JSON list of scopes, overriding the three variables
+                above, e.g. [{"name": "Prod", "tag_key": "Environment",
+                "tag_value": "Prod", "insight_name": "Prod-OpenFindings"}]
+TOTAL_INSIGHT_NAME  Optional name of the insight matching any scope, used for
+                the undimensioned total when several scopes are monitored
+                (default "AllScopes-OpenFindings")
 CW_NAMESPACE    Optional CloudWatch namespace (default "Custom/SecurityHub")
 CW_METRIC_NAME  Optional metric name (default "OpenFindings")
+METRICS_MODE    "api" (default) to call PutMetricData in batches, or "emf" to
+                print CloudWatch Embedded Metric Format records to the log
+INSIGHT_CACHE_PARAMETER  Optional SSM parameter name that persists insight
+                ARNs and filter hashes across cold starts
+INSIGHT_CACHE_FILE       Optional local file used instead of SSM (e.g. on a
+                mounted EFS path)
+STATE_TABLE     Optional DynamoDB table (string partition key "pk", TTL
+                attribute "expires_at") enabling the event-driven mode
 
 IAM permissions required
 ------------------------
-securityhub:CreateInsight, UpdateInsight, GetInsights, GetInsightResults,
-BatchGetFindings
-cloudwatch:PutMetricData
+securityhub:CreateInsight, UpdateInsight, GetInsights, GetInsightResults
+cloudwatch:PutMetricData (not needed with METRICS_MODE=emf)
+ssm:GetParameter, ssm:PutParameter (only with INSIGHT_CACHE_PARAMETER)
+dynamodb:GetItem, PutItem, BatchGetItem, TransactWriteItems (only with
+STATE_TABLE)
 """
 from __future__ import annotations
 
+import hashlib
+import json
 import os
 import logging
-from datetime import datetime, timezone
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
 import boto3
@@ -34,44 +63,194 @@ logger.setLevel(logging.INFO)
 
 sh = boto3.client("securityhub")
 cw = boto3.client("cloudwatch")
+ssm = boto3.client("ssm")
+ddb = boto3.client("dynamodb")
 
 TAG_KEY = os.getenv("SH_TAG_KEY", "Environment")
 TAG_VALUE = os.getenv("SH_TAG_VALUE", "Prod")
 INSIGHT_NAME = os.getenv("INSIGHT_NAME", f"{TAG_VALUE}-OpenFindings")
 CW_NAMESPACE = os.getenv("CW_NAMESPACE", "Custom/SecurityHub")
 CW_METRIC_NAME = os.getenv("CW_METRIC_NAME", "OpenFindings")
+METRICS_MODE = os.getenv("METRICS_MODE", "api").lower()
+TOTAL_INSIGHT_NAME = os.getenv("TOTAL_INSIGHT_NAME", "AllScopes-OpenFindings")
+
+# PutMetricData accepts up to 1000 datums per request
+MAX_DATUMS_PER_CALL = 1000
+MAX_SCOPE_WORKERS = 8
+
+INSIGHT_CACHE_PARAMETER = os.getenv("INSIGHT_CACHE_PARAMETER", "")
+INSIGHT_CACHE_FILE = os.getenv("INSIGHT_CACHE_FILE", "")
+
+# {insight name: {"arn": ..., "hash": ...}} kept across warm invocations
+_insight_cache: dict[str, dict[str, str]] = {}
+_insight_cache_loaded = False
+_cache_lock = threading.Lock()
+
+STATE_TABLE = os.getenv("STATE_TABLE", "")
+FINDINGS_EVENT_TYPE = "Security Hub Findings - Imported"
+# Findings that no longer count towards any scope are expired from the table
+CLOSED_FINDING_TTL_DAYS = 90
+MAX_STATE_ATTEMPTS = 5
+# Distinct open findings across all scopes, by severity. Like each SCOPE#
+# counter it records when its last reconcile started ("reconciled_at") and
+# how many event deltas it has taken ("revision")
+TOTAL_KEY = "TOTAL"
+
+
+def _load_scopes() -> list[dict[str, str]]:
+    """Return the configured monitoring scopes (tag key/value + insight name)."""
+    scopes: list[dict[str, str]] = []
+    raw = os.getenv("MONITOR_SCOPES", "").strip()
+    if raw:
+        try:
+            parsed = json.loads(raw)
+        except json.JSONDecodeError:
+            logger.error("MONITOR_SCOPES is not valid JSON; using SH_TAG_KEY/SH_TAG_VALUE")
+            parsed = []
+        for item in parsed if isinstance(parsed, list) else []:
+            if not isinstance(item, dict) or not item.get("tag_key") or not item.get("tag_value"):
+                logger.warning("Skipping invalid scope definition: %s", item)
+                continue
+            name = item.get("name") or item["tag_value"]
+            scopes.append(
+                {
+                    "name": name,
+                    "tag_key": item["tag_key"],
+                    "tag_value": item["tag_value"],
+                    "insight_name": item.get("insight_name") or f"{name}-OpenFindings",
+                }
+            )
+    if not scopes:
+        scopes.append(
+            {
+                "name": TAG_VALUE,
+                "tag_key": TAG_KEY,
+                "tag_value": TAG_VALUE,
+                "insight_name": INSIGHT_NAME,
+            }
+        )
+    return scopes
+
+
+def _total_scope(scopes: list[dict[str, str]]) -> dict[str, Any]:
+    """Return a pseudo-scope matching findings in any of ``scopes``.
+
+    Its insight counts each finding once, however many scopes it falls in.
+    """
+    return {
+        "name": "",
+        "tags": [(s["tag_key"], s["tag_value"]) for s in scopes],
+        "insight_name": TOTAL_INSIGHT_NAME,
+    }
+
+
+def _insight_filter(scope: dict[str, Any]) -> dict[str, Any]:
+    # Security Hub insight filters must follow AwsSecurityFindingFilters schema.
+    # ResourceTags entries require Key, Value, Comparison; RecordState is a StringFilter
+    # with entries {Value: "ACTIVE", Comparison: "EQUALS"}. Several EQUALS entries
+    # for the same field are ORed, which the total pseudo-scope relies on.
+    tags = scope.get("tags") or [(scope["tag_key"], scope["tag_value"])]
+    return {
+        "ResourceTags": [
+            {"Key": key, "Value": value, "Comparison": "EQUALS"} for key, value in tags
+        ],
+        "RecordState": [{"Value": "ACTIVE", "Comparison": "EQUALS"}],
+    }
+
+
+def _insight_hash(scope: dict[str, str]) -> str:
+    """Hash of everything sent to Create/UpdateInsight for this scope."""
+    definition = {
+        "name": scope["insight_name"],
+        "filters": _insight_filter(scope),
+        "group_by": "SeverityLabel",
+    }
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+
+
+def _load_insight_cache() -> None:
+    """Populate the module cache from SSM or the cache file on a cold start."""
+    global _insight_cache_loaded
+    if _insight_cache_loaded:
+        return
+    _insight_cache_loaded = True
+
+    raw = ""
+    try:
+        if INSIGHT_CACHE_PARAMETER:
+            raw = ssm.get_parameter(Name=INSIGHT_CACHE_PARAMETER)["Parameter"]["Value"]
+        elif INSIGHT_CACHE_FILE and os.path.exists(INSIGHT_CACHE_FILE):
+            with open(INSIGHT_CACHE_FILE, "r", encoding="utf-8") as fh:
+                raw = fh.read()
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") != "ParameterNotFound":
+            logger.warning("Could not read insight cache: %s", exc)
+    except OSError as exc:
+        logger.warning("Could not read insight cache file: %s", exc)
+
+    if not raw:
+        return
+    try:
+        parsed = json.loads(raw)
+    except json.JSONDecodeError:
+        logger.warning("Ignoring corrupt insight cache")
+        return
+    if isinstance(parsed, dict):
+        _insight_cache.update(
+            {k: v for k, v in parsed.items() if isinstance(v, dict) and v.get("arn")}
+        )
+
+
+def _save_insight_cache() -> None:
+    """Persist the module cache so cold starts can skip the insights scan too."""
+    body = json.dumps(_insight_cache, sort_keys=True)
+    try:
+        if INSIGHT_CACHE_PARAMETER:
+            ssm.put_parameter(
+                Name=INSIGHT_CACHE_PARAMETER,
+                Value=body,
+                Type="String",
+                Overwrite=True,
+                Tier="Intelligent-Tiering",
+            )
+        elif INSIGHT_CACHE_FILE:
+            with open(INSIGHT_CACHE_FILE, "w", encoding="utf-8") as fh:
+                fh.write(body)
+    except (ClientError, OSError) as exc:
+        logger.warning("Could not persist insight cache: %s", exc)
+
 
-# Security Hub insight filters must follow AwsSecurityFindingFilters schema.
-# ResourceTags entries require Key, Value, Comparison; RecordState is a StringFilter
-# with entries {Value: "ACTIVE", Comparison: "EQUALS"}
-TAG_FILTER = {"Key": TAG_KEY, "Value": TAG_VALUE, "Comparison": "EQUALS"}
-INSIGHT_FILTER = {
-    "ResourceTags": [TAG_FILTER],
-    "RecordState": [{"Value": "ACTIVE", "Comparison": "EQUALS"}],
-}
-
-def _find_existing_insight() -> str | None:
-    """Return the ARN of an existing insight with the configured name."""
+def _find_existing_insights() -> dict[str, str]:
+    """Return {insight name: ARN} for all insights (one paginated scan per run)."""
+    existing: dict[str, str] = {}
     paginator = sh.get_paginator("get_insights")
     for page in paginator.paginate():
         for insight in page.get("Insights", []):
-            if insight.get("Name") == INSIGHT_NAME:
-                return insight["InsightArn"]
-    return None
+            existing.setdefault(insight.get("Name"), insight["InsightArn"])
+    return existing
 
-def _create_or_update_insight() -> str:
-    """Ensure an insight exists and return its ARN."""
-    arn = _find_existing_insight()
+
+def _create_or_update_insight(scope: dict[str, str], existing: dict[str, str]) -> str:
+    """Ensure the scope's insight exists and return its ARN.
+
+    Insights are grouped by SeverityLabel so a single GetInsightResults call
+    yields the per-severity breakdown.
+    """
+    name = scope["insight_name"]
+    filters = _insight_filter(scope)
+    arn = existing.get(name)
     if arn:
         try:
-            sh.update_insight(InsightArn=arn, Name=INSIGHT_NAME, Filters=INSIGHT_FILTER)
+            sh.update_insight(
+                InsightArn=arn, Name=name, Filters=filters, GroupByAttribute="SeverityLabel"
+            )
             logger.debug("Updated existing insight %s", arn)
         except ClientError as exc:
             logger.warning("Failed to update insight %s: %s", arn, exc)
         return arn
 
     try:
-        resp = sh.create_insight(Name=INSIGHT_NAME, Filters=INSIGHT_FILTER, GroupByAttribute="Type")
+        resp = sh.create_insight(Name=name, Filters=filters, GroupByAttribute="SeverityLabel")
         arn = resp["InsightArn"]
         logger.info("Created new insight %s", arn)
         return arn
@@ -80,38 +259,495 @@ def _create_or_update_insight() -> str:
         # propagate None to signal a later safe fallback
         return ""
 
-def _get_open_findings(insight_arn: str) -> int:
+
+def _get_open_findings(insight_arn: str) -> dict[str, int] | None:
+    """Return {severity label: count} from the insight's ResultValues.
+
+    Returns None when the insight no longer exists (e.g. deleted in the
+    console) so a cached ARN can be discarded.
+    """
     try:
         if not insight_arn:
-            return 0
+            return {}
         resp = sh.get_insight_results(InsightArn=insight_arn)
-        return resp["InsightResults"]["TotalFindings"]
-    except ClientError:
+        by_severity: dict[str, int] = {}
+        for v in resp.get("InsightResults", {}).get("ResultValues", []):
+            label = v.get("GroupByAttributeValue") or "UNKNOWN"
+            by_severity[label] = by_severity.get(label, 0) + int(v.get("Count", 0))
+        return by_severity
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") == "ResourceNotFoundException":
+            logger.warning("Insight %s no longer exists", insight_arn)
+            return None
         logger.exception("get_insight_results failed for %s", insight_arn)
-        return 0
+        return {}
 
-def _publish_metric(value: int) -> None:
-    cw.put_metric_data(
-        Namespace=CW_NAMESPACE,
-        MetricData=[{
+
+def _ensure_insight(scope: dict[str, str], lookup, refresh: bool = False) -> str:
+    """Return the scope's insight ARN, touching Security Hub only on a cache miss.
+
+    ``lookup`` returns the {name: ARN} map of existing insights and is only
+    called when the cache has no entry with a matching filter hash.
+    """
+    name = scope["insight_name"]
+    digest = _insight_hash(scope)
+    with _cache_lock:
+        cached = _insight_cache.get(name)
+    if not refresh and cached and cached.get("hash") == digest:
+        return cached["arn"]
+
+    existing = {} if refresh else lookup()
+    arn = _create_or_update_insight(scope, existing)
+    with _cache_lock:
+        if arn:
+            _insight_cache[name] = {"arn": arn, "hash": digest}
+        else:
+            _insight_cache.pop(name, None)
+    return arn
+
+
+def _evaluate_scope(scope: dict[str, str], lookup) -> dict[str, Any]:
+    insight_arn = _ensure_insight(scope, lookup)
+    by_severity = _get_open_findings(insight_arn)
+    if by_severity is None:
+        insight_arn = _ensure_insight(scope, lookup, refresh=True)
+        by_severity = _get_open_findings(insight_arn) or {}
+    return {
+        "scope": scope["name"],
+        "insight": insight_arn,
+        "open_findings": sum(by_severity.values()),
+        "by_severity": by_severity,
+    }
+
+
+def _build_datums(
+    results: list[dict[str, Any]], timestamp: datetime, total: int | None = None
+) -> list[dict[str, Any]]:
+    """Flatten scope results into metric datums.
+
+    Emits the undimensioned total of distinct findings across scopes (kept for
+    existing alarms and dashboards), one datum per scope and one per
+    scope/severity pair. ``total`` defaults to the sum over scopes, which is
+    only distinct when there is a single scope.
+    """
+    if total is None:
+        total = sum(r["open_findings"] for r in results)
+    datums = [
+        {
             "MetricName": CW_METRIC_NAME,
-            "Timestamp": datetime.now(timezone.utc),
-            "Value": value,
-            "Unit": "Count"
-        }]
+            "Dimensions": [],
+            "Timestamp": timestamp,
+            "Value": total,
+            "Unit": "Count",
+        }
+    ]
+    for r in results:
+        datums.append(
+            {
+                "MetricName": CW_METRIC_NAME,
+                "Dimensions": [{"Name": "Scope", "Value": r["scope"]}],
+                "Timestamp": timestamp,
+                "Value": r["open_findings"],
+                "Unit": "Count",
+            }
+        )
+        for severity, count in sorted(r["by_severity"].items()):
+            datums.append(
+                {
+                    "MetricName": CW_METRIC_NAME,
+                    "Dimensions": [
+                        {"Name": "Scope", "Value": r["scope"]},
+                        {"Name": "Severity", "Value": severity},
+                    ],
+                    "Timestamp": timestamp,
+                    "Value": count,
+                    "Unit": "Count",
+                }
+            )
+    return datums
+
+
+def _emit_emf(datums: list[dict[str, Any]]) -> None:
+    """Print one Embedded Metric Format record per datum; CloudWatch extracts the metrics."""
+    for d in datums:
+        dimensions = {dim["Name"]: dim["Value"] for dim in d["Dimensions"]}
+        record = {
+            "_aws": {
+                "Timestamp": int(d["Timestamp"].timestamp() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": CW_NAMESPACE,
+                        "Dimensions": [list(dimensions)],
+                        "Metrics": [{"Name": d["MetricName"], "Unit": d["Unit"]}],
+                    }
+                ],
+            },
+            d["MetricName"]: d["Value"],
+            **dimensions,
+        }
+        print(json.dumps(record))
+
+
+def _publish_metrics(datums: list[dict[str, Any]]) -> None:
+    if METRICS_MODE == "emf":
+        _emit_emf(datums)
+        logger.info("Emitted %d EMF datapoints to %s", len(datums), CW_NAMESPACE)
+        return
+
+    for start in range(0, len(datums), MAX_DATUMS_PER_CALL):
+        batch = datums[start:start + MAX_DATUMS_PER_CALL]
+        cw.put_metric_data(Namespace=CW_NAMESPACE, MetricData=batch)
+    logger.info(
+        "Published %d datapoints to %s/%s", len(datums), CW_NAMESPACE, CW_METRIC_NAME
+    )
+
+
+def _publish_metric(value: int) -> None:
+    _publish_metrics(
+        [
+            {
+                "MetricName": CW_METRIC_NAME,
+                "Dimensions": [],
+                "Timestamp": datetime.now(timezone.utc),
+                "Value": value,
+                "Unit": "Count",
+            }
+        ]
+    )
+
+
+def _parse_updated_at(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _finding_memberships(finding: dict[str, Any], scopes: list[dict[str, str]]) -> list[str]:
+    """Return "scope|severity" entries this finding currently counts towards.
+
+    Mirrors the insight filter: RecordState ACTIVE and any resource carrying
+    the scope's tag key/value.
+    """
+    if finding.get("RecordState") != "ACTIVE":
+        return []
+    severity = (finding.get("Severity") or {}).get("Label") or "UNKNOWN"
+    tags: dict[str, set[str]] = {}
+    for resource in finding.get("Resources") or []:
+        for key, value in (resource.get("Tags") or {}).items():
+            tags.setdefault(key, set()).add(value)
+    return sorted(
+        f"{s['name']}|{severity}"
+        for s in scopes
+        if s["tag_value"] in tags.get(s["tag_key"], set())
     )
-    logger.info("Published metric %s/%s=%s", CW_NAMESPACE, CW_METRIC_NAME, value)
+
+
+def _severity_counter(members: list[str]) -> Counter:
+    """Return the TOTAL counter contribution of a membership list (0 or 1 finding)."""
+    if not members:
+        return Counter()
+    return Counter({members[0].split("|", 1)[1]: 1})
+
+
+def _counted_by_reconcile(finding: dict[str, Any], reconciled_at: datetime | None) -> bool:
+    """Return True if the last reconcile may already include this finding."""
+    if reconciled_at is None:
+        return False
+    created = _parse_updated_at(finding.get("CreatedAt"))
+    # Without a creation time the finding cannot be placed; treat it as counted
+    return created is None or created <= reconciled_at
+
+
+def _apply_finding(
+    finding: dict[str, Any],
+    scopes: list[dict[str, str]],
+    reconciled: dict[str, datetime | None] | None = None,
+) -> set[str]:
+    """Move one finding's contribution between scope counters; return touched scopes.
+
+    The finding's previous memberships are stored next to the counters, and
+    the new memberships plus counter deltas are written in one transaction
+    conditioned on the stored UpdatedAt. Duplicate or out-of-order events are
+    ignored; concurrent writers retry against the fresh state. The TOTAL
+    counter moves once per finding, however many scopes it belongs to.
+
+    The scheduled reconcile only writes counts, not memberships. A finding
+    with no membership item that existed before a counter's last reconcile
+    (``reconciled`` maps counter keys to that time) may already be counted
+    there, so that counter is left unchanged while the memberships are
+    recorded; the next reconcile corrects any difference.
+    """
+    key = {"pk": {"S": f"FINDING#{finding['Id']}"}}
+    new_members = _finding_memberships(finding, scopes)
+    updated_at = finding.get("UpdatedAt") or datetime.now(timezone.utc).isoformat()
+    reconciled = reconciled or {}
+
+    for _ in range(MAX_STATE_ATTEMPTS):
+        item = ddb.get_item(TableName=STATE_TABLE, Key=key, ConsistentRead=True).get("Item")
+        old_members = [m["S"] for m in item["members"]["L"]] if item else []
+        old_updated_at = item["updated_at"]["S"] if item else None
+
+        old_ts, new_ts = _parse_updated_at(old_updated_at), _parse_updated_at(updated_at)
+        if old_ts and new_ts and old_ts >= new_ts:
+            return set()
+
+        deltas = Counter(new_members)
+        deltas.subtract(Counter(old_members))
+        total_deltas = _severity_counter(new_members)
+        total_deltas.subtract(_severity_counter(old_members))
+        counters: dict[str, dict[str, int]] = {}
+        for member, delta in deltas.items():
+            if delta:
+                scope_name, severity = member.split("|", 1)
+                counters.setdefault(f"SCOPE#{scope_name}", {})[severity] = delta
+        total = {severity: d for severity, d in total_deltas.items() if d}
+        if total:
+            counters[TOTAL_KEY] = total
+        if not item:
+            counters = {
+                counter_key: severities
+                for counter_key, severities in counters.items()
+                if not _counted_by_reconcile(finding, reconciled.get(counter_key))
+            }
+
+        state_item: dict[str, Any] = {
+            **key,
+            "members": {"L": [{"S": m} for m in new_members]},
+            "updated_at": {"S": updated_at},
+        }
+        if not new_members:
+            expires = datetime.now(timezone.utc) + timedelta(days=CLOSED_FINDING_TTL_DAYS)
+            state_item["expires_at"] = {"N": str(int(expires.timestamp()))}
+
+        put: dict[str, Any] = {"TableName": STATE_TABLE, "Item": state_item}
+        if item:
+            put["ConditionExpression"] = "updated_at = :prev"
+            put["ExpressionAttributeValues"] = {":prev": {"S": old_updated_at}}
+        else:
+            put["ConditionExpression"] = "attribute_not_exists(pk)"
+
+        transact: list[dict[str, Any]] = [{"Put": put}]
+        for counter_key, severities in counters.items():
+            names = {f"#s{i}": sev for i, sev in enumerate(severities)}
+            names["#rev"] = "revision"
+            values = {f":d{i}": {"N": str(d)} for i, d in enumerate(severities.values())}
+            values[":one"] = {"N": "1"}
+            transact.append(
+                {
+                    "Update": {
+                        "TableName": STATE_TABLE,
+                        "Key": {"pk": {"S": counter_key}},
+                        # The revision tells a running reconcile that this counter moved
+                        "UpdateExpression": "ADD "
+                        + ", ".join(f"#s{i} :d{i}" for i in range(len(severities)))
+                        + ", #rev :one",
+                        "ExpressionAttributeNames": names,
+                        "ExpressionAttributeValues": values,
+                    }
+                }
+            )
+
+        try:
+            ddb.transact_write_items(TransactItems=transact)
+            return {k.split("#", 1)[1] for k in counters if k != TOTAL_KEY}
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") != "TransactionCanceledException":
+                raise
+            logger.debug("Concurrent update of %s; retrying", finding["Id"])
+
+    logger.warning(
+        "Gave up applying finding %s after %d attempts", finding["Id"], MAX_STATE_ATTEMPTS
+    )
+    return set()
+
+
+def _counts(item: dict[str, Any]) -> dict[str, int]:
+    # Counters can dip below zero briefly around a reconcile; report those as 0
+    return {
+        attr: int(value["N"])
+        for attr, value in item.items()
+        if attr not in ("pk", "updated_at", "revision")
+        and "N" in value
+        and int(value["N"]) > 0
+    }
+
+
+def _read_counter_items(scopes: list[dict[str, str]]) -> dict[str, dict[str, Any]]:
+    """Return the SCOPE# and TOTAL counter items in the table, by key."""
+    keys = [{"pk": {"S": f"SCOPE#{s['name']}"}} for s in scopes]
+    keys.append({"pk": {"S": TOTAL_KEY}})
+    items: dict[str, dict[str, Any]] = {}
+    for start in range(0, len(keys), 100):
+        request = {STATE_TABLE: {"Keys": keys[start:start + 100], "ConsistentRead": True}}
+        while request:
+            resp = ddb.batch_get_item(RequestItems=request)
+            for item in resp.get("Responses", {}).get(STATE_TABLE, []):
+                items[item["pk"]["S"]] = item
+            request = resp.get("UnprocessedKeys") or None
+    return items
+
+
+def _read_counts(
+    scopes: list[dict[str, str]],
+) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """Return (per-scope results shaped like _evaluate_scope, TOTAL item) from the table."""
+    items = _read_counter_items(scopes)
+    results = []
+    for s in scopes:
+        by_severity = _counts(items.get(f"SCOPE#{s['name']}", {}))
+        results.append(
+            {
+                "scope": s["name"],
+                "insight": "",
+                "open_findings": sum(by_severity.values()),
+                "by_severity": by_severity,
+            }
+        )
+    return results, items.get(TOTAL_KEY, {})
+
+
+def _read_scope_counts(scopes: list[dict[str, str]]) -> list[dict[str, Any]]:
+    """Return per-scope results (same shape as _evaluate_scope) from the state table."""
+    return _read_counts(scopes)[0]
+
+
+def _read_revisions(scopes: list[dict[str, str]]) -> dict[str, int]:
+    """Return each counter's event revision, read before a reconcile queries the insights."""
+    return {
+        pk: int(item.get("revision", {}).get("N", "0"))
+        for pk, item in _read_counter_items(scopes).items()
+    }
+
+
+def _write_scope_counts(
+    results: list[dict[str, Any]],
+    total: dict[str, int],
+    reconciled_at: datetime,
+    revisions: dict[str, int] | None = None,
+) -> list[str]:
+    """Overwrite the state table's counters with authoritative insight counts.
+
+    ``reconciled_at`` is when the insights were queried; findings created
+    before it are already part of these counts. Each counter is only
+    overwritten if no event delta moved it since ``revisions`` was read, so
+    deltas applied during the reconcile are not lost; such a counter keeps
+    its event-maintained value until the next reconcile. Returns the keys of
+    the counters left unchanged.
+    """
+    revisions = revisions or {}
+    now = datetime.now(timezone.utc).isoformat()
+    items = [(f"SCOPE#{r['scope']}", r["by_severity"]) for r in results]
+    items.append((TOTAL_KEY, total))
+    skipped = []
+    for pk, by_severity in items:
+        revision = revisions.get(pk, 0)
+        item: dict[str, Any] = {
+            "pk": {"S": pk},
+            "updated_at": {"S": now},
+            "reconciled_at": {"S": reconciled_at.isoformat()},
+            "revision": {"N": str(revision)},
+        }
+        for severity, count in by_severity.items():
+            item[severity] = {"N": str(count)}
+        try:
+            ddb.put_item(
+                TableName=STATE_TABLE,
+                Item=item,
+                ConditionExpression="attribute_not_exists(revision) OR revision = :rev",
+                ExpressionAttributeValues={":rev": {"N": str(revision)}},
+            )
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            logger.info("%s changed during the reconcile; keeping its event counts", pk)
+            skipped.append(pk)
+    return skipped
+
+
+def _handle_findings_event(event: dict[str, Any]) -> dict[str, Any]:
+    """Apply a Security Hub Findings - Imported event to the per-scope counters."""
+    scopes = _load_scopes()
+    findings = (event.get("detail") or {}).get("findings") or []
+    reconciled = {
+        pk: _parse_updated_at(item.get("reconciled_at", {}).get("S"))
+        for pk, item in _read_counter_items(scopes).items()
+    }
+
+    touched: set[str] = set()
+    for finding in findings:
+        if finding.get("Id"):
+            touched |= _apply_finding(finding, scopes, reconciled)
+
+    open_findings = None
+    if touched:
+        results, total_item = _read_counts(scopes)
+        open_findings = sum(_counts(total_item).values())
+        _publish_metrics(_build_datums(results, datetime.now(timezone.utc), open_findings))
+
+    return {
+        "mode": "event",
+        "findings": len(findings),
+        "updated_scopes": sorted(touched),
+        "open_findings": open_findings,
+    }
+
 
 def lambda_handler(event: dict[str, Any], _context: Any) -> dict[str, Any]:  # noqa: D401
     """Lambda entry point."""
     logger.debug("Event: %s", event)
+    if event.get("detail-type") == FINDINGS_EVENT_TYPE:
+        if not STATE_TABLE:
+            logger.warning("Findings event received but STATE_TABLE is not set; ignoring")
+            return {"mode": "event", "status": "ignored"}
+        # Let errors propagate so the async invocation is retried; updates are idempotent
+        return _handle_findings_event(event)
+
     try:
-        insight_arn = _create_or_update_insight()
-        open_count = _get_open_findings(insight_arn)
-        _publish_metric(open_count)
-        return {"insight": insight_arn, "open_findings": open_count}
+        scopes = _load_scopes()
+        _load_insight_cache()
+        before = json.dumps(_insight_cache, sort_keys=True)
+
+        existing: dict[str, str] | None = None
+        lookup_lock = threading.Lock()
+
+        def lookup() -> dict[str, str]:
+            # Scan get_insights at most once per run, and only on a cache miss
+            nonlocal existing
+            with lookup_lock:
+                if existing is None:
+                    existing = _find_existing_insights()
+                return existing
+
+        # Read before the insights, so event deltas during the reconcile show up
+        revisions = _read_revisions(scopes) if STATE_TABLE else {}
+        reconciled_at = datetime.now(timezone.utc)
+        # A finding in several scopes is counted once in the total, from an
+        # extra insight matching any scope; one scope is its own total
+        evaluate = [*scopes, _total_scope(scopes)] if len(scopes) > 1 else scopes
+        with ThreadPoolExecutor(max_workers=min(MAX_SCOPE_WORKERS, len(evaluate))) as pool:
+            evaluated = list(pool.map(lambda s: _evaluate_scope(s, lookup), evaluate))
+        results = evaluated[: len(scopes)]
+        total = evaluated[-1]
+
+        if json.dumps(_insight_cache, sort_keys=True) != before:
+            _save_insight_cache()
+        if STATE_TABLE:
+            # Periodic reconcile: insight counts are authoritative
+            _write_scope_counts(results, total["by_severity"], reconciled_at, revisions)
+        _publish_metrics(
+            _build_datums(results, datetime.now(timezone.utc), total["open_findings"])
+        )
+        return {
+            # ARN of the insight behind open_findings, as in the single-scope version
+            "insight": total["insight"],
+            "open_findings": total["open_findings"],
+            "scopes": results,
+        }
     except Exception:
         # Never fail the function; publish 0 to keep the dashboard alive
         logger.exception("Unhandled exception in lambda_handler; publishing 0")
         _publish_metric(0)
-        return {"insight": "", "open_findings": 0, "error": "handled"}
+        return {"insight": "", "open_findings": 0, "scopes": [], "error": "handled"}
@@ -3,12 +3,30 @@
 Triggered by AWS Config when a `AWS::EC2::SecurityGroup` resource configuration
 changes. The function inspects ingress rules and publishes an alert to an SNS
 Topic if it detects that a sensitive port (e.g. 22, 3389) is exposed to the
-Internet (CIDR 0.0.0.0/0).
+Internet (CIDR 0.0.0.0/0 or ::/0).
+
+Invoked with ``{"mode": "bulk"}`` (e.g. from a scheduled EventBridge rule) it
+instead sweeps every security group in every enabled region (or the regions
+listed in ``"regions"``) and publishes one summary alert.
+
+Alerts are deduplicated by (security group, port set) for
+ALERT_DEDUP_TTL_SECONDS. With ALERT_STATE_TABLE set, new alerts are queued in
+time windows and published as one digest per window, so a burst of Config
+changes produces one message per distinct problem instead of one per change
+event. Closed windows are flushed by the first change event of each new window
+and by a scheduled ``{"mode": "flush"}`` invocation, which also covers the
+last window of a burst.
 
 Environment variables required:
     SNS_TOPIC_ARN  – target topic for alerts
     SENSITIVE_PORTS – optional comma-separated list of additional ports (default
                       "22,3389")
+    ALERT_STATE_TABLE – optional DynamoDB table (string partition key "pk", TTL
+                        attribute "expires_at") shared by all invocations;
+                        without it deduplication is per warm container only
+    ALERT_DEDUP_TTL_SECONDS – suppress repeats of the same alert (default 3600)
+    ALERT_DIGEST_WINDOW_SECONDS – digest window length; 0 publishes each new
+                                  alert immediately (default 300)
 
 This file purposefully contains **only code** – deployment steps are handled in
 separate IaC or README instructions.
@@ -18,7 +36,10 @@ from __future__ import annotations
 import json
 import logging
 import os
-from typing import Any, Dict, List
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 import boto3
 from botocore.exceptions import ClientError
@@ -40,54 +61,339 @@ if _env_ports:
     except ValueError:
         logger.error("Invalid SENSITIVE_PORTS value – must be comma-separated ints")
 
+# Sorted once so each rule is matched with two binary searches
+SORTED_PORTS = sorted(DEFAULT_PORTS)
+
+OPEN_IPV4 = "0.0.0.0/0"
+OPEN_IPV6 = "::/0"
+ALL_PORTS = (0, 65535)
+# ICMP rules reuse FromPort/ToPort for type/code, not ports
+ICMP_PROTOCOLS = {"icmp", "icmpv6", "1", "58"}
+
+ALERT_STATE_TABLE = os.getenv("ALERT_STATE_TABLE", "")
+ALERT_DEDUP_TTL = int(os.getenv("ALERT_DEDUP_TTL_SECONDS", "3600"))
+DIGEST_WINDOW = int(os.getenv("ALERT_DIGEST_WINDOW_SECONDS", "300"))
+# Closed windows a flush looks back over at least, in case flushes were missed
+DIGEST_LOOKBACK_WINDOWS = 12
+
 sns = boto3.client("sns")
+ddb = boto3.client("dynamodb")
+
+# Fallback dedup state when no table is configured: alert key -> expiry epoch
+_recent_alerts: Dict[str, float] = {}
+# Expired entries are dropped at most this often, so warm containers stay small
+_PRUNE_INTERVAL = 60
+_last_prune = 0.0
+# Last digest window in which this container checked for closed windows
+_last_flush_window = -1
+
+def _is_open_to_internet(perm: Dict[str, Any]) -> bool:
+    if any(c.get("CidrIp") == OPEN_IPV4 for c in perm.get("IpRanges", [])):
+        return True
+    return any(c.get("CidrIpv6") == OPEN_IPV6 for c in perm.get("Ipv6Ranges", []))
+
+def _port_range(perm: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """Return the (from, to) port interval a rule covers, or None if not port-based."""
+    protocol = str(perm.get("IpProtocol", "")).lower()
+    if protocol == "-1":
+        # All traffic: AWS omits FromPort/ToPort
+        return ALL_PORTS
+    if protocol in ICMP_PROTOCOLS:
+        return None
+    from_port = perm.get("FromPort")
+    to_port = perm.get("ToPort")
+    if from_port is None or to_port is None:
+        return None
+    if from_port == -1:
+        return ALL_PORTS
+    return from_port, to_port
+
+def _sensitive_ports_in_range(from_port: int, to_port: int) -> List[int]:
+    """Return sensitive ports inside [from_port, to_port] in O(log n + matches)."""
+    return SORTED_PORTS[bisect_left(SORTED_PORTS, from_port):bisect_right(SORTED_PORTS, to_port)]
+
+def _risky_ports_for_permission(perm: Dict[str, Any]) -> List[int]:
+    if not _is_open_to_internet(perm):
+        return []
+    port_range = _port_range(perm)
+    if port_range is None:
+        return []
+    return _sensitive_ports_in_range(*port_range)
 
 def is_risky_permission(perm: Dict[str, Any]) -> bool:
     """Return True if the ingress permission is considered risky."""
-    # IPv4 ranges
-    for cidr_item in perm.get("IpRanges", []):
-        if cidr_item.get("CidrIp") == "0.0.0.0/0":
-            from_port = perm.get("FromPort")
-            to_port = perm.get("ToPort")
-            # Handle port ranges (AWS returns -1 for all ports when protocol is -1)
-            if from_port is None or to_port is None:
-                continue
-            # Check any port in range intersects sensitive ports
-            if any(p in DEFAULT_PORTS for p in range(from_port, to_port + 1)):
-                return True
-    return False
+    return bool(_risky_ports_for_permission(perm))
 
 def detect_drift(sg_config: Dict[str, Any]) -> List[int]:
     """Return list of risky ports found (may be duplicates removed)."""
     risky_ports: set[int] = set()
-    for perm in sg_config.get("ipPermissions", []):
-        if is_risky_permission(perm):
-            from_port = perm.get("FromPort")
-            to_port = perm.get("ToPort")
-            # Add all sensitive ports in the range
-            for port in DEFAULT_PORTS:
-                if from_port <= port <= to_port:
-                    risky_ports.add(port)
+    # Config items use "ipPermissions"; DescribeSecurityGroups uses "IpPermissions"
+    perms = sg_config.get("ipPermissions") or sg_config.get("IpPermissions") or []
+    for perm in perms:
+        risky_ports.update(_risky_ports_for_permission(perm))
     return sorted(risky_ports)
 
-def publish_alert(security_group_id: str, ports: List[int], account_id: str, region: str) -> None:
+def _enabled_regions() -> List[str]:
+    ec2 = boto3.client("ec2")
+    return sorted(r["RegionName"] for r in ec2.describe_regions()["Regions"])
+
+def _scan_region(ec2: Any, region: str) -> Tuple[int, List[Dict[str, Any]]]:
+    """Return (groups scanned, drifted groups) for one region."""
+    scanned = 0
+    drifted: List[Dict[str, Any]] = []
+    paginator = ec2.get_paginator("describe_security_groups")
+    for page in paginator.paginate(PaginationConfig={"PageSize": 1000}):
+        for sg in page.get("SecurityGroups", []):
+            scanned += 1
+            ports = detect_drift(sg)
+            if ports:
+                drifted.append(
+                    {
+                        "sg": sg["GroupId"],
+                        "account_id": sg.get("OwnerId", "unknown"),
+                        "region": region,
+                        "ports": ports,
+                    }
+                )
+    return scanned, drifted
+
+def scan_all_security_groups(regions: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Sweep every security group in the given (or all enabled) regions in parallel."""
+    regions = regions or _enabled_regions()
+
+    def _safe_scan(region: str) -> Tuple[int, List[Dict[str, Any]]]:
+        try:
+            ec2 = boto3.session.Session().client("ec2", region_name=region)
+            return _scan_region(ec2, region)
+        except ClientError as exc:
+            logger.error("Failed to scan security groups in %s: %s", region, exc)
+            return 0, []
+
+    scanned = 0
+    drifted: List[Dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=min(16, len(regions)) or 1) as pool:
+        for region_scanned, region_drifted in pool.map(_safe_scan, regions):
+            scanned += region_scanned
+            drifted.extend(region_drifted)
+    return {"regions": regions, "scanned": scanned, "drifted": drifted}
+
+def publish_alert(security_group_id: str, ports: List[int], account_id: str, region: str) -> bool:
+    """Publish one alert; return True if SNS accepted it."""
     if not SNS_TOPIC_ARN:
         logger.debug("SNS topic not set – skipping publish")
-        return
+        return False
     message = (
         f"Security Group {security_group_id} in account {account_id}/{region} has "
-        f"risky ingress rules: ports {ports} open to 0.0.0.0/0"
+        f"risky ingress rules: ports {ports} open to the Internet ({OPEN_IPV4} or {OPEN_IPV6})"
     )
     try:
         sns.publish(TopicArn=SNS_TOPIC_ARN, Message=message, Subject="SecurityGroup Drift Detected")
         logger.info("Published alert for %s – ports=%s", security_group_id, ports)
+        return True
+    except ClientError as exc:
+        logger.error("Failed to publish SNS alert: %s", exc)
+        return False
+
+def _publish_group_list(header: str, drifted: List[Dict[str, Any]], subject: str) -> bool:
+    """Publish one SNS message listing several drifted groups; True if SNS accepted it."""
+    if not SNS_TOPIC_ARN:
+        logger.debug("SNS topic not set – skipping publish")
+        return False
+    lines = [header, ""]
+    lines += [
+        f"- {d['sg']} in account {d['account_id']}/{d['region']}: ports {d['ports']}"
+        for d in drifted
+    ]
+    try:
+        sns.publish(TopicArn=SNS_TOPIC_ARN, Message="\n".join(lines), Subject=subject)
+        logger.info("Published %s for %d groups", subject, len(drifted))
+        return True
     except ClientError as exc:
         logger.error("Failed to publish SNS alert: %s", exc)
+        return False
+
+def publish_bulk_summary(drifted: List[Dict[str, Any]], scanned: int) -> bool:
+    """Publish one SNS message listing every drifted group found by a bulk sweep."""
+    return _publish_group_list(
+        f"Bulk security group sweep: {len(drifted)} of {scanned} groups expose sensitive "
+        f"ports to the Internet ({OPEN_IPV4} or {OPEN_IPV6})",
+        drifted,
+        "SecurityGroup Drift Detected (bulk sweep)",
+    )
+
+def _alert_key(security_group_id: str, ports: List[int]) -> str:
+    return f"ALERT#{security_group_id}#{','.join(str(p) for p in ports)}"
+
+def _prune_recent_alerts(now: float) -> None:
+    global _last_prune
+    if now - _last_prune < _PRUNE_INTERVAL:
+        return
+    for key in [k for k, expires in _recent_alerts.items() if expires <= now]:
+        del _recent_alerts[key]
+    _last_prune = now
+
+def _claim_alert(security_group_id: str, ports: List[int]) -> bool:
+    """Return True if this (sg, ports) alert has not been raised within the TTL.
+
+    The claim is taken before delivery so concurrent invocations cannot both
+    send it; callers release it with ``_release_alert`` if delivery fails.
+    """
+    key = _alert_key(security_group_id, ports)
+    now = time.time()
+    if not ALERT_STATE_TABLE:
+        _prune_recent_alerts(now)
+        if _recent_alerts.get(key, 0) > now:
+            return False
+        _recent_alerts[key] = now + ALERT_DEDUP_TTL
+        return True
+    try:
+        # DynamoDB TTL deletion lags, so expiry is also enforced in the condition
+        ddb.put_item(
+            TableName=ALERT_STATE_TABLE,
+            Item={"pk": {"S": key}, "expires_at": {"N": str(int(now + ALERT_DEDUP_TTL))}},
+            ConditionExpression="attribute_not_exists(pk) OR expires_at < :now",
+            ExpressionAttributeValues={":now": {"N": str(int(now))}},
+        )
+        return True
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise
+
+def _release_alert(security_group_id: str, ports: List[int]) -> None:
+    """Drop a claim whose alert was not delivered, so the next event retries it."""
+    key = _alert_key(security_group_id, ports)
+    if not ALERT_STATE_TABLE:
+        _recent_alerts.pop(key, None)
+        return
+    try:
+        ddb.delete_item(TableName=ALERT_STATE_TABLE, Key={"pk": {"S": key}})
+    except ClientError as exc:
+        logger.error("Failed to release alert claim %s: %s", key, exc)
+
+def _release_alerts(drifted: List[Dict[str, Any]]) -> None:
+    for d in drifted:
+        _release_alert(d["sg"], d["ports"])
+
+def _digest_key(window: int) -> Dict[str, Any]:
+    return {"pk": {"S": f"DIGEST#{window}"}}
+
+def _encode_alert(alert: Dict[str, Any]) -> str:
+    ports = ",".join(str(p) for p in alert["ports"])
+    return f"{alert['sg']}|{alert['account_id']}|{alert['region']}|{ports}"
+
+def _decode_alert(value: str) -> Dict[str, Any]:
+    sg, account_id, region, ports = value.split("|")
+    return {
+        "sg": sg,
+        "account_id": account_id,
+        "region": region,
+        "ports": [int(p) for p in ports.split(",")],
+    }
+
+def _lookback_windows() -> int:
+    """Closed windows a flush reads: every window whose alerts may still hold a claim.
+
+    An older window's claims have all expired, so a window is never left
+    unsent while its claims still suppress the same alert.
+    """
+    return max(DIGEST_LOOKBACK_WINDOWS, -(-ALERT_DEDUP_TTL // DIGEST_WINDOW))
+
+def queue_alert(alert: Dict[str, Any]) -> None:
+    """Add an alert to the digest of the current window."""
+    now = time.time()
+    # Kept until well after the last flush that could still claim it
+    expires = now + DIGEST_WINDOW * (_lookback_windows() + 2)
+    ddb.update_item(
+        TableName=ALERT_STATE_TABLE,
+        Key=_digest_key(int(now // DIGEST_WINDOW)),
+        UpdateExpression="ADD alerts :a SET expires_at = :e",
+        ExpressionAttributeValues={
+            ":a": {"SS": [_encode_alert(alert)]},
+            ":e": {"N": str(int(expires))},
+        },
+    )
+
+def flush_digests() -> List[Dict[str, Any]]:
+    """Claim every closed digest window and publish their alerts as one message.
+
+    Each window is claimed with a DeleteItem returning the old item, so two
+    concurrent flushes never publish the same window twice.
+    """
+    current = int(time.time() // DIGEST_WINDOW)
+    alerts: set[str] = set()
+    for window in range(current - _lookback_windows(), current):
+        old = ddb.delete_item(
+            TableName=ALERT_STATE_TABLE, Key=_digest_key(window), ReturnValues="ALL_OLD"
+        ).get("Attributes")
+        if old:
+            alerts.update(old["alerts"]["SS"])
+    drifted = [_decode_alert(a) for a in sorted(alerts)]
+    if drifted and not publish_digest(drifted):
+        # The windows are gone; releasing the claims lets the next change re-raise them
+        _release_alerts(drifted)
+    return drifted
+
+def flush_closed_windows() -> int:
+    """Flush the closed windows once per window from the change-event path.
+
+    A marker item per window lets only the first event of a window, across all
+    containers, run the flush; the scheduled flush still covers a burst's last
+    window when no later event arrives. Returns the number of alerts flushed.
+    """
+    global _last_flush_window
+    now = time.time()
+    current = int(now // DIGEST_WINDOW)
+    if current <= _last_flush_window:
+        return 0
+    _last_flush_window = current
+    try:
+        ddb.put_item(
+            TableName=ALERT_STATE_TABLE,
+            Item={
+                "pk": {"S": f"FLUSH#{current}"},
+                "expires_at": {"N": str(int(now + 2 * DIGEST_WINDOW))},
+            },
+            ConditionExpression="attribute_not_exists(pk)",
+        )
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return 0
+        raise
+    return len(flush_digests())
+
+def publish_digest(drifted: List[Dict[str, Any]]) -> bool:
+    """Publish the alerts collected in one or more digest windows."""
+    return _publish_group_list(
+        f"{len(drifted)} security groups expose sensitive ports to the Internet "
+        f"({OPEN_IPV4} or {OPEN_IPV6})",
+        drifted,
+        "SecurityGroup Drift Detected (digest)",
+    )
 
 def lambda_handler(event: Dict[str, Any], _context: Any) -> Dict[str, Any]:
     """Entry point for AWS Lambda."""
     logger.debug("Received event: %s", json.dumps(event))
 
+    if event.get("mode") == "bulk":
+        result = scan_all_security_groups(event.get("regions"))
+        logger.info(
+            "Bulk sweep scanned %d groups in %d regions; %d drifted",
+            result["scanned"],
+            len(result["regions"]),
+            len(result["drifted"]),
+        )
+        new = [d for d in result["drifted"] if _claim_alert(d["sg"], d["ports"])]
+        if new and not publish_bulk_summary(new, result["scanned"]):
+            _release_alerts(new)
+            new = []
+        return {"status": "bulk_scan", "new_alerts": len(new), **result}
+
+    if event.get("mode") == "flush":
+        if not ALERT_STATE_TABLE or DIGEST_WINDOW <= 0:
+            return {"status": "ignored"}
+        return {"status": "digest_flushed", "alerts": len(flush_digests())}
+
     invoking_event = json.loads(event.get("invokingEvent", "{}"))
     account_id = invoking_event.get("awsAccountId", "unknown")
     region = invoking_event.get("awsRegion", "unknown")
@@ -104,10 +410,31 @@ def lambda_handler(event: Dict[str, Any], _context: Any) -> Dict[str, Any]:
 
     logger.info("Evaluating Security Group %s in %s/%s", sg_id, account_id, region)
 
+    if ALERT_STATE_TABLE and DIGEST_WINDOW > 0:
+        try:
+            flush_closed_windows()
+        except ClientError as exc:
+            # The scheduled flush picks the windows up; this event is still evaluated
+            logger.error("Failed to flush closed digest windows: %s", exc)
+
     risky_ports = detect_drift(sg_conf)
     if risky_ports:
         logger.info("Risky ports detected for %s: %s", sg_id, risky_ports)
-        publish_alert(sg_id, risky_ports, account_id, region)
+        if not _claim_alert(sg_id, risky_ports):
+            logger.info("Alert for %s %s already raised – suppressed", sg_id, risky_ports)
+            return {"status": "alert_suppressed", "sg": sg_id, "ports": risky_ports}
+        if ALERT_STATE_TABLE and DIGEST_WINDOW > 0:
+            try:
+                queue_alert(
+                    {"sg": sg_id, "account_id": account_id, "region": region, "ports": risky_ports}
+                )
+            except ClientError:
+                _release_alert(sg_id, risky_ports)
+                raise
+            return {"status": "alert_queued", "sg": sg_id, "ports": risky_ports}
+        if not publish_alert(sg_id, risky_ports, account_id, region):
+            _release_alert(sg_id, risky_ports)
+            return {"status": "alert_failed", "sg": sg_id, "ports": risky_ports}
         return {"status": "alert_published", "sg": sg_id, "ports": risky_ports}
 
     logger.info("No risky ingress found for %s", sg_id)
@@ -1,8 +1,13 @@
 import os
 import io
 import json
+import re
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List
+from typing import Any, Deque, Dict, List, Optional, Tuple
 import zipfile
 
 import boto3
@@ -11,6 +16,22 @@ from botocore.exceptions import ClientError
 
 s3 = boto3.client("s3")
 
+MB = 1024 * 1024
+# S3 rejects multipart parts smaller than 5 MiB (except the last one).
+MIN_PART_SIZE = 5 * MB
+COPY_CHUNK_SIZE = 1 * MB
+
+# strftime directives in a partition_format that change within a day
+HOURLY_DIRECTIVES = set("HIklp")
+SUB_HOUR_DIRECTIVES = set("MSfXcTRrs")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
 
 def _load_env() -> Dict[str, Any]:
     bucket = os.environ["EVIDENCE_BUCKET"]
@@ -36,6 +57,15 @@ def _load_env() -> Dict[str, Any]:
         "output_prefix": output_prefix,
         "days_back": days_back,
         "sources": sources,
+        "list_workers": max(1, _env_int("LIST_WORKERS", 8)),
+        "prefetch_workers": max(1, _env_int("PREFETCH_WORKERS", 4)),
+        "prefetch_depth": max(1, _env_int("PREFETCH_DEPTH", 8)),
+        "object_spool_bytes": max(0, _env_int("OBJECT_SPOOL_MB", 8)) * MB,
+        "part_size": max(MIN_PART_SIZE, _env_int("PART_SIZE_MB", 8) * MB),
+        "spool_to_tmp": os.environ.get("SPOOL_TO_TMP", "false").lower() == "true",
+        "incremental": os.environ.get("INCREMENTAL", "false").lower() == "true",
+        "manifest_key": os.environ.get("MANIFEST_KEY")
+        or build_manifest_key(output_prefix),
     }
 
 
@@ -50,19 +80,36 @@ def lambda_handler(event, context):
         sources=cfg["sources"],
         start_time=start_time,
         end_time=end_time,
+        max_workers=cfg["list_workers"],
     )
 
-    zip_bytes, file_count = build_audit_zip(
+    key = build_s3_key(cfg["output_prefix"], end_time)
+
+    manifest: Dict[str, Dict[str, Any]] = {}
+    reused: List[Dict[str, Any]] = []
+    if cfg["incremental"]:
+        manifest = load_manifest(cfg["bucket"], cfg["manifest_key"])
+        objects, reused = split_new_evidence(objects, manifest)
+
+    packed = write_audit_pack(
         bucket=cfg["bucket"],
+        key=key,
         sources=cfg["sources"],
         objects=objects,
         start_time=start_time,
         end_time=end_time,
+        cfg=cfg,
+        reused=reused,
     )
+    file_count = len(packed)
 
-    key = build_s3_key(cfg["output_prefix"], end_time)
-
-    s3.put_object(Bucket=cfg["bucket"], Key=key, Body=zip_bytes)
+    if cfg["incremental"]:
+        save_manifest(
+            cfg["bucket"],
+            cfg["manifest_key"],
+            build_manifest_entries(packed, reused, manifest, key),
+            end_time,
+        )
 
     return {
         "statusCode": 200,
@@ -70,6 +117,7 @@ def lambda_handler(event, context):
             "message": "Lab 8 audit pack generated",
             "s3_object": f"s3://{cfg['bucket']}/{key}",
             "file_count": file_count,
+            "reused_count": len(reused),
             "time_window": {
                 "start": start_time.isoformat(),
                 "end": end_time.isoformat(),
@@ -78,76 +126,411 @@ def lambda_handler(event, context):
     }
 
 
+def _partition_step(partition_format: str) -> timedelta:
+    """Return how often a partition_format's value can change: daily or hourly.
+
+    Formats that change more often than hourly (minutes, seconds, ``%c``...)
+    would need a listing per minute or second and are rejected.
+    """
+    directives = set(re.findall(r"%[-#]?(.)", partition_format.replace("%%", "")))
+    finer = directives & SUB_HOUR_DIRECTIVES
+    if finer:
+        fields = ", ".join("%" + d for d in sorted(finer))
+        raise ValueError(
+            f"partition_format {partition_format!r} is finer than an hour "
+            f"({fields}); use a daily or hourly format"
+        )
+    if directives & HOURLY_DIRECTIVES:
+        return timedelta(hours=1)
+    return timedelta(days=1)
+
+
+def plan_source_prefixes(
+    src: Dict[str, Any],
+    start_time: datetime,
+    end_time: datetime,
+) -> List[str]:
+    """Return the S3 prefixes to list for one source within the time window.
+
+    Sources with a ``partition_format`` (a strftime pattern appended to
+    ``prefix``, e.g. ``"%Y/%m/%d/"`` or ``"ec2-inventory-%Y%m%d"``) get one
+    sub-prefix per distinct formatted day in the window, or per hour if the
+    format has an hour field (``"%Y/%m/%d/%H/"``). Sources without it fall
+    back to listing the whole prefix.
+
+    Raises:
+        ValueError: ``partition_format`` changes more often than hourly.
+    """
+    prefix = src.get("prefix")
+    if not prefix:
+        return []
+
+    partition_format = src.get("partition_format")
+    if not partition_format:
+        return [prefix]
+
+    step = _partition_step(partition_format)
+    if step == timedelta(days=1):
+        moment = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        moment = start_time.replace(minute=0, second=0, microsecond=0)
+
+    planned: List[str] = []
+    seen = set()
+    while moment <= end_time:
+        sub_prefix = prefix + moment.strftime(partition_format)
+        if sub_prefix not in seen:
+            seen.add(sub_prefix)
+            planned.append(sub_prefix)
+        moment += step
+    return planned
+
+
+def _list_prefix(
+    bucket: str,
+    prefix: str,
+    src: Dict[str, Any],
+    start_time: datetime,
+    end_time: datetime,
+) -> List[Dict[str, Any]]:
+    """List one prefix and keep objects whose LastModified is in the window."""
+    collected: List[Dict[str, Any]] = []
+    description = src.get("description")
+    iso_control = src.get("iso_control")
+
+    continuation_token = None
+    while True:
+        params: Dict[str, Any] = {
+            "Bucket": bucket,
+            "Prefix": prefix,
+        }
+        if continuation_token:
+            params["ContinuationToken"] = continuation_token
+
+        resp = s3.list_objects_v2(**params)
+        contents = resp.get("Contents", [])
+
+        for obj in contents:
+            last_modified = obj.get("LastModified")
+            if not isinstance(last_modified, datetime):
+                continue
+
+            if not (start_time <= last_modified <= end_time):
+                continue
+
+            collected.append(
+                {
+                    "bucket": bucket,
+                    "key": obj["Key"],
+                    "size": obj.get("Size"),
+                    "etag": obj.get("ETag"),
+                    "last_modified": last_modified,
+                    "description": description,
+                    "iso_control": iso_control,
+                }
+            )
+
+        if resp.get("IsTruncated"):
+            continuation_token = resp.get("NextContinuationToken")
+        else:
+            break
+
+    return collected
+
+
 def collect_evidence_objects(
     bucket: str,
     sources: List[Dict[str, Any]],
     start_time: datetime,
     end_time: datetime,
+    max_workers: int = 8,
 ) -> List[Dict[str, Any]]:
-    """List S3 objects for each configured prefix within the time window."""
+    """List S3 objects for each configured prefix within the time window.
+
+    Date-partitioned sources are narrowed to the window's sub-prefixes (see
+    ``plan_source_prefixes``) and all planned prefixes are listed in parallel,
+    so listing cost follows the window rather than the bucket's history.
+    """
     collected: List[Dict[str, Any]] = []
 
     if not sources:
         print("No SOURCE_DEFINITIONS provided; nothing to collect")
         return collected
 
-    for src in sources:
-        prefix = src.get("prefix")
-        if not prefix:
-            continue
-
-        description = src.get("description")
-        iso_control = src.get("iso_control")
-
-        continuation_token = None
-        while True:
-            params: Dict[str, Any] = {
-                "Bucket": bucket,
-                "Prefix": prefix,
-            }
-            if continuation_token:
-                params["ContinuationToken"] = continuation_token
-
-            resp = s3.list_objects_v2(**params)
-            contents = resp.get("Contents", [])
-
-            for obj in contents:
-                last_modified = obj.get("LastModified")
-                if not isinstance(last_modified, datetime):
-                    continue
-
-                if not (start_time <= last_modified <= end_time):
-                    continue
+    tasks = [
+        (prefix, src)
+        for src in sources
+        for prefix in plan_source_prefixes(src, start_time, end_time)
+    ]
+    if not tasks:
+        return collected
 
-                collected.append(
-                    {
-                        "bucket": bucket,
-                        "key": obj["Key"],
-                        "size": obj.get("Size"),
-                        "last_modified": last_modified,
-                        "description": description,
-                        "iso_control": iso_control,
-                    }
-                )
-
-            if resp.get("IsTruncated"):
-                continuation_token = resp.get("NextContinuationToken")
-            else:
-                break
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as pool:
+        results = pool.map(
+            lambda task: _list_prefix(bucket, task[0], task[1], start_time, end_time),
+            tasks,
+        )
+        for objects in results:
+            collected.extend(objects)
 
     return collected
 
 
+def load_manifest(bucket: str, manifest_key: str) -> Dict[str, Dict[str, Any]]:
+    """Return {object key: {etag, size, pack}} from the previous run, or {}."""
+    try:
+        resp = s3.get_object(Bucket=bucket, Key=manifest_key)
+        parsed = json.loads(resp["Body"].read())
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            print(f"Failed to read manifest {manifest_key}: {e}")
+        return {}
+    except json.JSONDecodeError:
+        print(f"WARNING: manifest {manifest_key} is not valid JSON; rebuilding")
+        return {}
+
+    entries = parsed.get("entries") if isinstance(parsed, dict) else None
+    return entries if isinstance(entries, dict) else {}
+
+
+def split_new_evidence(
+    objects: List[Dict[str, Any]],
+    manifest: Dict[str, Dict[str, Any]],
+) -> (List[Dict[str, Any]], List[Dict[str, Any]]):
+    """Split objects into (new or changed, already packed) using key, ETag and size."""
+    new_objects: List[Dict[str, Any]] = []
+    reused: List[Dict[str, Any]] = []
+
+    for obj in objects:
+        entry = manifest.get(obj["key"])
+        if (
+            entry
+            and entry.get("pack")
+            and entry.get("etag") == obj.get("etag")
+            and entry.get("size") == obj.get("size")
+        ):
+            reused.append({**obj, "pack": entry["pack"]})
+        else:
+            new_objects.append(obj)
+
+    return new_objects, reused
+
+
+def build_manifest_entries(
+    packed: List[Dict[str, Any]],
+    reused: List[Dict[str, Any]],
+    previous: Dict[str, Dict[str, Any]],
+    pack_key: str,
+) -> Dict[str, Dict[str, Any]]:
+    """Return manifest entries for every object in the current window.
+
+    Objects that dropped out of the window are not carried forward, so the
+    manifest stays proportional to the window rather than the bucket history.
+    """
+    entries: Dict[str, Dict[str, Any]] = {}
+    for obj in reused:
+        entries[obj["key"]] = previous[obj["key"]]
+    for obj in packed:
+        entries[obj["key"]] = {
+            "etag": obj.get("etag"),
+            "size": obj.get("size"),
+            "pack": pack_key,
+        }
+    return entries
+
+
+def save_manifest(
+    bucket: str,
+    manifest_key: str,
+    entries: Dict[str, Dict[str, Any]],
+    timestamp: datetime,
+) -> None:
+    body = json.dumps(
+        {"updated_at": timestamp.isoformat(), "entries": entries},
+        indent=2,
+    ).encode("utf-8")
+    s3.put_object(
+        Bucket=bucket,
+        Key=manifest_key,
+        Body=body,
+        ContentType="application/json",
+    )
+
+
+class MultipartUploadWriter(io.RawIOBase):
+    """Write-only, non-seekable stream that uploads to S3 in multipart chunks.
+
+    Only one part is buffered at a time, so memory stays at ``part_size``
+    regardless of how large the object grows. ``zipfile`` detects that the
+    stream cannot seek and writes data descriptors instead of rewinding.
+    """
+
+    def __init__(self, bucket: str, key: str, part_size: int = 8 * MB):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(MIN_PART_SIZE, part_size)
+        self._buffer = bytearray()
+        self._parts: List[Dict[str, Any]] = []
+        self._position = 0
+        self._upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed MultipartUploadWriter")
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            chunk = bytes(self._buffer[: self.part_size])
+            del self._buffer[: self.part_size]
+            self._upload_part(chunk)
+        return len(data)
+
+    def _upload_part(self, chunk: bytes) -> None:
+        part_number = len(self._parts) + 1
+        resp = s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=chunk,
+        )
+        self._parts.append({"ETag": resp["ETag"], "PartNumber": part_number})
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._parts:
+                self._upload_part(bytes(self._buffer))
+                self._buffer = bytearray()
+            s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            super().close()
+
+    def abort(self) -> None:
+        """Abandon the upload so S3 does not keep orphaned parts around."""
+        try:
+            s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+        except ClientError as e:
+            print(f"Failed to abort multipart upload for {self.key}: {e}")
+        self._buffer = bytearray()
+        if not self.closed:
+            super().close()
+
+
+def write_audit_pack(
+    bucket: str,
+    key: str,
+    sources: List[Dict[str, Any]],
+    objects: List[Dict[str, Any]],
+    start_time: datetime,
+    end_time: datetime,
+    cfg: Dict[str, Any],
+    reused: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """Build the audit pack, store it at s3://bucket/key and return packed objects.
+
+    By default the ZIP is streamed straight into a multipart upload. With
+    ``SPOOL_TO_TMP=true`` it is written to ``/tmp`` first and then uploaded
+    with the managed transfer, which retries individual parts.
+    """
+    build_kwargs = {
+        "bucket": bucket,
+        "sources": sources,
+        "objects": objects,
+        "start_time": start_time,
+        "end_time": end_time,
+        "reused": reused,
+        "prefetch_workers": cfg["prefetch_workers"],
+        "prefetch_depth": cfg["prefetch_depth"],
+        "object_spool_bytes": cfg["object_spool_bytes"],
+    }
+
+    if cfg["spool_to_tmp"]:
+        with tempfile.TemporaryFile() as tmp:
+            packed = build_audit_zip(output=tmp, **build_kwargs)
+            tmp.seek(0)
+            s3.upload_fileobj(tmp, bucket, key)
+        return packed
+
+    writer = MultipartUploadWriter(bucket, key, part_size=cfg["part_size"])
+    try:
+        packed = build_audit_zip(output=writer, **build_kwargs)
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+    return packed
+
+
+def _fetch_object(bucket: str, key: str, spool_bytes: int):
+    """Download one object into a spooled temp file (memory up to spool_bytes)."""
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    try:
+        resp = s3.get_object(Bucket=bucket, Key=key)
+        shutil.copyfileobj(resp["Body"], spool, COPY_CHUNK_SIZE)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _zip_info_for(zip_path: str, obj: Dict[str, Any]) -> zipfile.ZipInfo:
+    last_modified = obj.get("last_modified")
+    if isinstance(last_modified, datetime):
+        date_time = last_modified.timetuple()[:6]
+    else:
+        date_time = datetime.now(timezone.utc).timetuple()[:6]
+    info = zipfile.ZipInfo(zip_path, date_time=date_time)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    # A known size lets zipfile pick ZIP64 headers up front for huge objects.
+    info.file_size = obj.get("size") or 0
+    return info
+
+
 def build_audit_zip(
     bucket: str,
     sources: List[Dict[str, Any]],
     objects: List[Dict[str, Any]],
     start_time: datetime,
     end_time: datetime,
-) -> (bytes, int):
-    """Create an in-memory ZIP of all collected evidence and a README file."""
-    buffer = io.BytesIO()
-    zf = zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED)
+    output,
+    reused: Optional[List[Dict[str, Any]]] = None,
+    prefetch_workers: int = 4,
+    prefetch_depth: int = 8,
+    object_spool_bytes: int = 8 * MB,
+) -> List[Dict[str, Any]]:
+    """Stream a ZIP of collected evidence and a README file into output.
+
+    Objects are prefetched by a thread pool with at most ``prefetch_depth``
+    downloads in flight, and written into the ZIP in the order of
+    ``objects``, so the same inputs always produce the same pack. Memory use
+    is bounded by roughly ``prefetch_depth * object_spool_bytes``; larger
+    objects spill to ``/tmp``.
+
+    ``reused`` objects were already packed by an earlier run (incremental
+    mode); they are not downloaded, only referenced in the README. Returns
+    the objects that were actually written into this ZIP.
+    """
+    zf = zipfile.ZipFile(output, mode="w", compression=zipfile.ZIP_DEFLATED)
 
     lines: List[str] = []
     lines.append("AWS GRC Audit Pack")
@@ -156,32 +539,75 @@ def build_audit_zip(
     lines.append("")
     lines.append("Included evidence files:")
 
-    file_count = 0
+    packed: List[Dict[str, Any]] = []
+    pending_objects = iter(objects)
 
-    for obj in objects:
-        key = obj["key"]
-        description = obj.get("description")
-        iso_control = obj.get("iso_control")
+    with ThreadPoolExecutor(max_workers=prefetch_workers) as pool:
+        # Drained first-in, first-out so entries keep submission order
+        in_flight: Deque[Tuple[Future, Dict[str, Any]]] = deque()
 
-        try:
-            resp = s3.get_object(Bucket=bucket, Key=key)
-            body = resp["Body"].read()
-        except ClientError as e:
-            print(f"Failed to fetch object {key}: {e}")
-            continue
+        def _submit_next() -> bool:
+            obj: Optional[Dict[str, Any]] = next(pending_objects, None)
+            if obj is None:
+                return False
+            future = pool.submit(_fetch_object, bucket, obj["key"], object_spool_bytes)
+            in_flight.append((future, obj))
+            return True
 
-        zip_path = f"evidence/{key}"
-        zf.writestr(zip_path, body)
-        file_count += 1
+        while len(in_flight) < prefetch_depth and _submit_next():
+            pass
 
-        lines.append(f"- {zip_path}")
-        if description:
-            lines.append(f"  Description: {description}")
-        if iso_control:
-            lines.append(f"  ISO 27001: {iso_control}")
+        try:
+            while in_flight:
+                future, obj = in_flight.popleft()
+                key = obj["key"]
+                description = obj.get("description")
+                iso_control = obj.get("iso_control")
+
+                try:
+                    body = future.result()
+                except ClientError as e:
+                    print(f"Failed to fetch object {key}: {e}")
+                    _submit_next()
+                    continue
+
+                zip_path = f"evidence/{key}"
+                with body, zf.open(_zip_info_for(zip_path, obj), mode="w") as dest:
+                    shutil.copyfileobj(body, dest, COPY_CHUNK_SIZE)
+                packed.append(obj)
+
+                lines.append(f"- {zip_path}")
+                if description:
+                    lines.append(f"  Description: {description}")
+                if iso_control:
+                    lines.append(f"  ISO 27001: {iso_control}")
+
+                _submit_next()
+        finally:
+            # After a failure, drop queued downloads and close the spool files
+            # of those already running or finished
+            for future, _ in in_flight:
+                if future.cancel():
+                    continue
+                try:
+                    future.result().close()
+                except Exception:
+                    pass
 
-    if not objects:
+    if not objects and not reused:
         lines.append("(No evidence files found for the configured time window.)")
+    elif not objects:
+        lines.append("(No new evidence since the previous audit pack.)")
+
+    if reused:
+        lines.append("")
+        lines.append("Unchanged evidence included in earlier audit packs:")
+        for obj in reused:
+            lines.append(f"- evidence/{obj['key']} (in s3://{bucket}/{obj['pack']})")
+            if obj.get("description"):
+                lines.append(f"  Description: {obj['description']}")
+            if obj.get("iso_control"):
+                lines.append(f"  ISO 27001: {obj['iso_control']}")
 
     lines.append("")
     lines.append("Source configuration summary:")
@@ -200,8 +626,7 @@ def build_audit_zip(
     zf.writestr("README_AUDIT_PACK.txt", readme_text.encode("utf-8"))
 
     zf.close()
-    buffer.seek(0)
-    return buffer.read(), file_count
+    return packed
 
 
 def build_s3_key(output_prefix: str, timestamp: datetime) -> str:
@@ -210,3 +635,10 @@ def build_s3_key(output_prefix: str, timestamp: datetime) -> str:
         output_prefix = output_prefix + "/"
     ts = timestamp.strftime("%Y%m%dT%H%M%SZ")
     return f"{output_prefix}audit-pack-{ts}.zip"
+
+
+def build_manifest_key(output_prefix: str) -> str:
+    """Build S3 key like audit-packs/audit-pack-manifest.json."""
+    if output_prefix and not output_prefix.endswith("/"):
+        output_prefix = output_prefix + "/"
+    return f"{output_prefix}audit-pack-manifest.json"
@@ -1,10 +1,12 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import unquote_plus
 
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import ClientError, ParamValidationError
 
 s3 = boto3.client("s3")
 securityhub = boto3.client("securityhub")
@@ -34,6 +36,9 @@ def _load_env() -> Dict[str, Any]:
         "dashboard_prefix": dashboard_prefix,
         "max_age_days": max_age_days,
         "controls": controls,
+        "use_freshness_index": os.environ.get("FRESHNESS_INDEX", "false").lower() == "true",
+        "freshness_index_key": os.environ.get("FRESHNESS_INDEX_KEY")
+        or build_freshness_index_key(dashboard_prefix),
     }
 
 
@@ -41,11 +46,35 @@ def lambda_handler(event, context):
     cfg = _load_env()
 
     now = datetime.now(timezone.utc)
+
+    prefixes = [c["evidence_prefix"] for c in cfg["controls"] if c.get("evidence_prefix")]
+    index_entries = None
+    fresh_entries = None
+    if cfg["use_freshness_index"]:
+        index_entries, _ = load_freshness_index(cfg["bucket"], cfg["freshness_index_key"])
+        # Entries older than the freshness window are rescanned, so a missed
+        # S3 event cannot leave a control marked Stale for good.
+        max_age = timedelta(days=cfg["max_age_days"])
+        fresh_entries = {p: ts for p, ts in index_entries.items() if now - ts <= max_age}
+
+    latest_by_prefix = find_latest_evidence(cfg["bucket"], prefixes, fresh_entries)
+
+    if index_entries is not None:
+        # Seed the index with anything we had to scan so the next run skips it.
+        backfill = {
+            p: ts
+            for p, ts in latest_by_prefix.items()
+            if ts and (p not in index_entries or ts > index_entries[p])
+        }
+        if backfill:
+            update_freshness_index(cfg["bucket"], cfg["freshness_index_key"], backfill)
+
     controls_summary = summarize_controls(
         bucket=cfg["bucket"],
         controls=cfg["controls"],
         max_age_days=cfg["max_age_days"],
         now=now,
+        latest_by_prefix=latest_by_prefix,
     )
 
     sh_summary = summarize_security_hub()
@@ -83,16 +112,25 @@ def summarize_controls(
     controls: List[Dict[str, Any]],
     max_age_days: int,
     now: datetime,
+    latest_by_prefix: Optional[Dict[str, Optional[datetime]]] = None,
 ) -> List[Dict[str, Any]]:
-    """For each control, find newest evidence object and classify status."""
+    """For each control, find newest evidence object and classify status.
+
+    ``latest_by_prefix`` can be supplied from ``find_latest_evidence``;
+    otherwise every control's prefix is scanned.
+    """
     results: List[Dict[str, Any]] = []
 
+    if latest_by_prefix is None:
+        prefixes = [c["evidence_prefix"] for c in controls if c.get("evidence_prefix")]
+        latest_by_prefix = find_latest_evidence(bucket, prefixes)
+
     for ctrl in controls:
         prefix = ctrl.get("evidence_prefix")
         if not prefix:
             continue
 
-        latest = find_latest_object(bucket, prefix)
+        latest = latest_by_prefix.get(prefix)
 
         status = "Missing"
         age_days = None
@@ -120,6 +158,35 @@ def summarize_controls(
     return results
 
 
+def find_latest_evidence(
+    bucket: str,
+    prefixes: Iterable[str],
+    index_entries: Optional[Dict[str, datetime]] = None,
+    max_workers: int = 8,
+) -> Dict[str, Optional[datetime]]:
+    """Return {prefix: newest LastModified or None}.
+
+    Prefixes found in the freshness index are answered from it; the rest
+    fall back to ``find_latest_object`` scans, run in parallel.
+    """
+    latest: Dict[str, Optional[datetime]] = {}
+    to_scan: List[str] = []
+
+    for prefix in dict.fromkeys(prefixes):
+        if index_entries and prefix in index_entries:
+            latest[prefix] = index_entries[prefix]
+        else:
+            to_scan.append(prefix)
+
+    if to_scan:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_scan)))) as pool:
+            scanned = pool.map(lambda p: find_latest_object(bucket, p), to_scan)
+            for prefix, ts in zip(to_scan, scanned):
+                latest[prefix] = ts
+
+    return latest
+
+
 def find_latest_object(bucket: str, prefix: str):
     """Return the most recent LastModified datetime for objects under prefix, or None."""
     latest = None
@@ -148,39 +215,288 @@ def find_latest_object(bucket: str, prefix: str):
     return latest
 
 
+ACTIVE_FINDINGS_FILTER = {
+    "RecordState": [{"Value": "ACTIVE", "Comparison": "EQUALS"}],
+}
+SEVERITY_LABELS = ["CRITICAL", "HIGH", "MEDIUM", "LOW", "INFORMATIONAL"]
+
+# Cached across warm invocations so the insight lookup happens once per container.
+_severity_insight_arn: Optional[str] = None
+
+# Set to False once botocore rejects If-Match / If-None-Match on PutObject;
+# versions released before S3 conditional writes do not know the parameters.
+_conditional_writes_supported = True
+
+
 def summarize_security_hub() -> Dict[str, Any]:
-    """Summarize active Security Hub findings by severity label.
+    """Summarize all active Security Hub findings by severity label.
 
-    This is intentionally lightweight for the MVP: it pulls up to 100 active
-    findings and groups them by Severity.Label.
+    Counts come from a Security Hub insight grouped by ``SeverityLabel``,
+    which is one API call regardless of account size. If the insight cannot
+    be used, findings are paged per severity in parallel and only counters
+    are kept in memory.
     """
+    by_severity = _count_findings_via_insight()
+    source = "insight"
+
+    if by_severity is None:
+        by_severity = _count_findings_paginated()
+        source = "paginated"
+
+    if by_severity is None:
+        return {"total_active_findings": 0, "by_severity": {}}
+
+    total = sum(by_severity.values())
+
+    return {
+        "total_active_findings": total,
+        "by_severity": by_severity,
+        "source": source,
+    }
+
+
+def _get_severity_insight_arn() -> Optional[str]:
+    """Return the ARN of the severity insight, creating it on first use."""
+    global _severity_insight_arn
+
+    if _severity_insight_arn:
+        return _severity_insight_arn
+
+    configured = os.environ.get("SH_SEVERITY_INSIGHT_ARN")
+    if configured:
+        _severity_insight_arn = configured
+        return configured
+
+    name = os.environ.get("SH_SEVERITY_INSIGHT_NAME", "Lab9-ActiveFindingsBySeverity")
+    paginator = securityhub.get_paginator("get_insights")
+    for page in paginator.paginate():
+        for insight in page.get("Insights", []):
+            if insight.get("Name") == name:
+                _severity_insight_arn = insight["InsightArn"]
+                return _severity_insight_arn
+
+    resp = securityhub.create_insight(
+        Name=name,
+        Filters=ACTIVE_FINDINGS_FILTER,
+        GroupByAttribute="SeverityLabel",
+    )
+    _severity_insight_arn = resp["InsightArn"]
+    return _severity_insight_arn
+
+
+def _count_findings_via_insight() -> Optional[Dict[str, int]]:
+    global _severity_insight_arn
 
     try:
-        resp = securityhub.get_findings(
-            Filters={
-                "RecordState": [{"Value": "ACTIVE", "Comparison": "EQUALS"}],
-            },
-            MaxResults=100,
-        )
+        arn = _get_severity_insight_arn()
+        resp = securityhub.get_insight_results(InsightArn=arn)
     except ClientError as e:
-        print(f"Error calling Security Hub GetFindings: {e}")
-        return {"total_active_findings": 0, "by_severity": {}}
+        print(f"Security Hub severity insight unavailable, falling back to GetFindings: {e}")
+        _severity_insight_arn = None
+        return None
+
+    results = resp.get("InsightResults", {})
+    if results.get("GroupByAttribute") not in (None, "SeverityLabel"):
+        print("WARNING: severity insight is not grouped by SeverityLabel; falling back")
+        return None
 
-    findings = resp.get("Findings", [])
     by_severity: Dict[str, int] = {}
+    for value in results.get("ResultValues", []):
+        label = value.get("GroupByAttributeValue") or "UNKNOWN"
+        by_severity[label] = by_severity.get(label, 0) + int(value.get("Count", 0))
+    return by_severity
 
-    for f in findings:
-        label = f.get("Severity", {}).get("Label") or "UNKNOWN"
-        by_severity[label] = by_severity.get(label, 0) + 1
 
-    total = sum(by_severity.values())
+def _count_severity(label: str) -> int:
+    filters = dict(ACTIVE_FINDINGS_FILTER)
+    filters["SeverityLabel"] = [{"Value": label, "Comparison": "EQUALS"}]
+
+    count = 0
+    paginator = securityhub.get_paginator("get_findings")
+    for page in paginator.paginate(Filters=filters, PaginationConfig={"PageSize": 100}):
+        count += len(page.get("Findings", []))
+    return count
+
+
+def _count_findings_paginated() -> Optional[Dict[str, int]]:
+    """Count active findings per severity with one paginated stream per label."""
+    try:
+        with ThreadPoolExecutor(max_workers=len(SEVERITY_LABELS)) as pool:
+            counts = list(pool.map(_count_severity, SEVERITY_LABELS))
+    except ClientError as e:
+        print(f"Error calling Security Hub GetFindings: {e}")
+        return None
+
+    return {label: count for label, count in zip(SEVERITY_LABELS, counts) if count}
+
+
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def load_freshness_index(bucket: str, index_key: str):
+    """Return ({prefix: latest datetime}, ETag) from the index, or ({}, None)."""
+    try:
+        resp = s3.get_object(Bucket=bucket, Key=index_key)
+        parsed = json.loads(resp["Body"].read())
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            print(f"Error reading freshness index {index_key}: {e}")
+        return {}, None
+    except json.JSONDecodeError:
+        print(f"WARNING: freshness index {index_key} is not valid JSON; ignoring it")
+        return {}, None
+
+    entries: Dict[str, datetime] = {}
+    raw = parsed.get("prefixes") if isinstance(parsed, dict) else None
+    for prefix, value in (raw or {}).items():
+        ts = _parse_timestamp(value)
+        if ts is not None:
+            entries[prefix] = ts
+
+    return entries, resp.get("ETag")
+
+
+def update_freshness_index(
+    bucket: str,
+    index_key: str,
+    updates: Dict[str, datetime],
+    max_attempts: int = 5,
+) -> bool:
+    """Merge newer timestamps into the index using conditional writes.
+
+    Concurrent writers (for example several S3 event invocations) are
+    serialized with If-Match / If-None-Match; a losing writer re-reads the
+    index and retries. Returns True once the index reflects ``updates``.
+
+    With a botocore too old for conditional writes the index is written
+    unconditionally; a concurrent update may then be lost until the next
+    dashboard run rescans the prefix.
+    """
+    global _conditional_writes_supported
+
+    for _ in range(max_attempts):
+        entries, etag = load_freshness_index(bucket, index_key)
+
+        changed = False
+        for prefix, ts in updates.items():
+            if prefix not in entries or ts > entries[prefix]:
+                entries[prefix] = ts
+                changed = True
+        if not changed:
+            return True
+
+        body = json.dumps(
+            {
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "prefixes": {p: ts.isoformat() for p, ts in sorted(entries.items())},
+            },
+            indent=2,
+        ).encode("utf-8")
+        params: Dict[str, Any] = {
+            "Bucket": bucket,
+            "Key": index_key,
+            "Body": body,
+            "ContentType": "application/json",
+        }
+        if _conditional_writes_supported:
+            if etag:
+                params["IfMatch"] = etag
+            else:
+                params["IfNoneMatch"] = "*"
+
+        try:
+            s3.put_object(**params)
+            return True
+        except ParamValidationError as e:
+            print(
+                "WARNING: this botocore does not support S3 conditional writes; "
+                f"writing the freshness index unconditionally: {e}"
+            )
+            _conditional_writes_supported = False
+            params.pop("IfMatch", None)
+            params.pop("IfNoneMatch", None)
+            try:
+                s3.put_object(**params)
+            except ClientError as e2:
+                print(f"Error writing freshness index {index_key}: {e2}")
+                return False
+            return True
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                print(f"Error writing freshness index {index_key}: {e}")
+                return False
+
+    print(f"WARNING: gave up updating freshness index {index_key} after {max_attempts} attempts")
+    return False
+
+
+def record_evidence_write(
+    bucket: str,
+    object_key: str,
+    timestamp: datetime,
+    prefixes: Iterable[str],
+    index_key: str,
+) -> bool:
+    """Hook for evidence writers: bump every tracked prefix that object_key falls under."""
+    updates = {p: timestamp for p in prefixes if object_key.startswith(p)}
+    if not updates:
+        return True
+    return update_freshness_index(bucket, index_key, updates)
+
+
+def freshness_index_handler(event, context):
+    """Entry point for S3 ObjectCreated notifications on the evidence bucket.
+
+    Configure the bucket notification (filtered to the evidence prefixes) to
+    invoke this handler; it keeps the freshness index up to date so
+    ``lambda_handler`` can read one object instead of listing every prefix.
+    """
+    cfg = _load_env()
+    prefixes = [c["evidence_prefix"] for c in cfg["controls"] if c.get("evidence_prefix")]
+
+    updates: Dict[str, datetime] = {}
+    for record in event.get("Records", []):
+        if not str(record.get("eventName", "")).startswith("ObjectCreated"):
+            continue
+        s3_info = record.get("s3", {})
+        if s3_info.get("bucket", {}).get("name") != cfg["bucket"]:
+            continue
+        key = unquote_plus(s3_info.get("object", {}).get("key", ""))
+        if not key or key == cfg["freshness_index_key"]:
+            continue
+        ts = _parse_timestamp(record.get("eventTime", "")) or datetime.now(timezone.utc)
+        for prefix in prefixes:
+            if key.startswith(prefix) and (prefix not in updates or ts > updates[prefix]):
+                updates[prefix] = ts
+
+    ok = True
+    if updates:
+        ok = update_freshness_index(cfg["bucket"], cfg["freshness_index_key"], updates)
 
     return {
-        "total_active_findings": total,
-        "by_severity": by_severity,
+        "statusCode": 200 if ok else 500,
+        "body": {
+            "message": "Lab 9 freshness index updated" if ok else "Freshness index update failed",
+            "updated_prefixes": sorted(updates),
+        },
     }
 
 
+def build_freshness_index_key(prefix: str) -> str:
+    """Return the S3 key for the freshness index, ensuring trailing slash in prefix."""
+    if prefix and not prefix.endswith("/"):
+        prefix = prefix + "/"
+    return f"{prefix}evidence-freshness.json"
+
+
 def build_dashboard_key(prefix: str) -> str:
     """Return the S3 key for the dashboard JSON, ensuring trailing slash in prefix."""
     if prefix and not prefix.endswith("/"):
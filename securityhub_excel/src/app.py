@@ -1,16 +1,30 @@
 """
 Lambda entry point that:
-1. Pulls ACTIVE findings from AWS Security Hub
-2. Writes them into an Excel workbook (openpyxl)
+1. Pulls ACTIVE findings from AWS Security Hub (optionally from several
+   regions in parallel, deduplicated by finding Id)
+2. Streams them into an Excel workbook (openpyxl write-only mode), with
+   severity pivots by control, resource type, account and age on extra sheets
 3. Uploads the workbook to a versioned S3 bucket
 """
 
 import datetime
-import io
+import logging
 import os
+import queue
+import tempfile
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import BotoCoreError, ClientError
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 # ---------- AWS clients ----------
 SECURITY_HUB = boto3.client("securityhub")
@@ -19,78 +33,296 @@ S3 = boto3.client("s3")
 # Bucket is injected via environment variable in the template
 BUCKET = os.environ["REPORT_BUCKET"]
 
+# Workbooks smaller than this stay in memory; larger ones spill to /tmp
+SPOOL_MAX_BYTES = int(os.environ.get("SPOOL_MAX_MB", "16")) * 1024 * 1024
+UPLOAD_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+)
+
+# Empty = this region only; "all" = every enabled region; or "us-east-1,eu-west-1"
+REGIONS = os.environ.get("SECURITY_HUB_REGIONS", "").strip()
+# Rows buffered between the region workers and the workbook writer
+REGION_QUEUE_SIZE = 1000
+
+
+# Detail-sheet columns come first; the remaining fields only feed the summaries
+HEADERS = [
+    "Id",
+    "Title",
+    "Severity",
+    "Compliance (first)",
+    "FirstObserved",
+    "ResourceId",
+]
+FindingRow = namedtuple(
+    "FindingRow",
+    [
+        "id",
+        "title",
+        "severity",
+        "compliance",
+        "first_observed",
+        "resource_id",
+        "control",
+        "resource_type",
+        "account_id",
+        "region",
+    ],
+)
+
+SEVERITY_ORDER = ["CRITICAL", "HIGH", "MEDIUM", "LOW", "INFORMATIONAL"]
+AGE_BUCKETS = [
+    (7, "0-7 days"),
+    (30, "8-30 days"),
+    (90, "31-90 days"),
+    (None, ">90 days"),
+]
+
+# (sheet title, first column header, FindingRow field used as the row key)
+SUMMARY_SHEETS = [
+    ("By Control", "Control", "control"),
+    ("By Resource Type", "Resource Type", "resource_type"),
+    ("By Account", "Account", "account_id"),
+    ("By Region", "Region", "region"),
+    ("By Age", "Age", "age_bucket"),
+]
+
 
 def handler(event, context):
     """Main Lambda handler"""
-    findings = _get_active_findings()
-    wb = _build_workbook(findings)
+    regions = _target_regions()
+    skipped = []
+    if regions:
+        rows = _get_multi_region_findings(regions, skipped)
+    else:
+        rows = _get_active_findings()
+    wb, count = _build_workbook(rows)
     key = _upload_to_s3(wb)
 
     # Log where the report is stored for troubleshooting
-    print(f"Report saved to s3://{BUCKET}/{key} ({len(findings)} findings)")
-    return {"key": key, "count": len(findings)}
+    logger.info("Report saved to s3://%s/%s (%d findings)", BUCKET, key, count)
+    return {"key": key, "count": count, "skipped_regions": sorted(skipped)}
 
 
 # ---------- Helper functions ----------
 
 
-def _get_active_findings():
-    """Return a flat list of ACTIVE Security Hub findings"""
-    paginator = SECURITY_HUB.get_paginator("get_findings")
+def _target_regions():
+    """Return the regions to query, or [] for the Lambda's own region only"""
+    if not REGIONS:
+        return []
+    if REGIONS.lower() == "all":
+        ec2 = boto3.client("ec2")
+        return sorted(r["RegionName"] for r in ec2.describe_regions()["Regions"])
+    return [r.strip() for r in REGIONS.split(",") if r.strip()]
+
+
+def _get_multi_region_findings(regions, skipped=None):
+    """Yield rows from every region's Security Hub, merged and deduplicated
+
+    Each region is paged by its own worker thread, with its own boto3
+    session, into a bounded queue, so the slowest region sets the runtime
+    rather than the sum of all regions.
+    A cross-region aggregator also returns findings from its linked regions;
+    those duplicates are dropped by finding Id.
+
+    Regions whose Security Hub API fails are appended to ``skipped``; any
+    other worker error is re-raised once the remaining regions are read.
+    """
+    if not regions:
+        return
+    if skipped is None:
+        skipped = []
+    rows = queue.Queue(maxsize=REGION_QUEUE_SIZE)
+    stop = threading.Event()
+    finished = object()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                rows.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(region):
+        try:
+            client = boto3.session.Session().client("securityhub", region_name=region)
+            for row in _get_active_findings(client):
+                if not _put(row):
+                    return
+        except (BotoCoreError, ClientError) as exc:
+            # e.g. Security Hub not enabled in an opted-in region
+            logger.warning("Skipping region %s: %s", region, exc)
+            skipped.append(region)
+        finally:
+            _put(finished)
+
+    with ThreadPoolExecutor(max_workers=len(regions)) as pool:
+        futures = [pool.submit(_worker, region) for region in regions]
+
+        seen = set()
+        remaining = len(regions)
+        try:
+            while remaining:
+                row = rows.get()
+                if row is finished:
+                    remaining -= 1
+                elif row.id not in seen:
+                    seen.add(row.id)
+                    yield row
+            # Surface unexpected worker errors instead of a silently short report
+            for future in futures:
+                future.result()
+        finally:
+            # Unblock workers if the consumer stops early
+            stop.set()
+
+
+def _get_active_findings(client=None):
+    """Yield one compact row tuple per ACTIVE Security Hub finding
+
+    GetFindings cannot project fields server-side, so each page is reduced
+    to the exported columns as soon as it arrives and the full ASFF
+    documents are dropped with the page. Memory scales with one page.
+    """
+    paginator = (client or SECURITY_HUB).get_paginator("get_findings")
     pages = paginator.paginate(
-        Filters={"RecordState": [{"Value": "ACTIVE", "Comparison": "EQUALS"}]}
+        Filters={"RecordState": [{"Value": "ACTIVE", "Comparison": "EQUALS"}]},
+        PaginationConfig={"PageSize": 100},
     )
-    findings = [f for page in pages for f in page["Findings"]]
-    return findings
-
-
-def _build_workbook(findings):
-    """Convert findings list into an Excel workbook object"""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Findings"
-
-    # Column headers
-    headers = [
-        "Id",
-        "Title",
-        "Severity",
-        "Compliance (first)",
-        "FirstObserved",
-        "ResourceId",
-    ]
-    ws.append(headers)
-    for cell in ws[1]:
-        cell.font = cell.font.copy(bold=True)
+    for page in pages:
+        for f in page.pop("Findings", []):
+            yield _to_row(f)
+
+
+def _to_row(f):
+    """Project an ASFF finding onto the exported and summary fields"""
+    compliance = f.get("Compliance") or {}
+    requirements = compliance.get("RelatedRequirements") or [""]
+    resources = f.get("Resources") or [{}]
+    return FindingRow(
+        f["Id"],
+        (f.get("Title") or "")[:250],
+        (f.get("Severity") or {}).get("Label", ""),
+        requirements[0],
+        (f.get("FirstObservedAt") or f.get("CreatedAt") or "")[:10],
+        resources[0].get("Id", ""),
+        compliance.get("SecurityControlId") or "",
+        resources[0].get("Type", ""),
+        f.get("AwsAccountId", ""),
+        f.get("Region", ""),
+    )
+
+
+class _Aggregates:
+    """Severity pivots built in the same pass that writes the detail rows"""
+
+    def __init__(self, today=None):
+        self.today = today or datetime.date.today()
+        self.counts = {field: Counter() for _, _, field in SUMMARY_SHEETS}
+        self.severities = set()
+
+    def add(self, row):
+        severity = row.severity or "UNKNOWN"
+        self.severities.add(severity)
+        for _, _, field in SUMMARY_SHEETS:
+            if field == "age_bucket":
+                key = self._age_bucket(row.first_observed)
+            else:
+                key = getattr(row, field) or "(none)"
+            self.counts[field][(key, severity)] += 1
+
+    def _age_bucket(self, first_observed):
+        try:
+            observed = datetime.date.fromisoformat(first_observed)
+        except ValueError:
+            return "Unknown"
+        age = (self.today - observed).days
+        for limit, label in AGE_BUCKETS:
+            if limit is None or age <= limit:
+                return label
+
+    def severity_columns(self):
+        known = [s for s in SEVERITY_ORDER if s in self.severities]
+        return known + sorted(self.severities.difference(SEVERITY_ORDER))
+
+    def pivot(self, field):
+        """Return [key, count per severity..., total] rows, largest total first"""
+        columns = self.severity_columns()
+        table = {}
+        for (key, severity), count in self.counts[field].items():
+            table.setdefault(key, Counter())[severity] = count
+        rows = [
+            [key] + [cells[s] for s in columns] + [sum(cells.values())]
+            for key, cells in table.items()
+        ]
+        if field == "age_bucket":
+            order = [label for _, label in AGE_BUCKETS] + ["Unknown"]
+            rows.sort(key=lambda r: order.index(r[0]))
+        else:
+            rows.sort(key=lambda r: (-r[-1], r[0]))
+        return rows
+
+
+def _header_row(ws, headers):
+    """Return bold WriteOnlyCells for a header row"""
+    bold = Font(bold=True)
+    cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = bold
+        cells.append(cell)
+    return cells
+
+
+def _build_workbook(rows, today=None):
+    """Stream rows into a write-only workbook; return (workbook, row count)
+
+    Write-only worksheets flush each row to a temporary file instead of
+    keeping a cell object model, so memory does not grow with the row count.
+    Summary pivots are counted while the detail rows stream past and are
+    written as extra sheets afterwards, so the data is read only once.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Findings")
+    ws.append(_header_row(ws, HEADERS))
 
     # Data rows
-    for f in findings:
-        ws.append(
-            [
-                f["Id"],
-                f["Title"][:250],
-                f["Severity"]["Label"],
-                (f.get("Compliance") or {}).get("RelatedRequirements", [""])[0],
-                (f.get("FirstObservedAt") or f.get("CreatedAt") or "")[:10],
-                f["Resources"][0]["Id"],
-            ]
-        )
-    return wb
+    aggregates = _Aggregates(today)
+    count = 0
+    for row in rows:
+        ws.append(row[: len(HEADERS)])
+        aggregates.add(row)
+        count += 1
+
+    # Summary sheets
+    columns = aggregates.severity_columns()
+    for title, key_header, field in SUMMARY_SHEETS:
+        summary = wb.create_sheet(title)
+        summary.append(_header_row(summary, [key_header] + columns + ["Total"]))
+        for pivot_row in aggregates.pivot(field):
+            summary.append(pivot_row)
+    return wb, count
 
 
 def _upload_to_s3(wb):
-    """Upload workbook bytes to S3 and return the object key"""
+    """Save the workbook to a spooled temp file, upload it and return the key"""
     today = datetime.date.today()
     key = f"reports/{today}/securityhub.xlsx"
 
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as buf:
+        wb.save(buf)
+        buf.seek(0)
 
-    S3.put_object(
-        Bucket=BUCKET,
-        Key=key,
-        Body=buf.getvalue(),
-        ACL="bucket-owner-full-control",
-    )
+        # upload_fileobj switches to multipart above the configured threshold
+        S3.upload_fileobj(
+            buf,
+            BUCKET,
+            key,
+            ExtraArgs={"ACL": "bucket-owner-full-control"},
+            Config=UPLOAD_CONFIG,
+        )
     return key
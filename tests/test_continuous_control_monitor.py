@@ -0,0 +1,364 @@
+"""Unit tests for the Lab 6 continuous control monitor with mocked AWS clients."""
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+MODULE_PATH = (
+    Path(__file__).resolve().parents[1]
+    / "labs"
+    / "lab6_continuous_monitoring"
+    / "continuous_control_monitor.py"
+)
+
+spec = importlib.util.spec_from_file_location("continuous_control_monitor", MODULE_PATH)
+assert spec and spec.loader, "Cannot load continuous_control_monitor.py"
+
+monitor = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(monitor)  # type: ignore
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    """Replace the Security Hub and CloudWatch clients with mocks."""
+    sh = MagicMock()
+    sh.get_paginator.return_value.paginate.return_value = [
+        {"Insights": [{"Name": "Prod-OpenFindings", "InsightArn": "arn:insight/prod"}]}
+    ]
+    sh.create_insight.return_value = {"InsightArn": "arn:insight/pci"}
+    sh.get_insight_results.return_value = {
+        "InsightResults": {
+            "ResultValues": [
+                {"GroupByAttributeValue": "HIGH", "Count": 2},
+                {"GroupByAttributeValue": "LOW", "Count": 5},
+            ]
+        }
+    }
+    cw = MagicMock()
+    monkeypatch.setattr(monitor, "sh", sh)
+    monkeypatch.setattr(monitor, "cw", cw)
+    # Each test starts cold: no warm-container cache and no persisted cache
+    monkeypatch.setattr(monitor, "_insight_cache", {})
+    monkeypatch.setattr(monitor, "_insight_cache_loaded", False)
+    monkeypatch.setattr(monitor, "INSIGHT_CACHE_PARAMETER", "")
+    monkeypatch.setattr(monitor, "INSIGHT_CACHE_FILE", "")
+    monkeypatch.setenv(
+        "MONITOR_SCOPES",
+        json.dumps(
+            [
+                {"name": "Prod", "tag_key": "Environment", "tag_value": "Prod"},
+                {"name": "PCI", "tag_key": "DataClass", "tag_value": "PCI"},
+            ]
+        ),
+    )
+    return sh, cw
+
+
+def test_scopes_publish_severity_breakdown_in_one_batch(clients):
+    """All scope and severity datapoints should go out in a single PutMetricData call."""
+    sh, cw = clients
+
+    result = monitor.lambda_handler({}, None)
+
+    # The total comes from the all-scopes insight, which the mock also answers with 7
+    assert result["open_findings"] == 7
+    assert [r["scope"] for r in result["scopes"]] == ["Prod", "PCI"]
+    sh.get_paginator.assert_called_once_with("get_insights")
+    cw.put_metric_data.assert_called_once()
+    datums = cw.put_metric_data.call_args.kwargs["MetricData"]
+    # total + 2 scopes + 2 severities per scope
+    assert len(datums) == 7
+    assert {"Name": "Severity", "Value": "LOW"} in datums[-1]["Dimensions"]
+
+
+def test_put_metric_data_is_chunked_at_1000_datums(clients):
+    """Large datum sets must be split into API-sized batches."""
+    _, cw = clients
+    datums = [{"MetricName": "OpenFindings", "Value": i, "Unit": "Count"} for i in range(2500)]
+
+    monitor._publish_metrics(datums)
+
+    sizes = [len(c.kwargs["MetricData"]) for c in cw.put_metric_data.call_args_list]
+    assert sizes == [1000, 1000, 500]
+
+
+def test_emf_mode_prints_metrics_instead_of_calling_the_api(clients, monkeypatch, capsys):
+    """EMF mode should log structured metric records and make no PutMetricData calls."""
+    _, cw = clients
+    monkeypatch.setattr(monitor, "METRICS_MODE", "emf")
+
+    monitor.lambda_handler({}, None)
+
+    cw.put_metric_data.assert_not_called()
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert len(records) == 7
+    assert records[2]["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["Scope", "Severity"]]
+    assert records[2]["Scope"] == "Prod"
+
+
+def test_warm_invocation_skips_insight_lookup_and_update(clients):
+    """With a matching filter hash cached, a run only reads insight results."""
+    sh, _ = clients
+    monitor.lambda_handler({}, None)
+    sh.reset_mock()
+
+    monitor.lambda_handler({}, None)
+
+    sh.get_paginator.assert_not_called()
+    sh.update_insight.assert_not_called()
+    sh.create_insight.assert_not_called()
+    # One call per scope plus one for the all-scopes total
+    assert sh.get_insight_results.call_count == 3
+
+
+def test_total_counts_findings_in_overlapping_scopes_once(clients):
+    """The undimensioned total is the distinct count, not the sum over scopes."""
+    sh, cw = clients
+    sh.create_insight.side_effect = lambda Name, **_: {"InsightArn": f"arn:insight/{Name}"}
+    counts = {"arn:insight/prod": 2, "arn:insight/PCI-OpenFindings": 2}
+
+    def _results(InsightArn):  # noqa: N803 - boto3 keyword name
+        # One HIGH finding is tagged both Prod and PCI
+        count = counts.get(InsightArn, 3)
+        values = [{"GroupByAttributeValue": "HIGH", "Count": count}]
+        return {"InsightResults": {"ResultValues": values}}
+
+    sh.get_insight_results.side_effect = _results
+
+    result = monitor.lambda_handler({}, None)
+
+    assert result["open_findings"] == 3
+    assert result["insight"] == "arn:insight/AllScopes-OpenFindings"
+    total_filter = sh.create_insight.call_args_list[-1].kwargs["Filters"]["ResourceTags"]
+    assert [t["Value"] for t in total_filter] == ["Prod", "PCI"]
+    assert cw.put_metric_data.call_args.kwargs["MetricData"][0]["Value"] == 3
+
+
+def test_single_scope_reports_its_insight(clients, monkeypatch):
+    """With one scope the handler returns that scope's insight, as before."""
+    sh, _ = clients
+    monkeypatch.delenv("MONITOR_SCOPES")
+
+    result = monitor.lambda_handler({}, None)
+
+    assert result["insight"] == "arn:insight/prod"
+    assert result["open_findings"] == 7
+    assert sh.get_insight_results.call_count == 1
+
+
+def test_changed_scope_filter_updates_only_that_insight(clients, monkeypatch):
+    """A scope whose definition changed is re-synced; the others stay cached."""
+    sh, _ = clients
+    monitor.lambda_handler({}, None)
+    sh.reset_mock()
+    monkeypatch.setenv(
+        "MONITOR_SCOPES",
+        json.dumps(
+            [
+                {"name": "Prod", "tag_key": "Environment", "tag_value": "Production"},
+                {"name": "PCI", "tag_key": "DataClass", "tag_value": "PCI"},
+            ]
+        ),
+    )
+
+    monitor.lambda_handler({}, None)
+
+    sh.update_insight.assert_called_once()
+    assert sh.update_insight.call_args.kwargs["InsightArn"] == "arn:insight/prod"
+
+
+def test_deleted_insight_is_recreated(clients):
+    """A cached ARN that Security Hub no longer knows about is replaced."""
+    sh, _ = clients
+    monitor.lambda_handler({}, None)
+    sh.reset_mock()
+    ok = sh.get_insight_results.return_value
+
+    def _results(InsightArn):  # noqa: N803 - boto3 keyword name
+        if InsightArn == "arn:insight/prod":
+            raise ClientError(
+                {"Error": {"Code": "ResourceNotFoundException"}}, "GetInsightResults"
+            )
+        return ok
+
+    sh.get_insight_results.side_effect = _results
+    sh.create_insight.return_value = {"InsightArn": "arn:insight/prod-2"}
+
+    result = monitor.lambda_handler({}, None)
+
+    assert result["scopes"][0]["insight"] == "arn:insight/prod-2"
+    assert monitor._insight_cache["Prod-OpenFindings"]["arn"] == "arn:insight/prod-2"
+
+
+def test_insight_cache_survives_cold_start_via_ssm(clients, monkeypatch):
+    """The persisted cache lets a fresh container skip the insights scan."""
+    sh, _ = clients
+    with mock_aws():
+        monkeypatch.setattr(monitor, "ssm", boto3.client("ssm", region_name="us-east-1"))
+        monkeypatch.setattr(monitor, "INSIGHT_CACHE_PARAMETER", "/lab6/insight-cache")
+        monitor.lambda_handler({}, None)
+
+        monkeypatch.setattr(monitor, "_insight_cache", {})
+        monkeypatch.setattr(monitor, "_insight_cache_loaded", False)
+        sh.reset_mock()
+        monitor.lambda_handler({}, None)
+
+    sh.get_paginator.assert_not_called()
+    sh.update_insight.assert_not_called()
+
+
+def _imported_event(*findings):
+    return {
+        "detail-type": "Security Hub Findings - Imported",
+        "detail": {"findings": list(findings)},
+    }
+
+
+def _event_finding(
+    finding_id, updated_at, severity="HIGH", record_state="ACTIVE", tags=None, created_at=None
+):
+    finding = {
+        "Id": finding_id,
+        "UpdatedAt": updated_at,
+        "RecordState": record_state,
+        "Severity": {"Label": severity},
+        "Resources": [{"Id": "i-1", "Tags": tags or {"Environment": "Prod"}}],
+    }
+    if created_at:
+        finding["CreatedAt"] = created_at
+    return finding
+
+
+@pytest.fixture
+def state_table(clients, monkeypatch):
+    """Mocked DynamoDB state table for the event-driven mode."""
+    with mock_aws():
+        client = boto3.client("dynamodb", region_name="us-east-1")
+        client.create_table(
+            TableName="lab6-monitor-state",
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        monkeypatch.setattr(monitor, "ddb", client)
+        monkeypatch.setattr(monitor, "STATE_TABLE", "lab6-monitor-state")
+        yield client
+
+
+def test_findings_events_adjust_scope_counts(clients, state_table):
+    """Events move findings between severities and out of scope without any polling."""
+    sh, cw = clients
+
+    monitor.lambda_handler(_imported_event(_event_finding("f1", "2025-12-01T10:00:00Z")), None)
+    monitor.lambda_handler(_imported_event(_event_finding("f2", "2025-12-01T10:00:00Z")), None)
+    # f1 escalates to CRITICAL; a replay of its older version must be ignored
+    monitor.lambda_handler(
+        _imported_event(_event_finding("f1", "2025-12-01T11:00:00Z", severity="CRITICAL")), None
+    )
+    replay = monitor.lambda_handler(
+        _imported_event(_event_finding("f1", "2025-12-01T10:00:00Z")), None
+    )
+    assert replay["updated_scopes"] == []
+    # f2 is archived
+    result = monitor.lambda_handler(
+        _imported_event(_event_finding("f2", "2025-12-01T12:00:00Z", record_state="ARCHIVED")),
+        None,
+    )
+
+    assert result["open_findings"] == 1
+    prod = monitor._read_scope_counts(monitor._load_scopes())[0]
+    assert prod["by_severity"] == {"CRITICAL": 1}
+    sh.get_insight_results.assert_not_called()
+    assert cw.put_metric_data.call_count == 4
+
+
+def test_scheduled_run_reconciles_event_counts(clients, state_table):
+    """The scheduled full count overwrites whatever the event stream accumulated."""
+    monitor.lambda_handler(_imported_event(_event_finding("f1", "2025-12-01T10:00:00Z")), None)
+
+    monitor.lambda_handler({}, None)
+
+    prod, pci = monitor._read_scope_counts(monitor._load_scopes())
+    assert prod["by_severity"] == {"HIGH": 2, "LOW": 5}
+    assert pci["open_findings"] == 7
+
+
+def test_event_total_counts_overlapping_finding_once(clients, state_table):
+    """A finding in two scopes adds one to each scope but only one to the total."""
+    finding = _event_finding(
+        "f1", "2025-12-01T10:00:00Z", tags={"Environment": "Prod", "DataClass": "PCI"}
+    )
+
+    result = monitor.lambda_handler(_imported_event(finding), None)
+
+    assert result["updated_scopes"] == ["PCI", "Prod"]
+    assert result["open_findings"] == 1
+
+
+def test_event_after_reconcile_does_not_recount_existing_finding(clients, state_table):
+    """Findings the reconcile already counted are not added again by their first event."""
+    monitor.lambda_handler({}, None)
+
+    existing = _event_finding(
+        "old", "2099-01-01T00:00:00Z", created_at="2025-01-01T00:00:00Z"
+    )
+    unchanged = monitor.lambda_handler(_imported_event(existing), None)
+    assert unchanged["updated_scopes"] == []
+
+    new = _event_finding("new", "2099-01-01T00:00:00Z", created_at="2099-01-01T00:00:00Z")
+    result = monitor.lambda_handler(_imported_event(new), None)
+
+    prod = monitor._read_scope_counts(monitor._load_scopes())[0]
+    assert prod["by_severity"] == {"HIGH": 3, "LOW": 5}
+    assert result["open_findings"] == 8
+
+    # The recorded membership now lets a later change of "old" move the counters
+    archived = _event_finding(
+        "old", "2099-01-02T00:00:00Z", record_state="ARCHIVED", created_at="2025-01-01T00:00:00Z"
+    )
+    monitor.lambda_handler(_imported_event(archived), None)
+    prod = monitor._read_scope_counts(monitor._load_scopes())[0]
+    assert prod["by_severity"] == {"HIGH": 2, "LOW": 5}
+
+
+def test_event_during_reconcile_keeps_its_delta(clients, state_table):
+    """A counter an event moves while the insights are queried is not overwritten."""
+    sh, _ = clients
+    monitor.lambda_handler(_imported_event(_event_finding("f1", "2025-12-01T10:00:00Z")), None)
+    results = sh.get_insight_results.return_value
+    arrived = []
+
+    def _insight_results(InsightArn):
+        # The Prod insight query races an event for a new Prod finding
+        if InsightArn == "arn:insight/prod":
+            arrived.append(
+                monitor.lambda_handler(
+                    _imported_event(_event_finding("f2", "2025-12-01T11:00:00Z")), None
+                )
+            )
+        return results
+
+    sh.get_insight_results.side_effect = _insight_results
+    monitor.lambda_handler({}, None)
+
+    assert arrived[0]["updated_scopes"] == ["Prod"]
+    prod, pci = monitor._read_scope_counts(monitor._load_scopes())
+    # Prod and TOTAL keep the event counts; PCI takes the insight snapshot
+    assert prod["by_severity"] == {"HIGH": 2}
+    assert pci["by_severity"] == {"HIGH": 2, "LOW": 5}
+    assert monitor._counts(monitor._read_counts(monitor._load_scopes())[1]) == {"HIGH": 2}
+
+    # With no event in flight the next reconcile overwrites Prod as well
+    monitor.lambda_handler({}, None)
+    prod = monitor._read_scope_counts(monitor._load_scopes())[0]
+    assert prod["by_severity"] == {"HIGH": 2, "LOW": 5}
@@ -0,0 +1,115 @@
+"""Unit tests for the paginated, chunked GuardDuty findings fetch."""
+import importlib.util
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+pytest.importorskip("pandas")
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "scripts" / "guardduty_findings_summary.py"
+
+spec = importlib.util.spec_from_file_location("guardduty_findings_summary", MODULE_PATH)
+assert spec and spec.loader, "Cannot load guardduty_findings_summary.py"
+
+gd_summary = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gd_summary)  # type: ignore
+
+
+def _fake_guardduty(detectors):
+    """Return a client double serving ``{detector_id: [severity, ...]}``."""
+    client = MagicMock()
+
+    def _paginator(name):
+        paginator = MagicMock()
+        if name == "list_detectors":
+            paginator.paginate.return_value = [{"DetectorIds": list(detectors)}]
+        else:
+
+            def _pages(DetectorId, **_kwargs):
+                ids = [f"{DetectorId}-{i}" for i in range(len(detectors[DetectorId]))]
+                return [{"FindingIds": ids[i:i + 50]} for i in range(0, len(ids), 50)]
+
+            paginator.paginate.side_effect = _pages
+        return paginator
+
+    def _get_findings(DetectorId, FindingIds):
+        assert len(FindingIds) <= 50
+        return {
+            "Findings": [
+                {
+                    "Id": fid,
+                    "Type": "Recon:EC2/PortProbeUnprotectedPort",
+                    "Severity": detectors[DetectorId][int(fid.rsplit("-", 1)[1])],
+                    "Title": "t",
+                    "Region": "us-east-1",
+                    "CreatedAt": "2024-01-01T00:00:00Z",
+                }
+                for fid in FindingIds
+            ]
+        }
+
+    client.get_paginator.side_effect = _paginator
+    client.get_findings.side_effect = _get_findings
+    return client
+
+
+def test_severity_band_matches_report_bins():
+    assert [gd_summary.severity_band(s) for s in (1, 3.9, 4, 6.9, 7, 8.9, 9)] == [
+        "Low",
+        "Low",
+        "Medium",
+        "Medium",
+        "High",
+        "High",
+        "Critical",
+    ]
+
+
+def test_collect_counts_every_page_detector_and_region(monkeypatch):
+    clients = {
+        "us-east-1": _fake_guardduty({"d1": [2.0] * 120, "d2": [8.0] * 3}),
+        "eu-west-1": _fake_guardduty({"d3": [5.0] * 51 + [9.0]}),
+    }
+    session = SimpleNamespace(client=lambda service, region_name: clients[region_name])
+    monkeypatch.setattr(gd_summary.boto3.session, "Session", lambda: session)
+
+    counts = gd_summary.collect_severity_counts(list(clients))
+
+    assert counts == {"Low": 120, "High": 3, "Medium": 51, "Critical": 1}
+    # 120 IDs need three get_findings calls, 52 IDs need two
+    assert clients["us-east-1"].get_findings.call_count == 4
+    assert clients["eu-west-1"].get_findings.call_count == 2
+    summary = gd_summary.summarise_findings(counts)
+    assert list(summary["count"]) == [120, 51, 3, 1]
+
+
+def _updated_at_criterion(since):
+    client = MagicMock()
+    client.get_paginator.return_value.paginate.return_value = []
+    list(gd_summary.fetch_findings("d1", gd=client, since=since))
+    criteria = client.get_paginator.return_value.paginate.call_args.kwargs["FindingCriteria"]
+    return criteria["Criterion"]["updatedAt"]["Gte"]
+
+
+def test_lookback_cutoff_is_utc_whatever_the_host_timezone(monkeypatch):
+    if not hasattr(time, "tzset"):
+        pytest.skip("time.tzset is not available on this platform")
+    monkeypatch.setenv("TZ", "America/Los_Angeles")
+    time.tzset()
+    try:
+        before = datetime.now(timezone.utc).timestamp() * 1000 - 86400 * 1000
+        default = _updated_at_criterion(None)
+        naive = _updated_at_criterion(datetime(2024, 1, 1))
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    assert abs(default - before) < 60 * 1000
+    assert naive == int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
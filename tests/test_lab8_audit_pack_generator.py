@@ -0,0 +1,219 @@
+"""Unit tests for the Lab 8 audit pack generator using moto to mock S3."""
+from __future__ import annotations
+
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import boto3
+import pytest
+from moto import mock_aws
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+MODULE_PATH = (
+    Path(__file__).resolve().parents[1]
+    / "labs"
+    / "lab8_audit_pack_generator"
+    / "lab8_audit_pack_generator.py"
+)
+
+spec = importlib.util.spec_from_file_location("lab8_audit_pack_generator", MODULE_PATH)
+assert spec and spec.loader, "Cannot load lab8_audit_pack_generator.py"
+
+lab8 = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(lab8)  # type: ignore
+
+BUCKET = "lab8-evidence-bucket"
+
+
+@pytest.fixture
+def evidence_bucket(monkeypatch):
+    """Create a mocked evidence bucket with a few objects and point lab8 at it."""
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        for i in range(12):
+            client.put_object(
+                Bucket=BUCKET, Key=f"ec2-inventory/report-{i}.json", Body=os.urandom(600_000)
+            )
+        monkeypatch.setattr(lab8, "s3", client)
+        monkeypatch.setenv("EVIDENCE_BUCKET", BUCKET)
+        monkeypatch.setenv(
+            "SOURCE_DEFINITIONS",
+            json.dumps(
+                [{"prefix": "ec2-inventory/", "description": "Lab 2", "iso_control": "A.8.1.1"}]
+            ),
+        )
+        # Force every prefetched object onto disk to exercise the spill path.
+        monkeypatch.setenv("OBJECT_SPOOL_MB", "0")
+        yield client
+
+
+def _read_pack(client, response):
+    key = response["body"]["s3_object"].split("/", 3)[3]
+    data = client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+    return zipfile.ZipFile(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("spool_to_tmp", ["false", "true"])
+def test_audit_pack_streams_all_evidence(evidence_bucket, monkeypatch, spool_to_tmp):
+    """Multipart streaming and /tmp spooling should both produce a valid, complete ZIP."""
+    monkeypatch.setenv("SPOOL_TO_TMP", spool_to_tmp)
+
+    response = lab8.lambda_handler({}, None)
+
+    assert response["body"]["file_count"] == 12
+    with _read_pack(evidence_bucket, response) as zf:
+        assert zf.testzip() is None
+        names = zf.namelist()
+        assert "README_AUDIT_PACK.txt" in names
+        assert "evidence/ec2-inventory/report-0.json" in names
+        readme = zf.read("README_AUDIT_PACK.txt").decode("utf-8")
+        assert "ISO 27001: A.8.1.1" in readme
+
+
+def test_entries_are_written_in_submission_order(evidence_bucket, monkeypatch):
+    """Entries follow the object order even when later downloads finish first."""
+    fetch = lab8._fetch_object
+
+    def _slow_first(bucket, key, spool_bytes):
+        if key.endswith("report-0.json"):
+            time.sleep(0.2)
+        return fetch(bucket, key, spool_bytes)
+
+    monkeypatch.setattr(lab8, "_fetch_object", _slow_first)
+    objects = [{"key": f"ec2-inventory/report-{i}.json"} for i in (0, 5, 1, 11, 3)]
+    output = io.BytesIO()
+
+    lab8.build_audit_zip(
+        BUCKET, [], objects, datetime.now(timezone.utc), datetime.now(timezone.utc), output,
+        prefetch_depth=3,
+    )
+
+    with zipfile.ZipFile(output) as zf:
+        assert [n for n in zf.namelist() if n.startswith("evidence/")] == [
+            f"evidence/{obj['key']}" for obj in objects
+        ]
+
+
+def test_failed_write_closes_prefetched_spools(evidence_bucket, monkeypatch):
+    """Spool files still in the window are closed when writing an entry fails."""
+    spools = []
+
+    def _fetch(bucket, key, spool_bytes):
+        spool = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+        spool.write(b"evidence")
+        spool.seek(0)
+        spools.append(spool)
+        return spool
+
+    def _copy(src, dest, length=0):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(lab8, "_fetch_object", _fetch)
+    monkeypatch.setattr(lab8.shutil, "copyfileobj", _copy)
+    objects = [{"key": f"ec2-inventory/report-{i}.json"} for i in range(6)]
+
+    with pytest.raises(OSError):
+        lab8.build_audit_zip(
+            BUCKET, [], objects, datetime.now(timezone.utc), datetime.now(timezone.utc),
+            io.BytesIO(), prefetch_depth=4,
+        )
+
+    assert spools and all(spool.closed for spool in spools)
+
+
+def test_incremental_pack_only_contains_new_evidence(evidence_bucket, monkeypatch):
+    """A second incremental run should reference unchanged evidence instead of repacking it."""
+    monkeypatch.setenv("INCREMENTAL", "true")
+
+    first = lab8.lambda_handler({}, None)
+    assert first["body"]["file_count"] == 12
+    assert first["body"]["reused_count"] == 0
+
+    evidence_bucket.put_object(
+        Bucket=BUCKET, Key="ec2-inventory/report-new.json", Body=b"{}"
+    )
+    evidence_bucket.put_object(
+        Bucket=BUCKET, Key="ec2-inventory/report-3.json", Body=b"changed"
+    )
+    # Keep the second pack from overwriting the first one within the same second.
+    monkeypatch.setattr(lab8, "build_s3_key", lambda prefix, ts: f"{prefix}second.zip")
+
+    second = lab8.lambda_handler({}, None)
+    assert second["body"]["file_count"] == 2
+    assert second["body"]["reused_count"] == 11
+
+    with _read_pack(evidence_bucket, second) as zf:
+        evidence = sorted(n for n in zf.namelist() if n.startswith("evidence/"))
+        assert evidence == [
+            "evidence/ec2-inventory/report-3.json",
+            "evidence/ec2-inventory/report-new.json",
+        ]
+        readme = zf.read("README_AUDIT_PACK.txt").decode("utf-8")
+        assert first["body"]["s3_object"] in readme
+
+    manifest = json.loads(
+        evidence_bucket.get_object(
+            Bucket=BUCKET, Key="audit-packs/audit-pack-manifest.json"
+        )["Body"].read()
+    )
+    assert manifest["entries"]["ec2-inventory/report-3.json"]["pack"] == "audit-packs/second.zip"
+    assert manifest["entries"]["ec2-inventory/report-0.json"]["pack"] != "audit-packs/second.zip"
+
+
+def test_plan_source_prefixes_for_partitioned_and_flat_sources():
+    """Partitioned sources list one sub-prefix per day; flat sources list the whole prefix."""
+    start = datetime(2025, 11, 29, 12, 0, tzinfo=timezone.utc)
+    end = datetime(2025, 12, 2, 6, 0, tzinfo=timezone.utc)
+
+    daily = lab8.plan_source_prefixes(
+        {"prefix": "cloudtrail/", "partition_format": "%Y/%m/%d/"}, start, end
+    )
+    assert daily == [
+        "cloudtrail/2025/11/29/",
+        "cloudtrail/2025/11/30/",
+        "cloudtrail/2025/12/01/",
+        "cloudtrail/2025/12/02/",
+    ]
+
+    monthly = lab8.plan_source_prefixes(
+        {"prefix": "ec2-inventory/ec2-inventory-", "partition_format": "%Y%m"}, start, end
+    )
+    assert monthly == ["ec2-inventory/ec2-inventory-202511", "ec2-inventory/ec2-inventory-202512"]
+
+    assert lab8.plan_source_prefixes({"prefix": "mfa-evidence/"}, start, end) == ["mfa-evidence/"]
+    assert lab8.plan_source_prefixes({"description": "no prefix"}, start, end) == []
+
+
+def test_plan_source_prefixes_steps_hourly_and_rejects_finer_formats():
+    """Hourly partitions list every hour in the window; minute partitions are refused."""
+    start = datetime(2025, 11, 29, 22, 30, tzinfo=timezone.utc)
+    end = datetime(2025, 11, 30, 1, 15, tzinfo=timezone.utc)
+
+    hourly = lab8.plan_source_prefixes(
+        {"prefix": "vpc-flow/", "partition_format": "%Y/%m/%d/%H/"}, start, end
+    )
+    assert hourly == [
+        "vpc-flow/2025/11/29/22/",
+        "vpc-flow/2025/11/29/23/",
+        "vpc-flow/2025/11/30/00/",
+        "vpc-flow/2025/11/30/01/",
+    ]
+
+    literal = lab8.plan_source_prefixes(
+        {"prefix": "reports/", "partition_format": "%Y-%m-%d-100%%M"}, start, end
+    )
+    assert literal == ["reports/2025-11-29-100%M", "reports/2025-11-30-100%M"]
+
+    with pytest.raises(ValueError, match="finer than an hour"):
+        lab8.plan_source_prefixes(
+            {"prefix": "vpc-flow/", "partition_format": "%Y/%m/%d/%H/%M/"}, start, end
+        )
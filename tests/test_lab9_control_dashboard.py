@@ -0,0 +1,164 @@
+"""Unit tests for the Lab 9 control dashboard using moto to mock S3."""
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+MODULE_PATH = (
+    Path(__file__).resolve().parents[1]
+    / "labs"
+    / "lab9_control_dashboard"
+    / "lab9_control_dashboard.py"
+)
+
+spec = importlib.util.spec_from_file_location("lab9_control_dashboard", MODULE_PATH)
+assert spec and spec.loader, "Cannot load lab9_control_dashboard.py"
+
+lab9 = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(lab9)  # type: ignore
+
+BUCKET = "lab9-evidence-bucket"
+INDEX_KEY = "dashboard/evidence-freshness.json"
+
+
+@pytest.fixture
+def evidence_bucket(monkeypatch):
+    """Create a mocked evidence bucket and point lab9 at it."""
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(lab9, "s3", client)
+        monkeypatch.setenv("EVIDENCE_BUCKET", BUCKET)
+        monkeypatch.setenv(
+            "CONTROLS_DEFINITION",
+            json.dumps(
+                [
+                    {"id": "ec2_inventory", "evidence_prefix": "ec2-inventory/"},
+                    {"id": "mfa_enforcement", "evidence_prefix": "mfa-evidence/"},
+                ]
+            ),
+        )
+        yield client
+
+
+def _s3_event(key: str, event_time: str):
+    return {
+        "Records": [
+            {
+                "eventName": "ObjectCreated:Put",
+                "eventTime": event_time,
+                "s3": {"bucket": {"name": BUCKET}, "object": {"key": key}},
+            }
+        ]
+    }
+
+
+def test_freshness_handler_keeps_newest_timestamp_per_prefix(evidence_bucket):
+    """S3 events should only move a prefix's timestamp forward."""
+    lab9.freshness_index_handler(_s3_event("ec2-inventory/a.csv", "2025-11-29T10:00:00.000Z"), None)
+    lab9.freshness_index_handler(_s3_event("ec2-inventory/b.csv", "2025-11-28T10:00:00.000Z"), None)
+    result = lab9.freshness_index_handler(
+        _s3_event("unrelated/c.csv", "2025-11-30T10:00:00.000Z"), None
+    )
+    assert result["body"]["updated_prefixes"] == []
+
+    entries, etag = lab9.load_freshness_index(BUCKET, INDEX_KEY)
+    assert etag
+    assert entries == {"ec2-inventory/": datetime(2025, 11, 29, 10, tzinfo=timezone.utc)}
+
+
+def test_dashboard_reads_index_and_backfills_missing_prefixes(evidence_bucket, monkeypatch):
+    """Indexed prefixes are not listed; unindexed ones are scanned once and backfilled."""
+    monkeypatch.setenv("FRESHNESS_INDEX", "true")
+    monkeypatch.setattr(
+        lab9, "summarize_security_hub", lambda: {"total_active_findings": 0, "by_severity": {}}
+    )
+    evidence_bucket.put_object(Bucket=BUCKET, Key="mfa-evidence/report.json", Body=b"{}")
+    indexed_at = datetime.now(timezone.utc).replace(microsecond=0)
+    lab9.update_freshness_index(BUCKET, INDEX_KEY, {"ec2-inventory/": indexed_at})
+
+    scanned = []
+    real_find_latest_object = lab9.find_latest_object
+
+    def _tracking_find_latest_object(bucket, prefix):
+        scanned.append(prefix)
+        return real_find_latest_object(bucket, prefix)
+
+    monkeypatch.setattr(lab9, "find_latest_object", _tracking_find_latest_object)
+
+    lab9.lambda_handler({}, None)
+    assert scanned == ["mfa-evidence/"]
+
+    payload = json.loads(
+        evidence_bucket.get_object(Bucket=BUCKET, Key="dashboard/control-dashboard.json")[
+            "Body"
+        ].read()
+    )
+    statuses = {c["id"]: c["status"] for c in payload["controls"]}
+    assert statuses == {"ec2_inventory": "OK", "mfa_enforcement": "OK"}
+
+    entries, _ = lab9.load_freshness_index(BUCKET, INDEX_KEY)
+    assert set(entries) == {"ec2-inventory/", "mfa-evidence/"}
+
+
+def test_security_hub_summary_uses_severity_insight(monkeypatch):
+    """Totals should come from the SeverityLabel insight in a single results call."""
+    sh = MagicMock()
+    sh.get_paginator.return_value.paginate.return_value = [
+        {"Insights": [{"Name": "Lab9-ActiveFindingsBySeverity", "InsightArn": "arn:insight"}]}
+    ]
+    sh.get_insight_results.return_value = {
+        "InsightResults": {
+            "GroupByAttribute": "SeverityLabel",
+            "ResultValues": [
+                {"GroupByAttributeValue": "CRITICAL", "Count": 3},
+                {"GroupByAttributeValue": "LOW", "Count": 1200},
+            ],
+        }
+    }
+    monkeypatch.setattr(lab9, "securityhub", sh)
+    monkeypatch.setattr(lab9, "_severity_insight_arn", None)
+
+    summary = lab9.summarize_security_hub()
+
+    assert summary["total_active_findings"] == 1203
+    assert summary["by_severity"] == {"CRITICAL": 3, "LOW": 1200}
+    sh.get_insight_results.assert_called_once_with(InsightArn="arn:insight")
+    sh.get_findings.assert_not_called()
+
+
+def test_security_hub_summary_falls_back_to_paginated_counts(monkeypatch):
+    """Without insight access every page of every severity should be counted."""
+    sh = MagicMock()
+    sh.get_insight_results.side_effect = ClientError(
+        {"Error": {"Code": "AccessDeniedException", "Message": "denied"}}, "GetInsightResults"
+    )
+
+    def _paginate(Filters, PaginationConfig):  # noqa: N803 - boto3 keyword names
+        label = Filters["SeverityLabel"][0]["Value"]
+        if label == "HIGH":
+            return [{"Findings": [{}] * 100}, {"Findings": [{}] * 100}, {"Findings": [{}] * 7}]
+        return [{"Findings": []}]
+
+    sh.get_paginator.return_value.paginate.side_effect = _paginate
+    monkeypatch.setattr(lab9, "securityhub", sh)
+    monkeypatch.setattr(lab9, "_severity_insight_arn", "arn:insight")
+
+    summary = lab9.summarize_security_hub()
+
+    assert summary == {
+        "total_active_findings": 207,
+        "by_severity": {"HIGH": 207},
+        "source": "paginated",
+    }
@@ -0,0 +1,178 @@
+"""Unit tests for the Security Hub Excel exporter using moto to mock S3."""
+from __future__ import annotations
+
+import datetime
+import importlib.util
+import io
+import os
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from moto import mock_aws
+from openpyxl import load_workbook
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("REPORT_BUCKET", "securityhub-report-bucket")
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "securityhub_excel" / "src" / "app.py"
+
+spec = importlib.util.spec_from_file_location("securityhub_excel_app", MODULE_PATH)
+assert spec and spec.loader, "Cannot load securityhub_excel/src/app.py"
+
+app = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(app)  # type: ignore
+
+
+def _finding(i: int, severity: str = "HIGH") -> dict:
+    """Return a minimal ASFF finding as returned by GetFindings."""
+    return {
+        "Id": f"finding-{i}",
+        "Title": f"Finding {i}",
+        "Severity": {"Label": severity},
+        "Compliance": {
+            "RelatedRequirements": ["NIST.800-53.r5 AC-3"],
+            "SecurityControlId": "S3.8",
+        },
+        "FirstObservedAt": "2025-11-29T10:00:00Z",
+        "Resources": [{"Id": f"arn:aws:s3:::bucket-{i}", "Type": "AwsS3Bucket"}],
+        "AwsAccountId": "123456789012",
+        "Region": "us-east-1",
+    }
+
+
+@pytest.fixture
+def report_bucket(monkeypatch):
+    """Mock S3 and Security Hub (two pages of findings) for the exporter."""
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=app.BUCKET)
+        monkeypatch.setattr(app, "S3", client)
+
+        securityhub = MagicMock()
+        securityhub.get_paginator.return_value.paginate.return_value = [
+            {"Findings": [_finding(i) for i in range(100)]},
+            {"Findings": [_finding(i, "LOW") for i in range(100, 150)]},
+        ]
+        monkeypatch.setattr(app, "SECURITY_HUB", securityhub)
+        yield client
+
+
+def _load_report(client, key):
+    data = client.get_object(Bucket=app.BUCKET, Key=key)["Body"].read()
+    return load_workbook(io.BytesIO(data))
+
+
+def test_handler_streams_all_findings_into_workbook(report_bucket):
+    """Every finding from every page should land in the Findings sheet with a bold header."""
+    result = app.handler({}, None)
+
+    assert result["count"] == 150
+    ws = _load_report(report_bucket, result["key"])["Findings"]
+    assert ws.max_row == 151
+    assert ws["A1"].value == "Id"
+    assert ws["A1"].font.b
+    assert ws["C151"].value == "LOW"
+
+
+def test_get_active_findings_yields_compact_rows(report_bucket):
+    """The findings source should be lazy and yield only the exported columns."""
+    rows = app._get_active_findings()
+    first = next(rows)
+
+    assert first[: len(app.HEADERS)] == (
+        "finding-0",
+        "Finding 0",
+        "HIGH",
+        "NIST.800-53.r5 AC-3",
+        "2025-11-29",
+        "arn:aws:s3:::bucket-0",
+    )
+    assert (first.control, first.resource_type, first.account_id) == (
+        "S3.8",
+        "AwsS3Bucket",
+        "123456789012",
+    )
+    assert sum(1 for _ in rows) == 149
+
+
+def test_to_row_tolerates_sparse_findings():
+    """Missing optional ASFF sections should produce empty cells, not errors."""
+    sparse = {"Id": "x", "Title": "t", "Severity": {"Label": "LOW"}, "Resources": []}
+    sparse["Compliance"] = {"RelatedRequirements": []}
+
+    assert app._to_row(sparse) == ("x", "t", "LOW", "", "", "", "", "", "", "")
+
+
+def test_summary_sheets_pivot_severity_in_the_same_pass():
+    """Summary sheets should hold per-severity counts with totals next to the detail sheet."""
+    rows = [app._to_row(_finding(i)) for i in range(3)]
+    rows.append(app._to_row({**_finding(3, "CRITICAL"), "FirstObservedAt": "2025-06-01T00:00:00Z"}))
+
+    wb, count = app._build_workbook(iter(rows), today=datetime.date(2025, 12, 1))
+    buf = io.BytesIO()
+    wb.save(buf)
+    report = load_workbook(buf)
+
+    assert count == 4
+    assert report.sheetnames == [
+        "Findings",
+        "By Control",
+        "By Resource Type",
+        "By Account",
+        "By Region",
+        "By Age",
+    ]
+    by_control = [[c.value for c in r] for r in report["By Control"].iter_rows()]
+    assert by_control == [["Control", "CRITICAL", "HIGH", "Total"], ["S3.8", 1, 3, 4]]
+    by_age = [[c.value for c in r] for r in report["By Age"].iter_rows()]
+    assert by_age[1:] == [["0-7 days", 0, 3, 3], [">90 days", 1, 0, 1]]
+    assert report["By Account"]["A1"].font.b
+
+
+def test_multi_region_findings_are_merged_and_deduplicated(monkeypatch):
+    """Findings returned by both an aggregator and its linked region appear once."""
+    pages = {
+        "us-east-1": [{"Findings": [_finding(i) for i in range(5)]}],
+        "eu-west-1": [{"Findings": [_finding(i) for i in range(3, 8)]}],
+    }
+
+    def _client(service, region_name):
+        client = MagicMock()
+        client.get_paginator.return_value.paginate.return_value = pages[region_name]
+        return client
+
+    monkeypatch.setattr(app.boto3.session, "Session", lambda: SimpleNamespace(client=_client))
+
+    rows = list(app._get_multi_region_findings(["us-east-1", "eu-west-1"]))
+
+    assert sorted(r.id for r in rows) == [f"finding-{i}" for i in range(8)]
+
+
+def test_failed_regions_are_skipped_and_reported(monkeypatch):
+    """A region whose Security Hub API fails is recorded; other errors propagate."""
+    def _client(service, region_name):
+        client = MagicMock()
+        paginate = client.get_paginator.return_value.paginate
+        if region_name == "ap-south-2":
+            paginate.side_effect = app.ClientError(
+                {"Error": {"Code": "InvalidAccessException"}}, "GetFindings"
+            )
+        elif region_name == "eu-north-1":
+            paginate.side_effect = KeyError("Id")
+        else:
+            paginate.return_value = [{"Findings": [_finding(1)]}]
+        return client
+
+    monkeypatch.setattr(app.boto3.session, "Session", lambda: SimpleNamespace(client=_client))
+
+    skipped = []
+    rows = list(app._get_multi_region_findings(["us-east-1", "ap-south-2"], skipped))
+    assert [r.id for r in rows] == ["finding-1"]
+    assert skipped == ["ap-south-2"]
+
+    with pytest.raises(KeyError):
+        list(app._get_multi_region_findings(["us-east-1", "eu-north-1"]))
+    assert list(app._get_multi_region_findings([])) == []
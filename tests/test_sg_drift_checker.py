@@ -0,0 +1,221 @@
+"""Unit tests for the Lab 5 security group drift checker."""
+from __future__ import annotations
+
+import importlib.util
+import json
+import os
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+MODULE_PATH = (
+    Path(__file__).resolve().parents[1]
+    / "labs"
+    / "lab5_sg_drift_detection"
+    / "sg_drift_checker.py"
+)
+
+spec = importlib.util.spec_from_file_location("sg_drift_checker", MODULE_PATH)
+assert spec and spec.loader, "Cannot load sg_drift_checker.py"
+
+checker = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(checker)  # type: ignore
+
+TOPIC = "arn:aws:sns:us-east-1:123456789012:sg-drift"
+
+
+@pytest.fixture(autouse=True)
+def _reset_alert_state(monkeypatch):
+    monkeypatch.setattr(checker, "_recent_alerts", {})
+    monkeypatch.setattr(checker, "_last_flush_window", -1)
+    monkeypatch.setattr(checker, "ALERT_STATE_TABLE", "")
+    monkeypatch.setattr(checker, "SNS_TOPIC_ARN", TOPIC)
+    sns = MagicMock()
+    monkeypatch.setattr(checker, "sns", sns)
+    return sns
+
+
+def _config_event(sg_id, ports):
+    invoking = {
+        "awsAccountId": "123456789012",
+        "awsRegion": "us-east-1",
+        "configurationItem": {
+            "resourceType": "AWS::EC2::SecurityGroup",
+            "resourceId": sg_id,
+            "configuration": {
+                "ipPermissions": [_perm(p, p, ipv4=["0.0.0.0/0"]) for p in ports]
+            },
+        },
+    }
+    return {"invokingEvent": json.dumps(invoking)}
+
+
+def _perm(from_port, to_port, protocol="tcp", ipv4=None, ipv6=None):
+    perm = {
+        "IpProtocol": protocol,
+        "IpRanges": [{"CidrIp": c} for c in ipv4 or []],
+        "Ipv6Ranges": [{"CidrIpv6": c} for c in ipv6 or []],
+    }
+    if from_port is not None:
+        perm["FromPort"] = from_port
+        perm["ToPort"] = to_port
+    return perm
+
+
+def test_detect_drift_matches_port_intervals():
+    config = {
+        "ipPermissions": [
+            _perm(0, 65535, ipv4=["0.0.0.0/0"]),
+            _perm(80, 443, ipv4=["0.0.0.0/0"]),
+            _perm(3389, 3389, ipv4=["10.0.0.0/8"]),
+        ]
+    }
+    assert checker.detect_drift(config) == [22, 3389]
+    assert checker.detect_drift({"ipPermissions": [config["ipPermissions"][1]]}) == []
+
+
+def test_detect_drift_handles_ipv6_and_all_traffic():
+    assert checker.detect_drift({"IpPermissions": [_perm(22, 22, ipv6=["::/0"])]}) == [22]
+    all_traffic = _perm(None, None, protocol="-1", ipv4=["0.0.0.0/0"])
+    assert checker.detect_drift({"ipPermissions": [all_traffic]}) == [22, 3389]
+    # ICMP type/code must not be mistaken for a port range
+    icmp = _perm(-1, -1, protocol="icmp", ipv4=["0.0.0.0/0"])
+    assert checker.detect_drift({"ipPermissions": [icmp]}) == []
+
+
+def test_bulk_sweep_publishes_one_summary(_reset_alert_state):
+    with mock_aws():
+        regions = ["us-east-1", "eu-west-1"]
+        for region in regions:
+            ec2 = boto3.client("ec2", region_name=region)
+            group_id = ec2.create_security_group(
+                GroupName="open-ssh", Description="test"
+            )["GroupId"]
+            ec2.authorize_security_group_ingress(
+                GroupId=group_id,
+                IpPermissions=[
+                    {
+                        "IpProtocol": "tcp",
+                        "FromPort": 20,
+                        "ToPort": 25,
+                        "Ipv6Ranges": [{"CidrIpv6": "::/0"}],
+                    }
+                ],
+            )
+        sns = _reset_alert_state
+
+        result = checker.lambda_handler({"mode": "bulk", "regions": regions}, None)
+        # A second sweep finds the same problems and stays quiet
+        again = checker.lambda_handler({"mode": "bulk", "regions": regions}, None)
+
+    assert result["status"] == "bulk_scan"
+    assert sorted(d["region"] for d in result["drifted"]) == sorted(regions)
+    assert all(d["ports"] == [22] for d in result["drifted"])
+    assert result["scanned"] >= 2
+    sns.publish.assert_called_once()
+    assert "2 of" in sns.publish.call_args.kwargs["Message"]
+    assert again["new_alerts"] == 0
+
+
+def test_repeated_alerts_are_suppressed_without_table(_reset_alert_state):
+    statuses = [
+        checker.lambda_handler(_config_event("sg-1", [22]), None)["status"]
+        for _ in range(3)
+    ]
+    assert statuses == ["alert_published", "alert_suppressed", "alert_suppressed"]
+    # A different port set is a different problem
+    assert checker.lambda_handler(_config_event("sg-1", [22, 3389]), None)["status"] == (
+        "alert_published"
+    )
+    assert _reset_alert_state.publish.call_count == 2
+
+
+def test_burst_is_coalesced_into_one_digest(monkeypatch, _reset_alert_state):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(checker, "time", SimpleNamespace(time=lambda: clock[0]))
+    monkeypatch.setattr(checker, "DIGEST_WINDOW", 300)
+    with mock_aws():
+        ddb = boto3.client("dynamodb", region_name="us-east-1")
+        ddb.create_table(
+            TableName="sg-alerts",
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        monkeypatch.setattr(checker, "ddb", ddb)
+        monkeypatch.setattr(checker, "ALERT_STATE_TABLE", "sg-alerts")
+
+        statuses = [
+            checker.lambda_handler(_config_event(f"sg-{i % 3}", [22]), None)["status"]
+            for i in range(30)
+        ]
+        assert statuses.count("alert_queued") == 3
+        assert checker.lambda_handler({"mode": "flush"}, None) == {
+            "status": "digest_flushed",
+            "alerts": 0,
+        }
+
+        clock[0] += 300
+        assert checker.lambda_handler({"mode": "flush"}, None)["alerts"] == 3
+        # The window was claimed, so a second flush publishes nothing
+        assert checker.lambda_handler({"mode": "flush"}, None)["alerts"] == 0
+
+        # Past the dedup TTL the same problem alerts again
+        clock[0] += checker.ALERT_DEDUP_TTL
+        assert checker.lambda_handler(_config_event("sg-0", [22]), None)["status"] == (
+            "alert_queued"
+        )
+
+    _reset_alert_state.publish.assert_called_once()
+    message = _reset_alert_state.publish.call_args.kwargs["Message"]
+    assert message.startswith("3 security groups")
+
+
+@pytest.fixture
+def _alert_table(monkeypatch):
+    clock = [1_000_000.0]
+    monkeypatch.setattr(checker, "time", SimpleNamespace(time=lambda: clock[0]))
+    monkeypatch.setattr(checker, "DIGEST_WINDOW", 300)
+    with mock_aws():
+        ddb = boto3.client("dynamodb", region_name="us-east-1")
+        ddb.create_table(
+            TableName="sg-alerts",
+            KeySchema=[{"AttributeName": "pk", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "pk", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        monkeypatch.setattr(checker, "ddb", ddb)
+        monkeypatch.setattr(checker, "ALERT_STATE_TABLE", "sg-alerts")
+        yield clock
+
+
+def test_next_window_event_flushes_closed_windows(_alert_table, _reset_alert_state):
+    for i in range(3):
+        checker.lambda_handler(_config_event(f"sg-{i}", [22]), None)
+    _reset_alert_state.publish.assert_not_called()
+
+    _alert_table[0] += 300
+    result = checker.lambda_handler(_config_event("sg-9", [3389]), None)
+
+    assert result["status"] == "alert_queued"
+    _reset_alert_state.publish.assert_called_once()
+    assert _reset_alert_state.publish.call_args.kwargs["Message"].startswith("3 security")
+    # Another container in the same window does not flush again
+    checker._last_flush_window = -1
+    checker.lambda_handler(_config_event("sg-8", [3389]), None)
+    assert _reset_alert_state.publish.call_count == 1
+
+
+def test_flush_reaches_back_over_the_dedup_ttl(monkeypatch, _alert_table, _reset_alert_state):
+    monkeypatch.setattr(checker, "DIGEST_WINDOW", 60)
+    checker.lambda_handler(_config_event("sg-1", [22]), None)
+
+    # 50 windows later, well past the 12-window minimum, the claim is still live
+    _alert_table[0] += 50 * 60
+    assert checker.lambda_handler({"mode": "flush"}, None)["alerts"] == 1